@@ -1,33 +1,50 @@
 import streamlit as st
-from database import DatabaseManager
+from storage import open_storage
 from ui_processor import render_processor
 from ui_dashboard import render_dashboard
 from ui_history import render_history_manager
+from ui_perf import get_trace_buffer, render_perf_panel
 
 # Configuração Principal
 st.set_page_config(page_title="Divisor de Contas", layout="wide", page_icon="💰")
 
+
+@st.cache_resource
+def get_db_manager():
+    # Um único backend por processo: o pool de conexões e o CREATE TABLE
+    # não se repetem a cada clique/rerun. O DATABASE_URL escolhe o backend
+    # (postgresql://, sqlite:/// ou duckdb:///, ver storage.py)
+    return open_storage()
+
+
 def main():
     st.title("💰 Finanças: Kristian & Giulia")
-    
-    # Cria as abas principais
-    tab_proc, tab_dash, tab_hist = st.tabs(["📝 Processar Nota", "📊 Dashboard Financeiro", "🗂️ Histórico"])
-    
-    # Inicia o Banco de Dados (uma única vez)
-    db_manager = DatabaseManager()
+    mostrar_painel = st.sidebar.toggle("🐞 Painel de desempenho", key="perf_panel")
+
+    # Tempos deste rerun (parser, consultas, telas) vão para o buffer da sessão
+    trace_buffer = get_trace_buffer()
+    trace_buffer.begin_rerun()
+    try:
+        # Cria as abas principais
+        tab_proc, tab_dash, tab_hist = st.tabs(["📝 Processar Nota", "📊 Dashboard Financeiro", "🗂️ Histórico"])
+
+        # Inicia o Banco de Dados (uma única vez por processo)
+        db_manager = get_db_manager()
 
-    # Cada aba chama sua função específica em outro arquivo
-    with tab_proc:
-        render_processor(db_manager)
+        # Cada aba chama sua função específica em outro arquivo
+        with tab_proc:
+            render_processor(db_manager)
 
-    with tab_dash:
-        render_dashboard(db_manager)
+        with tab_dash:
+            render_dashboard(db_manager)
 
-    with tab_hist:
-        render_history_manager(db_manager)
+        with tab_hist:
+            render_history_manager(db_manager)
+    finally:
+        trace_buffer.end_rerun()
 
-    # Fecha conexão
-    db_manager.close()
+    if mostrar_painel:
+        render_perf_panel(trace_buffer)
 
 if __name__ == "__main__":
 
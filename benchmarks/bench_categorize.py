@@ -0,0 +1,95 @@
+"""
+Comparação: loop categoria -> palavra-chave x autômato (Aho-Corasick).
+
+Uso (na raiz do projeto):
+    python -m benchmarks.bench_categorize --palavras 3000 --itens 5000
+
+Parte das categorias padrão do ExpenseManager e acrescenta palavras-chave
+sintéticas até o total pedido. Confere que as duas estratégias dão a mesma
+categoria para todos os itens e mede itens/segundo.
+"""
+import argparse
+import random
+import string
+import time
+
+from core import ExpenseManager, ExpenseManagerConfig
+
+
+def legacy_categorize(categories, item_name):
+    # Implementação original (congelada, apenas como referência)
+    if not item_name:
+        return "Geral"
+    item_upper = item_name.upper()
+    for category, keywords in categories.items():
+        for keyword in keywords:
+            if keyword in item_upper:
+                return category
+    return "Geral"
+
+
+def gerar_categorias(n_palavras, rng):
+    categories = {cat: list(kws) for cat, kws in ExpenseManager().config.categories.items()}
+    nomes = list(categories) + [f"Extra {i}" for i in range(20)]
+    for nome in nomes:
+        categories.setdefault(nome, [])
+    atual = sum(len(k) for k in categories.values())
+    while atual < n_palavras:
+        palavra = "".join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(5, 10)))
+        categories[rng.choice(nomes)].append(palavra)
+        atual += 1
+    return categories
+
+
+def gerar_itens(categories, n_itens, rng):
+    todas = [k for kws in categories.values() for k in kws]
+    itens = []
+    for _ in range(n_itens):
+        partes = ["".join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(3, 8)))
+                  for _ in range(rng.randint(2, 4))]
+        if rng.random() < 0.6:
+            partes.insert(rng.randint(0, len(partes)), rng.choice(todas))
+        partes.append(f"{rng.randint(1, 999)}G")
+        itens.append(" ".join(partes))
+    return itens
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--palavras", type=int, default=3000)
+    ap.add_argument("--itens", type=int, default=5000)
+    args = ap.parse_args()
+
+    rng = random.Random(42)
+    categories = gerar_categorias(args.palavras, rng)
+    itens = gerar_itens(categories, args.itens, rng)
+
+    inicio = time.perf_counter()
+    manager = ExpenseManager(ExpenseManagerConfig(categories=categories))
+    t_build = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    esperado = [legacy_categorize(categories, nome) for nome in itens]
+    t_legacy = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    obtido = [manager.categorize_item(nome) for nome in itens]
+    t_auto = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    em_lote = manager.categorize_many(itens)
+    t_lote = time.perf_counter() - inicio
+
+    if esperado != obtido or esperado != em_lote:
+        raise SystemExit("Categorias divergentes entre o loop original e o autômato!")
+
+    n_palavras = sum(len(k) for k in categories.values())
+    print(f"{n_palavras} palavras-chave, {len(itens)} itens (resultados idênticos)")
+    print(f"Montagem do autômato: {t_build * 1000:.1f} ms (uma vez por config)")
+    print(f"Loop original:   {len(itens) / t_legacy:12,.0f} itens/s")
+    print(f"Autômato:        {len(itens) / t_auto:12,.0f} itens/s  ({t_legacy / t_auto:.1f}x)")
+    print(f"categorize_many: {len(itens) / t_lote:12,.0f} itens/s  ({t_legacy / t_lote:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
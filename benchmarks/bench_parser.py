@@ -0,0 +1,235 @@
+"""
+Comparação de vazão: InvoiceLineEngine x loop original do InvoiceParser.
+
+Uso (na raiz do projeto):
+    python -m benchmarks.bench_parser --notas 2000
+
+Gera um corpus de textos de cupom (mesmo formato que o pdfplumber devolve
+com layout=True), confere que os dois caminhos produzem exatamente o mesmo
+`data` (fora a chave de acesso, que só o motor novo guarda e é conferida
+contra a gerada) e mede linhas/segundo de cada um. Não abre PDFs: só o custo do
+texto -> dict entra na conta.
+"""
+import argparse
+import random
+import re
+import time
+
+from benchmarks.synthetic import chave_acesso
+from parser import InvoiceParser
+
+
+# ===============================================================
+# IMPLEMENTAÇÃO ORIGINAL (congelada, apenas como referência)
+# ===============================================================
+def legacy_parse_lines(lines):
+    data = {
+        "loja": None,
+        "data": None,
+        "cpf_consumidor": None,
+        "forma_pagamento": "Indefinido",
+        "total_nota": 0.0,
+        "itens": [],
+    }
+
+    def conv(value_str):
+        if not value_str: return 0.0
+        try:
+            return float(value_str.replace('.', '').replace(',', '.'))
+        except:
+            return 0.0
+
+    lendo_itens = False
+    linha_anterior_pendente = ""
+    acumulado_desconto = 0.0
+
+    for line in lines:
+        line_clean = line.strip()
+        if not line_clean: continue
+        line_upper = line_clean.upper()
+
+        date_match = re.search(r'(\d{2}/\d{2}/\d{4})', line_clean)
+        if date_match and not data["data"]:
+            data["data"] = date_match.group(1)
+
+        if not data["loja"] and ("DISTRIBUIDORA" in line_upper or "SUPERMERCADO" in line_upper or "LTDA" in line_upper):
+            data["loja"] = line_clean
+
+        if "CPF" in line_upper or "CNPJ" in line_upper:
+            cpf_match = re.search(r'(\d{3}\.\d{3}\.\d{3}-\d{2})', line_clean)
+            if cpf_match: data["cpf_consumidor"] = cpf_match.group(1)
+            line_clean = re.sub(r'(?i)(CPF|CNPJ):?\s*[\d\.\/-]{11,18}', '', line_clean).strip()
+
+        if "DESCONTO" in line_upper:
+            match_desc = re.search(r'(?:DESCONTOS?|DESC\.?|R\$).+?(\d+,\d{2})', line_clean, re.IGNORECASE)
+            if match_desc:
+                acumulado_desconto += conv(match_desc.group(1))
+
+        if "CARTÃO" in line_upper or "CREDITO" in line_upper: data["forma_pagamento"] = "Cartão de Crédito"
+        elif "DEBITO" in line_upper: data["forma_pagamento"] = "Débito"
+        elif "PIX" in line_upper: data["forma_pagamento"] = "Pix"
+        elif "DINHEIRO" in line_upper: data["forma_pagamento"] = "Dinheiro"
+
+        if "VALOR TOTAL" in line_upper or "TOTAL R$" in line_upper:
+            lendo_itens = False
+            continue
+
+        if "CÓDIGO" in line_upper and "DESCRIÇÃO" in line_upper:
+            lendo_itens = True
+            continue
+
+        regex_item_check = r'\d+,\d{2}\s+\d+,\d{2}\s*$'
+        if not lendo_itens and re.search(regex_item_check, line_clean) and not "VALOR" in line_upper:
+            lendo_itens = True
+
+        if lendo_itens:
+            line_clean = re.sub(r'(?i)Protocolo.*?\d+', '', line_clean).strip()
+            line_clean = re.sub(r'(?:\d{4}\s?){11}', '', line_clean).strip()
+            line_clean = re.sub(r'(\d)([a-zA-Z])', r'\1 \2', line_clean)
+            line_clean = re.sub(r'([a-zA-Z])(\d)', r'\1 \2', line_clean)
+
+            regex_completo = r'(\d+(?:,\d+)?)\s+([a-zA-Z]{2,3})\s+(\d+(?:,\d+)?)\s+(\d+(?:,\d+)?)\s*$'
+            match = re.search(regex_completo, line_clean)
+            item_data = {}
+
+            if match:
+                texto_nome = line_clean[:match.start()].strip()
+                texto_nome = re.sub(r'^\d+\s+', '', texto_nome).strip()
+                item_data = {"item": texto_nome, "qtd": conv(match.group(1)), "un": match.group(2),
+                             "vl_unit": conv(match.group(3)), "valor": conv(match.group(4))}
+            elif re.search(r'(\d+,\d{2})\s*$', line_clean):
+                match_total = re.search(r'(\d+,\d{2})\s*$', line_clean)
+                vl_total = conv(match_total.group(1))
+                texto_nome = line_clean[:match_total.start()].strip()
+                texto_nome = re.sub(r'^\d+\s+', '', texto_nome).strip()
+                if len(texto_nome) > 2:
+                    item_data = {"item": texto_nome, "qtd": 1.0, "un": "UN", "vl_unit": vl_total, "valor": vl_total}
+
+            if item_data:
+                if linha_anterior_pendente:
+                    item_data["item"] = f"{linha_anterior_pendente} {item_data['item']}"
+                    linha_anterior_pendente = ""
+                data["itens"].append(item_data)
+            else:
+                palavras_sistema = ["PÁGINA", "PAGE", "DANFE", "CONSUMIDOR", "NFC-E", "VERSÃO"]
+                if len(line_clean) > 3 and not any(p in line_upper for p in palavras_sistema):
+                    linha_anterior_pendente = line_clean
+
+    if acumulado_desconto > 0:
+        data["itens"].append({
+            "item": "💸 DESCONTO / ABATIMENTO",
+            "qtd": 1, "un": "UN", "vl_unit": -acumulado_desconto,
+            "valor": -acumulado_desconto
+        })
+
+    data["total_nota"] = sum(item["valor"] for item in data["itens"])
+    return data
+
+
+# ===============================================================
+# CORPUS
+# ===============================================================
+LOJAS = [
+    "SUPERMERCADO BOM PRECO LTDA", "DISTRIBUIDORA DE ALIMENTOS SUL LTDA",
+    "COMERCIAL ZAFFARI LTDA", "ATACADAO DISTRIBUIDORA",
+]
+PRODUTOS = [
+    "ARROZ TIPO 1 CAMIL 5KG", "FEIJAO PRETO 1KG", "BANANA PRATA KG", "FILE DE FRANGO SASSAMI",
+    "DETERGENTE YPE 500ML", "CERVEJA HEINEKEN LATA 350ML", "PAO FRANCES KG", "QUEIJO MUSSARELA FATIADO",
+    "SHAMPOO SEDA 325ML", "LEITE INTEGRAL 1L", "TOMATE ITALIANO KG", "PAPEL HIGIENICO NEVE 12UN",
+]
+PAGAMENTOS = ["Cartão de Crédito", "Cartão de Débito", "PIX", "Dinheiro"]
+
+
+def _fmt(valor):
+    return f"{valor:.2f}".replace(".", ",")
+
+
+def gerar_cupom(rng, n_itens):
+    linhas = [
+        f"          {rng.choice(LOJAS)}",
+        f"  CNPJ: {rng.randint(10, 99)}.{rng.randint(100, 999)}.{rng.randint(100, 999)}/0001-{rng.randint(10, 99)}",
+        "  Documento Auxiliar da Nota Fiscal de Consumidor Eletrônica",
+        "  Código     Descrição                         Qtde  UN   Vl Unit   Vl Total",
+    ]
+    for _ in range(n_itens):
+        codigo = rng.randint(100, 99999)
+        nome = rng.choice(PRODUTOS)
+        qtd = rng.choice([1, 2, 3])
+        unit = rng.uniform(1, 60)
+        if rng.random() < 0.15:
+            # Item quebrado: nome numa linha, valores na seguinte
+            linhas.append(f"  {codigo}  {nome}")
+            linhas.append(f"            {qtd} UN   {_fmt(unit)}   {_fmt(unit * qtd)}")
+        else:
+            linhas.append(f"  {codigo}  {nome}    {qtd}UN   {_fmt(unit)}   {_fmt(unit * qtd)}")
+    linhas += [
+        f"  Qtd. total de itens                        {n_itens}",
+        f"  Valor total R$                             {_fmt(rng.uniform(50, 900))}",
+    ]
+    if rng.random() < 0.4:
+        linhas.append(f"  Descontos R$                               {_fmt(rng.uniform(1, 20))}")
+    chave = chave_acesso(rng)
+    linhas += [
+        "  FORMA PAGAMENTO                      VALOR PAGO R$",
+        f"  {rng.choice(PAGAMENTOS)}",
+        "  Consulte pela Chave de Acesso em www.sefaz.rs.gov.br/nfce/consulta",
+        "  " + " ".join(chave[i:i + 4] for i in range(0, 44, 4)),
+        f"  CONSUMIDOR - CPF: {rng.randint(100, 999)}.{rng.randint(100, 999)}.{rng.randint(100, 999)}-{rng.randint(10, 99)}",
+        f"  NFC-e nº {rng.randint(1, 99999)} Série 1 {rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024 10:11:12",
+        f"  Protocolo de Autorização: {rng.randint(10**14, 10**15)}",
+    ]
+    return "\n".join(linhas), chave
+
+
+def gerar_corpus(n_notas, seed=42):
+    rng = random.Random(seed)
+    return [gerar_cupom(rng, rng.randint(5, 80)) for _ in range(n_notas)]
+
+
+# ===============================================================
+# MEDIÇÃO
+# ===============================================================
+def _medir(func, corpus, repeticoes):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        for texto in corpus:
+            func(texto.split("\n"))
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--notas", type=int, default=1000)
+    ap.add_argument("--repeticoes", type=int, default=3)
+    args = ap.parse_args()
+
+    cupons = gerar_corpus(args.notas)
+    corpus = [texto for texto, _ in cupons]
+    total_linhas = sum(texto.count("\n") + 1 for texto in corpus)
+
+    def engine(lines):
+        return InvoiceParser(None).parse_lines(lines)
+
+    for texto, chave in cupons:
+        linhas = texto.split("\n")
+        data = engine(linhas)
+        # A chave de acesso só existe no motor novo: conferida à parte, contra a gerada
+        if data.pop("chave_acesso") != chave:
+            raise SystemExit("Chave de acesso não encontrada pelo motor novo!")
+        if data != legacy_parse_lines(linhas):
+            raise SystemExit("Saída divergente entre o motor novo e o original!")
+
+    t_legacy = _medir(legacy_parse_lines, corpus, args.repeticoes)
+    t_engine = _medir(engine, corpus, args.repeticoes)
+
+    print(f"Corpus: {len(corpus)} notas, {total_linhas} linhas (saídas idênticas)")
+    print(f"Original: {total_linhas / t_legacy:12,.0f} linhas/s  ({t_legacy:.3f}s)")
+    print(f"Motor:    {total_linhas / t_engine:12,.0f} linhas/s  ({t_engine:.3f}s)")
+    print(f"Ganho:    {t_legacy / t_engine:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
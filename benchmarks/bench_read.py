@@ -0,0 +1,156 @@
+"""
+Comparação: pd.read_sql_query x COPY ... TO STDOUT + frame_from_copy.
+
+Uso (na raiz do projeto):
+    python -m benchmarks.bench_read --itens 500000
+    python -m benchmarks.bench_read --database-url postgresql://...   (contra um banco real)
+
+Sem --database-url, gera um histórico sintético em memória e compara só a
+montagem do DataFrame: tuplas como o psycopg2 devolve -> DataFrame.from_records
+(o que o read_sql_query faz) x o CSV que o COPY devolveria -> read_csv tipado.
+Com --database-url, mede as duas leituras completas do get_financial_data
+(banco + rede + pandas) sobre os dados que estiverem lá.
+Em ambos os casos confere que os valores batem e compara a memória (deep=True).
+"""
+import argparse
+import csv
+import io
+import random
+import time
+from datetime import date, timedelta
+
+import pandas as pd
+
+from database import COPY_NULL, FINANCIAL_DTYPES, frame_from_copy
+
+COLUNAS = list(FINANCIAL_DTYPES)[:1] + ["data_compra"] + list(FINANCIAL_DTYPES)[1:]
+
+LOJAS = [f"SUPERMERCADO {nome} LTDA" for nome in (
+    "BOM PRECO", "CENTRAL", "FAMILIA", "DO BAIRRO", "ECONOMICO", "PAULISTA", "NOVA ERA", "SAO JOSE",
+)] + [f"FARMACIA {i}" for i in range(20)] + [f"PADARIA {i}" for i in range(20)]
+CATEGORIAS = ["Hortifruti", "Carnes", "Bebidas", "Padaria", "Limpeza", "Higiene", "Geral"]
+FORMAS = ["Cartão de Crédito", "Cartão de Débito", "Pix", "Dinheiro", None]
+PRODUTOS = ["BANANA PRATA", "ARROZ TIPO 1", "FEIJAO CARIOCA", "LEITE INTEGRAL", "PAO FRANCES",
+            "DETERGENTE", "SABONETE", "CERVEJA LATA", "FRANGO PEITO", "TOMATE", "CAFE", "OVOS"]
+# Textos que a lista padrão de NA do pandas transformaria em NaN
+NOMES_LIMITE = ["NA", "N/A", "None", "null", "nan", ""]
+
+
+def gerar_historico(n_itens, seed=42):
+    """Linhas como o psycopg2 devolveria para a consulta do get_financial_data."""
+    rng = random.Random(seed)
+    inicio = date(2021, 1, 1)
+    linhas = []
+    nota_id = 0
+    while len(linhas) < n_itens:
+        nota_id += 1
+        data_compra = inicio + timedelta(days=rng.randint(0, 1500))
+        loja = rng.choice(LOJAS)
+        pagador = rng.choice(("Kristian", "Giulia"))
+        forma = rng.choice(FORMAS)
+        for _ in range(rng.randint(1, 40)):
+            valor = round(rng.uniform(0.5, 120.0), 2)
+            k = round(valor / 2, 2)
+            linhas.append((
+                nota_id, data_compra, loja, pagador, forma,
+                rng.choice(NOMES_LIMITE) if rng.random() < 0.01 else f"{rng.choice(PRODUTOS)} {rng.randint(1, 999)}G",
+                rng.choice(CATEGORIAS),
+                valor, k, round(valor - k, 2),
+            ))
+    return linhas[:n_itens]
+
+
+def como_copy(linhas):
+    # O que o COPY (FORMAT csv, HEADER true, NULL COPY_NULL) mandaria pela rede
+    texto = io.StringIO()
+    w = csv.writer(texto)
+    w.writerow(COLUNAS)
+    w.writerows([COPY_NULL if v is None else v for v in linha] for linha in linhas)
+    return io.BytesIO(texto.getvalue().encode("utf-8"))
+
+
+def _mb(df):
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+def _textos(serie):
+    # NULL vira None dos dois lados (NaN no COPY, None no read_sql_query)
+    return serie.astype(object).where(serie.notna(), None).tolist()
+
+
+def _conferir(legado, rapido):
+    if len(legado) != len(rapido):
+        raise SystemExit("Número de linhas divergente!")
+    for coluna in ("valor", "kristian_parte", "giulia_parte"):
+        if abs(float(legado[coluna].sum()) - float(rapido[coluna].astype("float64").sum())) > 0.01 * len(legado):
+            raise SystemExit(f"Soma divergente em {coluna}!")
+    for coluna in ("categoria", "item_nome", "loja", "forma_pagamento"):
+        if _textos(legado[coluna]) != _textos(rapido[coluna]):
+            raise SystemExit(f"Textos divergentes em {coluna}!")
+
+
+def medir_offline(n_itens, repeticoes):
+    linhas = gerar_historico(n_itens)
+    buf = como_copy(linhas)
+
+    t_legado = t_rapido = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        legado = pd.DataFrame.from_records(linhas, columns=COLUNAS, coerce_float=True)
+        t_legado = min(t_legado, time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        rapido = frame_from_copy(buf, FINANCIAL_DTYPES, ("data_compra",))
+        t_rapido = min(t_rapido, time.perf_counter() - inicio)
+    return legado, rapido, t_legado, t_rapido
+
+
+def medir_banco(database_url, repeticoes):
+    from database import DatabaseManager
+    db = DatabaseManager(database_url)
+    query = """
+        SELECT n.id as nota_id, n.data_compra, n.loja, n.pagador, n.forma_pagamento,
+            i.item_nome, i.categoria, i.valor, i.kristian_parte, i.giulia_parte
+        FROM notas n JOIN itens i ON n.id = i.nota_id
+        ORDER BY i.id
+    """
+    t_legado = t_rapido = float("inf")
+    try:
+        for _ in range(repeticoes):
+            with db._connection() as conn:
+                inicio = time.perf_counter()
+                legado = pd.read_sql_query(query, conn)
+                t_legado = min(t_legado, time.perf_counter() - inicio)
+
+                inicio = time.perf_counter()
+                rapido = db._read_frame(conn, query, dtype=FINANCIAL_DTYPES, dates=("data_compra",))
+                t_rapido = min(t_rapido, time.perf_counter() - inicio)
+    finally:
+        db.close()
+    return legado, rapido, t_legado, t_rapido
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--itens", type=int, default=500000)
+    ap.add_argument("--repeticoes", type=int, default=3)
+    ap.add_argument("--database-url", default=None)
+    args = ap.parse_args()
+
+    if args.database_url:
+        legado, rapido, t_legado, t_rapido = medir_banco(args.database_url, args.repeticoes)
+        origem = "banco"
+    else:
+        legado, rapido, t_legado, t_rapido = medir_offline(args.itens, args.repeticoes)
+        origem = "sintético (só montagem do DataFrame)"
+
+    _conferir(legado, rapido)
+    print(f"{len(rapido)} itens, {origem} (valores conferidos)")
+    print(f"read_sql_query / from_records: {t_legado:8.3f}s  {_mb(legado):9.1f} MB")
+    print(f"COPY + frame_from_copy:        {t_rapido:8.3f}s  {_mb(rapido):9.1f} MB")
+    print(f"Ganho: {t_legado / t_rapido:.2f}x mais rápido, {_mb(legado) / _mb(rapido):.1f}x menos memória")
+    print("Tipos:", ", ".join(f"{c}={t}" for c, t in rapido.dtypes.astype(str).items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,443 @@
+"""
+Suíte de benchmarks do DivCount, com o resultado gravado em JSON.
+
+Uso (na raiz do projeto):
+    python -m benchmarks.suite
+    python -m benchmarks.suite --database-url postgresql://localhost/divcount_bench --apagar-dados \\
+        --tamanhos 10000,100000,1000000
+    python -m benchmarks.suite --secoes parser,dashboard --comparar benchmarks/resultados/anterior.json
+
+Seções (--secoes):
+  parser         InvoiceParser sobre cupons sintéticos: texto (parse_lines) e PDFs gerados (parse)
+  categorizacao  ExpenseManager.categorize_item / categorize_many e o índice de n-gramas
+  dashboard      o que o render_dashboard faz com o que o banco devolve, sobre históricos de
+                 cada --tamanhos e filtros em "Todas": ler o COPY de cada get_*, montar os
+                 gráficos e o Styler da tabela completa (o SQL em si fica na seção banco)
+  banco          leituras e escritas do DatabaseManager contra um Postgres local, com o
+                 banco populado em cada --tamanhos (só roda com --database-url)
+
+A seção banco ESVAZIA as tabelas do banco informado: use um banco só para isso.
+Sem --apagar-dados ela se recusa a rodar num banco que já tenha notas.
+
+Cada medida é o melhor tempo (e a mediana) de --repeticoes execuções. O JSON
+vai para benchmarks/resultados/<data-hora>.json (ou --saida); com --comparar,
+imprime a razão anterior/atual de cada medida em comum.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from benchmarks.synthetic import como_texto, escrever_pdf, gerar_cupons, gerar_notas
+
+SECOES = ("parser", "categorizacao", "dashboard", "banco")
+PASTA_RESULTADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultados")
+LOJA_ESCRITA = "BENCHMARK ESCRITA LTDA" # Notas gravadas pela seção banco e apagadas no fim
+
+
+def _medir(func, repeticoes, antes=None):
+    """Roda func `repeticoes` vezes (antes() fora do cronômetro). Devolve (medida, último retorno)."""
+    tempos = []
+    retorno = None
+    for _ in range(repeticoes):
+        if antes:
+            antes()
+        inicio = time.perf_counter()
+        retorno = func()
+        tempos.append(time.perf_counter() - inicio)
+    return {"segundos": min(tempos), "mediana": statistics.median(tempos), "repeticoes": repeticoes}, retorno
+
+
+def _por_segundo(medida, quantidade, unidade):
+    medida[unidade] = quantidade
+    medida[f"{unidade}_por_s"] = quantidade / medida["segundos"] if medida["segundos"] else None
+    return medida
+
+
+def _registrar(resultados, chave, medida):
+    resultados[chave] = medida
+    extra = "".join(
+        f"  {v:,.0f} {k}" for k, v in medida.items() if k.endswith("_por_s") and v
+    )
+    print(f"  {chave:<45} {medida['segundos']:9.4f}s{extra}", flush=True)
+
+
+# ===============================================================
+# SEÇÕES
+# ===============================================================
+def bench_parser(args, resultados):
+    from parser import InvoiceParser
+
+    cupons = gerar_cupons(args.notas)
+    textos = [como_texto(paginas).split("\n") for paginas, _ in cupons]
+    n_linhas = sum(len(linhas) for linhas in textos)
+
+    medida, _ = _medir(lambda: [InvoiceParser(None).parse_lines(linhas) for linhas in textos], args.repeticoes)
+    _registrar(resultados, "parser.texto", _por_segundo(_por_segundo(medida, len(textos), "notas"), n_linhas, "linhas"))
+
+    # PDFs de verdade (pdfplumber incluso), com notas de várias páginas
+    cupons_pdf = gerar_cupons(args.pdfs, itens=(5, 200), seed=7)
+    with tempfile.TemporaryDirectory(prefix="divcount_bench_") as pasta:
+        caminhos = []
+        for n, (paginas, _) in enumerate(cupons_pdf):
+            caminho = os.path.join(pasta, f"nota_{n}.pdf")
+            escrever_pdf(paginas, caminho)
+            caminhos.append(caminho)
+        n_paginas = sum(len(paginas) for paginas, _ in cupons_pdf)
+
+        medida, _ = _medir(lambda: [InvoiceParser(c).parse() for c in caminhos], args.repeticoes)
+        _registrar(resultados, "parser.pdf", _por_segundo(_por_segundo(medida, len(caminhos), "notas"), n_paginas, "paginas"))
+
+
+def _parse_texto(paginas):
+    from parser import InvoiceParser
+    return InvoiceParser(None).parse_lines(como_texto(paginas).split("\n"))
+
+
+def bench_categorizacao(args, resultados):
+    from core import ExpenseManager
+    from item_keys import NgramIndex, normalize_item_key
+
+    manager = ExpenseManager()
+    nomes = [
+        item["item"]
+        for paginas, _ in gerar_cupons(args.notas)
+        for item in _parse_texto(paginas)["itens"]
+    ]
+
+    medida, _ = _medir(lambda: [manager.categorize_item(nome) for nome in nomes], args.repeticoes)
+    _registrar(resultados, "categorizacao.categorize_item", _por_segundo(medida, len(nomes), "itens"))
+
+    medida, _ = _medir(lambda: manager.categorize_many(nomes), args.repeticoes)
+    _registrar(resultados, "categorizacao.categorize_many", _por_segundo(medida, len(nomes), "itens"))
+
+    # Memória aprendida: metade das chaves no índice, busca por semelhança em todas
+    chaves = [normalize_item_key(nome) for nome in nomes]
+    indice = NgramIndex()
+    indice.add_many((chave, "Geral") for chave in chaves[::2])
+    medida, _ = _medir(lambda: [indice.best_match(chave) for chave in chaves], args.repeticoes)
+    _registrar(resultados, "categorizacao.ngram_best_match", _por_segundo(medida, len(chaves), "itens"))
+
+
+def _copias_dashboard(n_itens):
+    # O CSV que o COPY devolveria para cada get_* do render_dashboard, com os filtros em "Todas".
+    # As agregações são feitas aqui, fora do cronômetro: no app quem agrega é o banco
+    import io
+
+    from database import COPY_NULL, FILTERED_ITEM_COLUMNS
+
+    linhas = [
+        (
+            nota["data_compra"], nota["loja"], nota["pagador"], nota["forma_pagamento"],
+            item["Item"], item["Categoria"], item["Valor (R$)"],
+            item["Partes"]["Kristian"] / 100, item["Partes"]["Giulia"] / 100,
+        )
+        for nota in gerar_notas(n_itens)
+        for item in nota["itens"]
+    ]
+    itens = pd.DataFrame.from_records(linhas, columns=FILTERED_ITEM_COLUMNS)
+    por_categoria = itens.groupby("categoria", as_index=False)["valor"].sum()
+    por_data = itens.groupby("data_compra", as_index=False)["valor"].sum().sort_values("data_compra")
+
+    def como_copy(df):
+        return io.BytesIO(df.to_csv(index=False, na_rep=COPY_NULL).encode("utf-8"))
+
+    return como_copy(por_categoria), como_copy(por_data), como_copy(itens)
+
+
+def bench_dashboard(args, resultados):
+    from database import FINANCIAL_DTYPES, frame_from_copy
+    from ui_dashboard import FORMATO_TABELA, make_bar_chart, make_donut_chart, make_line_chart
+
+    for tamanho in args.tamanhos:
+        buf_cat, buf_data, buf_itens = _copias_dashboard(tamanho)
+
+        # Os mesmos tipos dos get_* do DatabaseManager
+        medida, df_cat = _medir(lambda: frame_from_copy(buf_cat, {"valor": "float64"}), args.repeticoes)
+        _registrar(resultados, f"dashboard.get_spending_by_category.{tamanho}", medida)
+        medida, df_tempo = _medir(
+            lambda: frame_from_copy(buf_data, {"valor": "float64"}, ("data_compra",)), args.repeticoes
+        )
+        _registrar(resultados, f"dashboard.get_spending_by_date.{tamanho}", _por_segundo(medida, len(df_tempo), "dias"))
+        medida, df_itens = _medir(
+            lambda: frame_from_copy(buf_itens, FINANCIAL_DTYPES, ("data_compra",)), args.repeticoes
+        )
+        _registrar(resultados, f"dashboard.get_filtered_items.{tamanho}", _por_segundo(medida, len(df_itens), "itens"))
+
+        def graficos():
+            # O st.altair_chart serializa cada gráfico (dados inclusos) com to_dict
+            return [
+                make_bar_chart(df_cat).to_dict(),
+                make_donut_chart(df_cat, "valor", "categoria", tipo='azul').to_dict(),
+                make_line_chart(df_tempo).to_dict(),
+            ]
+
+        def tabela():
+            # O que o st.dataframe faz com um Styler: calcula os estilos e os textos formatados
+            estilo = df_itens.style.format(FORMATO_TABELA)
+            estilo._compute()
+            return estilo._translate(False, False)
+
+        medida, _ = _medir(graficos, args.repeticoes)
+        _registrar(resultados, f"dashboard.graficos.{tamanho}", _por_segundo(medida, len(df_tempo), "dias"))
+        medida, _ = _medir(tabela, args.repeticoes)
+        _registrar(resultados, f"dashboard.tabela_styler.{tamanho}", _por_segundo(medida, len(df_itens), "itens"))
+
+
+def _conferir_banco(database_url, apagar):
+    # Antes de qualquer seção: não esvaziar por engano um banco com dados
+    from database import DatabaseManager
+
+    db = DatabaseManager(database_url)
+    try:
+        with db._connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT EXISTS (SELECT 1 FROM notas)")
+            tem_notas = cur.fetchone()[0]
+            cur.close()
+    finally:
+        db.close()
+    if tem_notas and not apagar:
+        raise SystemExit("O banco já tem notas: use um banco só para benchmark e passe --apagar-dados.")
+
+
+def _esvaziar(db):
+    with db._connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "TRUNCATE notas, itens, item_shares, reembolsos, resumo_mensal, memoria_itens RESTART IDENTITY"
+        )
+        conn.commit()
+        cur.close()
+    db.memory_cache.invalidate()
+    db.result_cache.bump()
+
+
+def _popular(db, notas, n_itens, lote=2000):
+    # Puxa notas do gerador em lotes até somar n_itens (a última nota pode passar um pouco)
+    itens = 0
+    while itens < n_itens:
+        bloco = []
+        for nota in notas:
+            bloco.append(nota)
+            itens += len(nota["itens"])
+            if len(bloco) == lote or itens >= n_itens:
+                break
+        if not bloco:
+            break
+        db.bulk_insert_invoices(bloco)
+    return itens
+
+
+def _analisar(db):
+    # Estatísticas em dia depois da carga, como o autovacuum deixaria
+    with db._connection() as conn:
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute("ANALYZE")
+        cur.close()
+        conn.autocommit = False
+
+
+def bench_banco(args, resultados):
+    from database import DatabaseManager
+
+    db = DatabaseManager(args.database_url)
+    _esvaziar(db)
+
+    # Histórico único (mesma semente) carregado em fatias até cada tamanho
+    notas = gerar_notas(max(args.tamanhos))
+    total = 0
+    repetir = args.repeticoes
+    frio = db.result_cache.bump # Cada leitura medida sem o cache de resultados
+
+    try:
+        for tamanho in args.tamanhos:
+            medida, itens = _medir(lambda: _popular(db, notas, tamanho - total), 1)
+            _registrar(resultados, f"banco.carga_copy.{tamanho}", _por_segundo(medida, itens, "itens"))
+            total += itens
+            _analisar(db)
+
+            opcoes = db.get_filter_options()
+            um_ano = dict(data_inicio=opcoes["max_data"] - timedelta(days=365), data_fim=opcoes["max_data"])
+            tudo = dict(data_inicio=opcoes["min_data"], data_fim=opcoes["max_data"], categoria="Todas", loja="Todas")
+
+            def rerun_dashboard():
+                # As leituras que o render_dashboard faz a cada rerun (tabela aberta)
+                db.get_filter_options()
+                db.get_balance_summary()
+                db.get_spending_by_category(**tudo)
+                db.get_spending_by_date(**tudo)
+                return db.get_filtered_items(**tudo)
+
+            def iterar_tudo():
+                return sum(len(bloco) for bloco in db.iter_filtered_items(**tudo))
+
+            leituras = (
+                ("get_financial_data", lambda: len(db.get_financial_data()[0])),
+                ("get_filter_options", db.get_filter_options),
+                ("get_balance_summary", db.get_balance_summary),
+                ("get_spending_by_category", lambda: db.get_spending_by_category(**tudo)),
+                ("get_spending_by_date", lambda: db.get_spending_by_date(**tudo)),
+                ("get_filtered_items", lambda: db.get_filtered_items(**tudo)),
+                ("get_filtered_items_um_ano", lambda: db.get_filtered_items(**um_ano)),
+                ("get_invoice_days", lambda: db.get_invoice_days()),
+                ("get_invoices_page", lambda: db.get_invoices_page()),
+                ("iter_filtered_items", iterar_tudo),
+                ("rerun_dashboard", rerun_dashboard),
+            )
+            for nome, func in leituras:
+                medida, _ = _medir(func, repetir, antes=frio)
+                medida["historico_itens"] = total
+                _registrar(resultados, f"banco.{nome}.{tamanho}", medida)
+
+            # O mesmo rerun com o cache de resultados quente (nenhuma escrita no meio)
+            rerun_dashboard()
+            medida, _ = _medir(rerun_dashboard, repetir)
+            _registrar(resultados, f"banco.rerun_dashboard_cache.{tamanho}", medida)
+
+            _bench_escritas(db, args, resultados, tamanho)
+    finally:
+        db.close()
+
+
+def _bench_escritas(db, args, resultados, tamanho):
+    # Notas salvas uma a uma pelo caminho da UI (save_invoice), depois apagadas em lote
+    notas = list(itertools.islice(gerar_notas(args.notas_escrita * 40, seed=tamanho), args.notas_escrita))
+    n_itens = sum(len(nota["itens"]) for nota in notas)
+
+    def salvar():
+        for nota in notas:
+            db.save_invoice(
+                nota["data_compra"].strftime("%d/%m/%Y"), LOJA_ESCRITA, nota["total_nota"],
+                nota["pagador"], nota["forma_pagamento"], nota["itens"],
+            )
+
+    medida, _ = _medir(salvar, 1)
+    _registrar(resultados, f"banco.save_invoice.{tamanho}", _por_segundo(_por_segundo(medida, len(notas), "notas"), n_itens, "itens"))
+
+    # Categorias aprendidas nessas notas: consulta fria (banco) e quente (cache em memória)
+    nomes = [item["Item"] for nota in notas for item in nota["itens"]]
+    medida, _ = _medir(lambda: db.get_learned_categories(nomes), 1, antes=db.memory_cache.invalidate)
+    _registrar(resultados, f"banco.get_learned_categories_frio.{tamanho}", _por_segundo(medida, len(nomes), "itens"))
+    medida, _ = _medir(lambda: db.get_learned_categories(nomes), args.repeticoes)
+    _registrar(resultados, f"banco.get_learned_categories_cache.{tamanho}", _por_segundo(medida, len(nomes), "itens"))
+
+    medida, _ = _medir(lambda: [db.save_reimbursement("Giulia", "Kristian", 10.0) for _ in range(args.notas_escrita)], 1)
+    _registrar(resultados, f"banco.save_reimbursement.{tamanho}", _por_segundo(medida, args.notas_escrita, "reembolsos"))
+
+    with db._connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM notas WHERE loja = %s", (LOJA_ESCRITA,))
+        nota_ids = [row[0] for row in cur.fetchall()]
+        cur.execute("SELECT id FROM reembolsos ORDER BY id DESC LIMIT %s", (args.notas_escrita,))
+        reembolso_ids = [row[0] for row in cur.fetchall()]
+        cur.close()
+
+    medida, _ = _medir(lambda: db.delete_invoices(nota_ids), 1)
+    _registrar(resultados, f"banco.delete_invoices.{tamanho}", _por_segundo(medida, len(nota_ids), "notas"))
+    medida, _ = _medir(lambda: db.delete_reimbursements(reembolso_ids), 1)
+    _registrar(resultados, f"banco.delete_reimbursements.{tamanho}", _por_segundo(medida, len(reembolso_ids), "reembolsos"))
+
+
+# ===============================================================
+# RESULTADO
+# ===============================================================
+def _ambiente():
+    import numpy
+
+    return {
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "processador": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+        "pandas": pd.__version__,
+        "numpy": numpy.__version__,
+    }
+
+
+def comparar(anterior, atual):
+    """Imprime anterior/atual (>1 = ficou mais rápido) das medidas presentes nos dois."""
+    comuns = [k for k in atual["resultados"] if k in anterior["resultados"]]
+    if not comuns:
+        print("Nenhuma medida em comum para comparar.")
+        return
+    print(f"\nComparação com {anterior['inicio']} (anterior/atual, >1 = mais rápido agora):")
+    for chave in comuns:
+        antes = anterior["resultados"][chave]["segundos"]
+        agora = atual["resultados"][chave]["segundos"]
+        razao = antes / agora if agora else float("inf")
+        marca = "  <-- mais lento" if razao < 0.9 else ""
+        print(f"  {chave:<45} {antes:9.4f}s -> {agora:9.4f}s  {razao:5.2f}x{marca}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--secoes", default=",".join(SECOES), help="Seções a rodar, separadas por vírgula")
+    ap.add_argument("--tamanhos", default="10000,100000",
+                    help="Tamanhos de histórico (itens) para dashboard e banco, ex.: 10000,100000,1000000")
+    ap.add_argument("--notas", type=int, default=500, help="Cupons em texto para parser/categorização")
+    ap.add_argument("--pdfs", type=int, default=20, help="Cupons em PDF para o parser")
+    ap.add_argument("--notas-escrita", type=int, default=50, help="Notas salvas uma a uma na seção banco")
+    ap.add_argument("--repeticoes", type=int, default=3)
+    ap.add_argument("--database-url", default=None)
+    ap.add_argument("--apagar-dados", action="store_true", help="Permite esvaziar um banco que já tem notas")
+    ap.add_argument("--saida", default=None, help="Arquivo JSON (padrão: benchmarks/resultados/<data-hora>.json)")
+    ap.add_argument("--comparar", default=None, help="JSON de uma execução anterior")
+    args = ap.parse_args(argv)
+
+    secoes = [s.strip() for s in args.secoes.split(",") if s.strip()]
+    desconhecidas = set(secoes) - set(SECOES)
+    if desconhecidas:
+        ap.error(f"seções desconhecidas: {', '.join(sorted(desconhecidas))}")
+    if "banco" in secoes and not args.database_url:
+        if args.secoes != ",".join(SECOES):
+            ap.error("a seção banco precisa de --database-url")
+        secoes.remove("banco") # Padrão sem banco: roda o resto
+    args.tamanhos = sorted(int(t) for t in args.tamanhos.split(","))
+    if "banco" in secoes:
+        _conferir_banco(args.database_url, args.apagar_dados)
+
+    inicio = datetime.now()
+    resultados = {}
+    funcoes = {
+        "parser": bench_parser, "categorizacao": bench_categorizacao,
+        "dashboard": bench_dashboard, "banco": bench_banco,
+    }
+    for secao in secoes:
+        print(f"[{secao}]", flush=True)
+        funcoes[secao](args, resultados)
+
+    relatorio = {
+        "inicio": inicio.isoformat(timespec="seconds"),
+        "duracao_s": round((datetime.now() - inicio).total_seconds(), 1),
+        "ambiente": _ambiente(),
+        "parametros": {k: v for k, v in vars(args).items() if k not in ("database_url", "comparar", "saida")},
+        "secoes": secoes,
+        "resultados": resultados,
+    }
+
+    saida = args.saida
+    if saida is None:
+        os.makedirs(PASTA_RESULTADOS, exist_ok=True)
+        saida = os.path.join(PASTA_RESULTADOS, f"{inicio:%Y%m%d-%H%M%S}.json")
+    with open(saida, "w", encoding="utf-8") as arquivo:
+        json.dump(relatorio, arquivo, ensure_ascii=False, indent=2, default=str)
+    print(f"\nResultados em {saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            comparar(json.load(arquivo), relatorio)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
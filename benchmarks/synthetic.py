@@ -0,0 +1,208 @@
+"""
+Dados sintéticos para os benchmarks: cupons de NFC-e (texto e PDF) e
+históricos de notas para popular o banco.
+
+Os cupons imitam o texto que o pdfplumber devolve com layout=True: lojas
+variadas, itens quebrados em duas linhas, descontos (por item e no total),
+linhas de CPF/CNPJ, chave de acesso, protocolo e notas de várias páginas.
+O PDF é escrito à mão (Courier, uma linha por Td), sem dependência extra.
+Tudo é determinístico a partir da semente.
+"""
+import random
+from datetime import date, timedelta
+
+LOJAS = [
+    "SUPERMERCADO BOM PRECO LTDA", "DISTRIBUIDORA DE ALIMENTOS SUL LTDA",
+    "COMERCIAL ZAFFARI LTDA", "ATACADAO DISTRIBUIDORA", "SUPERMERCADO NACIONAL",
+    "CIA BOURBON DE SUPERMERCADOS", "MERCADO FAMILIA LTDA", "HORTIFRUTI CENTRAL LTDA",
+    "FARMACIA SAO JOAO LTDA", "PADARIA E CONFEITARIA TRIGO LTDA",
+]
+# (nome como sai na nota, unidade, faixa do preço unitário)
+PRODUTOS = [
+    ("ARROZ TIPO 1 CAMIL 5KG", "UN", (18, 35)), ("FEIJAO PRETO 1KG", "UN", (6, 12)),
+    ("BANANA PRATA", "KG", (4, 9)), ("FILE DE FRANGO SASSAMI", "KG", (18, 32)),
+    ("DETERGENTE YPE 500ML", "UN", (2, 4)), ("CERVEJA HEINEKEN LATA 350ML", "UN", (4, 7)),
+    ("PAO FRANCES", "KG", (12, 20)), ("QUEIJO MUSSARELA FATIADO", "KG", (35, 60)),
+    ("SHAMPOO SEDA 325ML", "UN", (9, 18)), ("LEITE INTEGRAL 1L", "UN", (4, 7)),
+    ("TOMATE ITALIANO", "KG", (5, 11)), ("PAPEL HIGIENICO NEVE 12UN", "PCT", (15, 28)),
+    ("CARNE MOIDA PATINHO", "KG", (35, 55)), ("REFRIGERANTE COCA COLA 2L", "UN", (8, 12)),
+    ("SABONETE DOVE 90G", "UN", (3, 6)), ("CAFE PILAO 500G", "UN", (14, 25)),
+    ("IOGURTE NATURAL NESTLE 170G", "UN", (2, 4)), ("MACA GALA", "KG", (8, 14)),
+    ("AMACIANTE DOWNY 1L", "UN", (12, 22)), ("LINGUICA TOSCANA", "KG", (18, 30)),
+    ("BISCOITO RECHEADO OREO 90G", "UN", (3, 6)), ("AGUA MINERAL 1,5L", "UN", (2, 4)),
+    ("PILHA DURACELL AA C/4", "UN", (15, 30)), ("VELA AROMATICA LAVANDA", "UN", (10, 25)),
+]
+CATEGORIAS = ["Hortifruti", "Carnes", "Bebidas", "Padaria", "Limpeza", "Higiene", "Geral"]
+PAGAMENTOS = ["Cartão de Crédito", "Cartão de Débito", "PIX", "Dinheiro", "Debito", "Credito a vista"]
+CPFS = ["018.491.380-28", "000.000.000-00", "123.456.789-09"]
+PARTICIPANTES = ("Kristian", "Giulia")
+
+LINHAS_POR_PAGINA = 60
+
+
+def _fmt(valor, casas=2):
+    return f"{valor:,.{casas}f}".replace(",", "_").replace(".", ",").replace("_", ".")
+
+
+def chave_acesso(rng):
+    # 43 dígitos sorteados (11 blocos, como o rodapé) + dígito verificador módulo 11
+    corpo = "".join(f"{rng.randint(0, 9999):04d}" for _ in range(11))[:43]
+    soma = sum(int(d) * (2 + i % 8) for i, d in enumerate(reversed(corpo)))
+    resto = soma % 11
+    return corpo + str(0 if resto < 2 else 11 - resto)
+
+
+def gerar_cupom(rng, n_itens):
+    """
+    Um cupom como lista de páginas (cada página é uma lista de linhas).
+    Devolve (paginas, esperado) com o que o parser deve achar de metadados
+    (a chave de acesso sai com dígito verificador válido).
+    """
+    loja = rng.choice(LOJAS)
+    dia = date(2024, 1, 1) + timedelta(days=rng.randint(0, 364))
+    cpf = rng.choice(CPFS) if rng.random() < 0.8 else None
+    linhas = [
+        f"          {loja}",
+        f"  CNPJ: {rng.randint(10, 99)}.{rng.randint(100, 999)}.{rng.randint(100, 999)}/0001-{rng.randint(10, 99)}",
+        f"  RUA DOS ANDRADAS, {rng.randint(1, 2000)} - CENTRO - PORTO ALEGRE - RS",
+        "  Documento Auxiliar da Nota Fiscal de Consumidor Eletrônica",
+        "  Código     Descrição                         Qtde  UN   Vl Unit   Vl Total",
+    ]
+    for _ in range(n_itens):
+        codigo = rng.randint(100, 9999999)
+        nome, un, (minimo, maximo) = rng.choice(PRODUTOS)
+        unit = rng.uniform(minimo, maximo)
+        if un == "KG":
+            qtd = rng.uniform(0.1, 2.5)
+            qtd_txt = _fmt(qtd, 3)
+        else:
+            qtd = rng.choice((1, 1, 1, 2, 3, 6))
+            qtd_txt = str(qtd)
+        total = round(unit * qtd, 2)
+        sorteio = rng.random()
+        if sorteio < 0.12:
+            # Item quebrado: nome numa linha, valores na seguinte
+            linhas.append(f"  {codigo}  {nome}")
+            linhas.append(f"            {qtd_txt} {un}   {_fmt(unit)}   {_fmt(total)}")
+        elif sorteio < 0.20:
+            # Quantidade grudada na unidade, como alguns emissores fazem ("0,500KG")
+            linhas.append(f"  {codigo}  {nome}    {qtd_txt}{un}   {_fmt(unit)}   {_fmt(total)}")
+        else:
+            linhas.append(f"  {codigo}  {nome}    {qtd_txt} {un}   {_fmt(unit)}   {_fmt(total)}")
+        if rng.random() < 0.05:
+            linhas.append(f"  Desconto item                              -{_fmt(total * rng.uniform(0.05, 0.2))}")
+
+    linhas += [
+        f"  Qtd. total de itens                        {n_itens}",
+        f"  Valor total R$                             {_fmt(rng.uniform(50, 900))}",
+    ]
+    if rng.random() < 0.3:
+        linhas.append(f"  Descontos R$                               {_fmt(rng.uniform(1, 20))}")
+    pagamento = rng.choice(PAGAMENTOS)
+    chave = chave_acesso(rng)
+    linhas += [
+        "  FORMA PAGAMENTO                      VALOR PAGO R$",
+        f"  {pagamento}",
+        "  Consulte pela Chave de Acesso em www.sefaz.rs.gov.br/nfce/consulta",
+        "  " + " ".join(chave[i:i + 4] for i in range(0, 44, 4)),
+        f"  CONSUMIDOR - CPF: {cpf}" if cpf else "  CONSUMIDOR NÃO IDENTIFICADO",
+        f"  NFC-e nº {rng.randint(1, 99999)} Série 1 {dia:%d/%m/%Y} 10:{rng.randint(10, 59)}:12",
+        f"  Protocolo de Autorização: {rng.randint(10**14, 10**15)}",
+    ]
+
+    # Paginação com o rodapé que o pdfplumber também devolve
+    paginas = [linhas[i:i + LINHAS_POR_PAGINA] for i in range(0, len(linhas), LINHAS_POR_PAGINA)]
+    for n, pagina in enumerate(paginas, 1):
+        pagina.append(f"  Página {n} de {len(paginas)}")
+    return paginas, {"loja": loja, "data": dia.strftime("%d/%m/%Y"), "cpf_consumidor": cpf, "chave_acesso": chave}
+
+
+def gerar_cupons(n_notas, itens=(5, 80), seed=42):
+    """Lista de (paginas, esperado); `itens` é a faixa de itens por nota."""
+    rng = random.Random(seed)
+    return [gerar_cupom(rng, rng.randint(*itens)) for _ in range(n_notas)]
+
+
+def como_texto(paginas):
+    # As páginas coladas sem separador, como o InvoiceParser junta o texto
+    return "".join("\n".join(pagina) + "\n" for pagina in paginas)
+
+
+# ===============================================================
+# PDF MÍNIMO (Courier 8pt, WinAnsi)
+# ===============================================================
+def _pdf_texto(linha):
+    texto = linha.encode("cp1252", errors="replace")
+    return texto.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def escrever_pdf(paginas, destino):
+    """Grava as páginas (listas de linhas) num PDF de texto em `destino`."""
+    objetos = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None, # Pages, preenchido depois que os filhos tiverem número
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>",
+    ]
+    filhos = []
+    for pagina in paginas:
+        corpo = [b"BT /F1 8 Tf 10 TL 20 820 Td"]
+        corpo += [b"(" + _pdf_texto(linha) + b") Tj T*" for linha in pagina]
+        corpo.append(b"ET")
+        stream = b"\n".join(corpo)
+        objetos.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objetos.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 420 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objetos))
+        )
+        filhos.append(len(objetos))
+    objetos[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % n for n in filhos), len(filhos)
+    )
+
+    saida = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for n, obj in enumerate(objetos, 1):
+        offsets.append(len(saida))
+        saida += b"%d 0 obj\n" % n + obj + b"\nendobj\n"
+    xref = len(saida)
+    saida += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    saida += b"".join(b"%010d 00000 n \n" % off for off in offsets)
+    saida += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, xref)
+
+    with open(destino, "wb") as arquivo:
+        arquivo.write(saida)
+
+
+# ===============================================================
+# HISTÓRICO PARA O BANCO
+# ===============================================================
+def gerar_notas(n_itens, seed=42, inicio=date(2021, 1, 1), dias=1500):
+    """
+    Gera (sob demanda, sem montar a lista) notas no formato do
+    DatabaseManager.bulk_insert_invoices somando `n_itens` itens:
+    1 a 40 por nota, partes em centavos divididas ao meio.
+    """
+    rng = random.Random(seed)
+    total = 0
+    while total < n_itens:
+        n = min(rng.randint(1, 40), n_itens - total)
+        itens = []
+        for _ in range(n):
+            nome, _, (minimo, maximo) = rng.choice(PRODUTOS)
+            cents = int(rng.uniform(minimo, maximo) * 100)
+            k = cents // 2
+            itens.append({
+                "Item": f"{nome} {rng.randint(1, 999)}",
+                "Valor (R$)": cents / 100,
+                "Categoria": rng.choice(CATEGORIAS),
+                "Partes": {"Kristian": k, "Giulia": cents - k},
+            })
+        total += n
+        yield {
+            "data_compra": inicio + timedelta(days=rng.randint(0, dias)),
+            "loja": rng.choice(LOJAS),
+            "total_nota": sum(item["Valor (R$)"] for item in itens),
+            "pagador": rng.choice(PARTICIPANTES),
+            "forma_pagamento": rng.choice(PAGAMENTOS),
+            "itens": itens,
+        }
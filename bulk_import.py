@@ -0,0 +1,140 @@
+"""
+Importação em massa de notas (sem Streamlit).
+
+Uso:
+    python bulk_import.py caminho/das/notas --database-url postgresql://...
+
+Lê todos os PDFs da pasta em paralelo (um processo por núcleo), categoriza
+os itens com a memória aprendida + ExpenseManager, aplica a divisão atual
+e grava as notas em lotes (COPY no Postgres; sqlite:/// ou duckdb:/// também servem).
+Sem --database-url, usa a variável DATABASE_URL ou o secrets.toml do Streamlit.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from core import ExpenseManager
+from item_keys import NgramIndex, normalize_item_key
+from parser import InvoiceParser
+
+
+def _parse_file(pdf_path):
+    # Roda no processo filho: devolve (caminho, dados, erro)
+    try:
+        return pdf_path, InvoiceParser(pdf_path).parse(), None
+    except Exception as e:
+        return pdf_path, None, f"{type(e).__name__}: {e}"
+
+
+def build_invoice(data, core_manager, memoria):
+    """
+    Converte a saída do InvoiceParser no formato de nota do bulk_insert_invoices,
+    com as mesmas regras da tela de processamento (memória > palavra-chave, split_note).
+    `memoria` é um NgramIndex da memoria_itens (chave exata ou a mais parecida).
+    """
+    if not data.get("data"):
+        raise ValueError("data da nota não encontrada")
+    data_compra = datetime.strptime(data["data"], "%d/%m/%Y").date()
+
+    itens_raw = data.get("itens", [])
+    nomes = [str(item["item"]) for item in itens_raw]
+    palpites = core_manager.categorize_many(nomes)
+
+    itens = []
+    for item, nome, palpite in zip(itens_raw, nomes, palpites):
+        aprendida = memoria.best_match(normalize_item_key(nome))
+        itens.append({
+            "Item": nome,
+            "Valor (R$)": float(item.get("valor", 0.0) or 0.0),
+            "Categoria": aprendida[1] if aprendida else palpite,
+        })
+
+    partes = core_manager.split_note([i["Valor (R$)"] for i in itens], [i["Categoria"] for i in itens])
+    for item, cents in zip(itens, partes):
+        item["Partes"] = cents
+        item["R$ Kristian"] = cents.get("Kristian", 0) / 100
+        item["R$ Giulia"] = cents.get("Giulia", 0) / 100
+    if not itens:
+        raise ValueError("nenhum item identificado")
+
+    return {
+        "data_compra": data_compra,
+        "loja": data.get("loja") or "Loja não identificada",
+        "total_nota": float(sum(i["Valor (R$)"] for i in itens)),
+        "pagador": core_manager.identify_payer(data.get("cpf_consumidor")),
+        "forma_pagamento": data.get("forma_pagamento", "Indefinido"),
+        "itens": itens,
+        "chave_acesso": data.get("chave_acesso"),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Importa uma pasta de NFC-e (PDF) direto para o banco.")
+    ap.add_argument("pasta", help="Pasta com os PDFs")
+    ap.add_argument("--database-url", default=None)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--lote", type=int, default=500, help="Notas por COPY/transação")
+    ap.add_argument("--dry-run", action="store_true", help="Só lê e categoriza, não grava")
+    args = ap.parse_args(argv)
+
+    arquivos = sorted(
+        os.path.join(args.pasta, f) for f in os.listdir(args.pasta) if f.lower().endswith(".pdf")
+    )
+    if not arquivos:
+        print("Nenhum PDF encontrado.")
+        return 0
+
+    db_manager = None
+    memoria = NgramIndex()
+    if not args.dry_run:
+        from storage import open_storage, storage_url
+        db_manager = open_storage(storage_url(args.database_url))
+        memoria = db_manager.similarity_index()
+
+    core_manager = ExpenseManager()
+    falhas = []
+    lote = []
+    gravadas = 0
+    inicio = time.perf_counter()
+
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            chunksize = max(1, len(arquivos) // (args.workers * 8))
+            for pdf_path, data, erro in pool.map(_parse_file, arquivos, chunksize=chunksize):
+                if erro is None:
+                    try:
+                        lote.append(build_invoice(data, core_manager, memoria))
+                    except Exception as e:
+                        erro = f"{type(e).__name__}: {e}"
+                if erro is not None:
+                    falhas.append((pdf_path, erro))
+                    print(f"FALHA {pdf_path}: {erro}", file=sys.stderr)
+                    continue
+
+                if len(lote) >= args.lote:
+                    if db_manager:
+                        gravadas += db_manager.bulk_insert_invoices(lote)
+                    lote = []
+
+        if lote and db_manager:
+            gravadas += db_manager.bulk_insert_invoices(lote)
+    finally:
+        if db_manager:
+            db_manager.close()
+
+    duracao = time.perf_counter() - inicio
+    print(
+        f"{len(arquivos)} arquivos em {duracao:.2f}s "
+        f"({len(arquivos) / duracao:.1f} arquivos/s) | "
+        f"gravadas: {gravadas} | falhas: {len(falhas)}"
+        # Cupons com chave de acesso já salva (ou repetida na pasta) são pulados pelo banco
+        + (f" | já salvas: {len(arquivos) - len(falhas) - gravadas}" if db_manager else "")
+    )
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,8 @@
+from collections import deque
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
 
 
 @dataclass
@@ -8,10 +11,169 @@ class UserInfo:
     cpf: Optional[str] = None
 
 
+class KeywordAutomaton:
+    """
+    Autômato de Aho-Corasick sobre as palavras-chave das categorias.
+    Uma passada pelo nome do item encontra todas as palavras contidas nele,
+    não importa quantas palavras-chave existam. Cada palavra carrega o índice
+    (ordem no dict) da primeira categoria que a lista, e vence o menor índice:
+    a mesma precedência do loop categoria -> palavra do categorize_item.
+    """
+
+    _NONE = float("inf")
+
+    def __init__(self, categories: Dict[str, List[str]]) -> None:
+        self.category_names = list(categories)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._best: List[float] = [self._NONE]
+
+        for idx, keywords in enumerate(categories.values()):
+            for keyword in keywords:
+                state = 0
+                for ch in keyword:
+                    nxt = self._goto[state].get(ch)
+                    if nxt is None:
+                        nxt = len(self._goto)
+                        self._goto[state][ch] = nxt
+                        self._goto.append({})
+                        self._fail.append(0)
+                        self._best.append(self._NONE)
+                    state = nxt
+                self._best[state] = min(self._best[state], idx)
+
+        # Links de falha em largura; cada estado herda o melhor índice do seu sufixo
+        fila = deque(self._goto[0].values())
+        while fila:
+            state = fila.popleft()
+            for ch, nxt in self._goto[state].items():
+                fila.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._best[nxt] = min(self._best[nxt], self._best[self._fail[nxt]])
+
+    def match(self, text: str) -> Optional[str]:
+        """Categoria de maior precedência com alguma palavra contida em `text`."""
+        goto, fail, best_of = self._goto, self._fail, self._best
+        best = best_of[0]
+        state = 0
+        for ch in text:
+            if best == 0:
+                break
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if best_of[state] < best:
+                best = best_of[state]
+        return None if best == self._NONE else self.category_names[best]
+
+
+@dataclass
+class SplitRules:
+    """
+    Pesos da divisão por participante.
+    - default_weights: vale para todo item (vazio = partes iguais);
+    - category_weights: substitui o padrão nos itens daquela categoria.
+    Participante sem peso numa regra não paga nada daquele item.
+    """
+    default_weights: Dict[str, float] = field(default_factory=dict)
+    category_weights: Dict[str, Dict[str, float]] = field(default_factory=dict)
+
+
+class SplitEngine:
+    """
+    Divide uma nota inteira de uma vez, em centavos.
+    Monta a matriz itens x participantes de pesos, multiplica pelos valores e
+    distribui os centavos que sobram pelo maior resto (empate: o último
+    participante leva), então cada linha soma exatamente o valor do item.
+    """
+
+    def __init__(self, participants: Sequence[str], rules: Optional[SplitRules] = None) -> None:
+        self.participants = list(participants)
+        self.rules = rules or SplitRules()
+        self._index = {nome: i for i, nome in enumerate(self.participants)}
+        self._default = self._weights(self.rules.default_weights)
+        self._by_category = {
+            categoria: self._weights(pesos) for categoria, pesos in self.rules.category_weights.items()
+        }
+
+    def _weights(self, pesos: Optional[Dict[str, float]]) -> np.ndarray:
+        if not pesos:
+            return np.ones(len(self.participants))
+        vetor = np.zeros(len(self.participants))
+        for nome, peso in pesos.items():
+            if nome not in self._index:
+                raise ValueError(f"Participante desconhecido na regra de divisão: {nome}")
+            vetor[self._index[nome]] = peso
+        if vetor.sum() <= 0:
+            raise ValueError("Regra de divisão sem nenhum peso positivo")
+        return vetor
+
+    def split_cents(
+        self,
+        valores_cents: Sequence[int],
+        categorias: Sequence[str],
+        custom: Optional[Sequence[Optional[Dict[str, float]]]] = None,
+    ) -> np.ndarray:
+        """
+        Matriz (n_itens x n_participantes) de centavos.
+        `custom[i]`, se informado, substitui a regra do item i.
+        """
+        n = len(self.participants)
+        valores = np.asarray(valores_cents, dtype=np.int64)
+        if len(valores) == 0:
+            return np.zeros((0, n), dtype=np.int64)
+
+        linhas = []
+        for i, categoria in enumerate(categorias):
+            regra = custom[i] if custom is not None else None
+            linhas.append(self._weights(regra) if regra else self._by_category.get(categoria, self._default))
+        pesos = np.vstack(linhas)
+        pesos = pesos / pesos.sum(axis=1, keepdims=True)
+
+        exato = valores[:, None] * pesos
+        base = np.floor(exato).astype(np.int64)
+        sobra = valores - base.sum(axis=1)
+
+        # Ordem dos participantes por resto decrescente, varrendo de trás para frente
+        # para que, no empate, o centavo vá para o último
+        ordem = n - 1 - np.argsort(-(exato - base)[:, ::-1], axis=1, kind="stable")
+        extra = np.zeros_like(base)
+        np.put_along_axis(extra, ordem, (np.arange(n)[None, :] < sobra[:, None]).astype(np.int64), axis=1)
+        return base + extra
+
+    def split_note(
+        self,
+        valores: Sequence[float],
+        categorias: Sequence[str],
+        custom: Optional[Sequence[Optional[Dict[str, float]]]] = None,
+    ) -> List[Dict[str, int]]:
+        """Partes de cada item em centavos: [{participante: centavos}], na ordem dos itens."""
+        cents = np.rint(np.asarray(valores, dtype=float) * 100).astype(np.int64)
+        matriz = self.split_cents(cents, categorias, custom)
+        return [dict(zip(self.participants, map(int, linha))) for linha in matriz]
+
+
 @dataclass
 class ExpenseManagerConfig:
     users: Dict[str, UserInfo] = field(default_factory=dict)
     categories: Dict[str, List[str]] = field(default_factory=dict)
+    split_rules: SplitRules = field(default_factory=SplitRules)
+    keyword_index: KeywordAutomaton = field(init=False, repr=False, compare=False)
+    split_engine: SplitEngine = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        self.refresh_index()
+
+    def refresh_index(self) -> None:
+        """
+        Reconstrói o autômato e o motor de divisão; chamar se `categories`,
+        `users` ou `split_rules` forem alterados depois de criado.
+        """
+        self.keyword_index = KeywordAutomaton(self.categories)
+        self.split_engine = SplitEngine(list(self.users), self.split_rules)
 
 
 class ExpenseManager:
@@ -19,11 +181,17 @@ class ExpenseManager:
     Regras de negócio básicas:
     - Identificação de pagador a partir de CPF.
     - Sugestão de categoria com base em palavras-chave.
+    - Divisão dos itens entre os participantes (usuários da config).
     """
 
+    # Config padrão montada uma vez por processo (o autômato não é refeito a cada rerun)
+    _shared_default_config: Optional[ExpenseManagerConfig] = None
+
     def __init__(self, config: Optional[ExpenseManagerConfig] = None) -> None:
         if config is None:
-            config = self._default_config()
+            if ExpenseManager._shared_default_config is None:
+                ExpenseManager._shared_default_config = self._default_config()
+            config = ExpenseManager._shared_default_config
         self.config = config
 
     def _default_config(self) -> ExpenseManagerConfig:
@@ -102,11 +270,33 @@ class ExpenseManager:
         if not item_name:
             return "Geral"
 
-        item_upper = item_name.upper()
+        return self.config.keyword_index.match(item_name.upper()) or "Geral"
 
-        for category, keywords in self.config.categories.items():
-            for keyword in keywords:
-                if keyword in item_upper:
-                    return category
+    def categorize_many(self, item_names: Iterable[str]) -> List[str]:
+        """
+        categorize_item para uma lista de nomes (mesma ordem na saída).
+        Nomes repetidos são resolvidos uma vez só.
+        """
+        item_names = list(item_names)
+        resolvidos = {nome: self.categorize_item(nome) for nome in set(item_names)}
+        return [resolvidos[nome] for nome in item_names]
 
-        return "Geral"
+    # -------------------------
+    # Divisão do valor
+    # -------------------------
+    @property
+    def participants(self) -> List[str]:
+        return self.config.split_engine.participants
+
+    def split_note(
+        self,
+        valores: Sequence[float],
+        categorias: Sequence[str],
+        custom: Optional[Sequence[Optional[Dict[str, float]]]] = None,
+    ) -> List[Dict[str, int]]:
+        """
+        Divide todos os itens da nota de uma vez pelas split_rules da config
+        (padrão: partes iguais). Devolve {participante: centavos} por item;
+        o centavo que sobrar num empate fica com o último participante.
+        """
+        return self.config.split_engine.split_note(valores, categorias, custom)
@@ -1,14 +1,289 @@
-import psycopg2
-import psycopg2.extras
+import csv
+import functools
+import importlib.util
+import io
+import threading
+import time
+from collections import OrderedDict
 import pandas as pd
 import streamlit as st
 from datetime import datetime
 
+from db_pool import ConnectionPool, TracedRealDictCursor, execute_prepared
+from item_keys import NgramIndex, normalize_item_key
+from migrations import apply_migrations
+from storage import StorageBackend
+from tracing import span, traced
+
 # Não usamos mais arquivo local, usamos a URL da nuvem
 # A URL deve estar configurada no secrets.toml (local) ou nos Secrets do Streamlit Cloud
 
-class DatabaseManager:
-    def __init__(self):
+# Um pool por URL e por processo, compartilhado por todas as sessões/reruns.
+# As migrações (CREATE TABLE etc.) também rodam só uma vez por processo.
+_POOLS = {}
+_MEMORY_CACHES = {}
+_SIMILARITY_INDEXES = {}
+_RESULT_CACHES = {}
+_SCHEMA_READY = set()
+_POOLS_LOCK = threading.Lock()
+
+# --- RESUMO MENSAL (resumo_mensal) ---
+# Uma linha por participante e mês. O consumo vem de item_shares (centavos),
+# o pago na loja do pagador da nota e o Pix dos reembolsos.
+_RESUMO_COLUNAS = ("consumo", "pago_loja", "pix_enviado", "pix_recebido")
+
+# Contribuição de notas / reembolsos por (pessoa, mês), multiplicada por {sinal}
+# (+1 ao gravar, -1 antes de apagar). {filtro} escolhe as linhas.
+_RESUMO_NOTAS_SELECT = """
+    SELECT pessoa, mes, {sinal} * SUM(consumo) AS consumo, {sinal} * SUM(pago_loja) AS pago_loja,
+           0 AS pix_enviado, 0 AS pix_recebido
+    FROM (
+        SELECT p.nome AS pessoa, date_trunc('month', n.data_compra)::date AS mes,
+               s.cents / 100.0::float8 AS consumo, 0::float8 AS pago_loja
+        FROM notas n JOIN itens i ON i.nota_id = n.id
+        JOIN item_shares s ON s.item_id = i.id
+        JOIN participantes p ON p.id = s.participant_id
+        WHERE {filtro}
+        UNION ALL
+        SELECT p.nome, date_trunc('month', n.data_compra)::date, 0, i.valor::float8
+        FROM notas n JOIN itens i ON i.nota_id = n.id
+        JOIN participantes p ON p.nome = n.pagador
+        WHERE {filtro}
+    ) t
+    GROUP BY pessoa, mes
+"""
+_RESUMO_REEMBOLSOS_SELECT = """
+    SELECT pessoa, mes, 0 AS consumo, 0 AS pago_loja,
+           {sinal} * SUM(enviado) AS pix_enviado, {sinal} * SUM(recebido) AS pix_recebido
+    FROM (
+        SELECT r.pagador AS pessoa, date_trunc('month', r.data_pagamento)::date AS mes,
+               r.valor::float8 AS enviado, 0::float8 AS recebido
+        FROM reembolsos r WHERE {filtro}
+        UNION ALL
+        SELECT r.recebedor, date_trunc('month', r.data_pagamento)::date, 0, r.valor::float8
+        FROM reembolsos r WHERE {filtro}
+    ) t
+    JOIN participantes p ON p.nome = t.pessoa
+    GROUP BY pessoa, mes
+"""
+_RESUMO_UPSERT = """
+    INSERT INTO resumo_mensal (pessoa, mes, consumo, pago_loja, pix_enviado, pix_recebido)
+    {select}
+    ON CONFLICT (pessoa, mes) DO UPDATE SET
+        consumo = resumo_mensal.consumo + EXCLUDED.consumo,
+        pago_loja = resumo_mensal.pago_loja + EXCLUDED.pago_loja,
+        pix_enviado = resumo_mensal.pix_enviado + EXCLUDED.pix_enviado,
+        pix_recebido = resumo_mensal.pix_recebido + EXCLUDED.pix_recebido
+"""
+
+
+# Colunas dos itens filtrados do dashboard (tabela, CSV e exportação)
+FILTERED_ITEM_COLUMNS = (
+    "data_compra", "loja", "pagador", "forma_pagamento",
+    "item_nome", "categoria", "valor", "kristian_parte", "giulia_parte",
+)
+_FILTERED_ITEM_SQL = (
+    "n.data_compra", "n.loja", "n.pagador", "n.forma_pagamento",
+    "i.item_nome", "i.categoria", "i.valor", "i.kristian_parte", "i.giulia_parte",
+)
+
+
+# Tipos das colunas lidas via COPY (frame_from_copy): texto repetido vira
+# category, datas viram datetime64 e os REAL do banco ficam em float32.
+FINANCIAL_DTYPES = {
+    "nota_id": "int32",
+    "loja": "category",
+    "pagador": "category",
+    "forma_pagamento": "category",
+    "item_nome": "object",
+    "categoria": "category",
+    "valor": "float32",
+    "kristian_parte": "float32",
+    "giulia_parte": "float32",
+}
+REIMBURSEMENT_DTYPES = {
+    "id": "int32",
+    "pagador": "category",
+    "recebedor": "category",
+    "valor": "float32",
+    "comprovante": "object",
+}
+
+
+_CSV_ENGINE = "pyarrow" if importlib.util.find_spec("pyarrow") else "c"
+# Marcador de NULL do COPY: no CSV padrão o NULL sai vazio e o pandas não
+# distingue isso de uma string vazia ('' ficaria NaN). Um texto igual ao
+# próprio marcador também seria lido como NULL, mas isso não aparece em nota
+COPY_NULL = r"\N"
+
+
+def frame_from_copy(buf, dtype=None, dates=()):
+    """
+    DataFrame a partir da saída de um COPY ... TO STDOUT (CSV com cabeçalho).
+    O parser do pandas já cria as colunas com o tipo final, sem passar por um
+    objeto Python por célula como o read_sql_query. Com o pyarrow instalado
+    (opcional) usa o parser multithread dele, cerca de 2x mais rápido.
+    Só o COPY_NULL vira NaN: textos como "NA", "None", "null" ou "" ficam
+    como estão (a lista padrão de NA do pandas fica desligada).
+    """
+    buf.seek(0)
+    df = pd.read_csv(buf, dtype=dtype, engine=_CSV_ENGINE, keep_default_na=False, na_values=[COPY_NULL])
+    if _CSV_ENGINE == "pyarrow":
+        # O pyarrow só aplica na_values em colunas de texto quando "" também é
+        # nulo; nelas o marcador chega como texto e é trocado aqui
+        for coluna in df.columns:
+            serie = df[coluna]
+            if isinstance(serie.dtype, pd.CategoricalDtype):
+                if COPY_NULL in serie.cat.categories:
+                    df[coluna] = serie.cat.remove_categories([COPY_NULL])
+            elif not pd.api.types.is_numeric_dtype(serie.dtype):
+                nulos = serie == COPY_NULL
+                if nulos.any():
+                    df[coluna] = serie.mask(nulos)
+    for coluna in dates:
+        df[coluna] = pd.to_datetime(df[coluna], format="ISO8601")
+    return df
+
+
+class LearnedCategoryCache:
+    """
+    Cópia parcial da memoria_itens em memória (por chave normalizada), limitada por LRU.
+    Também guarda quem NÃO foi aprendido (None), para não voltar ao banco
+    a cada rerun por causa dos mesmos itens. Só é atualizada depois do
+    commit das escritas (learn_item / save_invoice).
+    """
+
+    def __init__(self, max_items=20000):
+        self.max_items = max_items
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, nomes):
+        """Devolve (encontrados {nome: categoria ou None}, nomes que faltam no cache)."""
+        encontrados = {}
+        faltando = []
+        with self._lock:
+            for nome in nomes:
+                if nome in self._data:
+                    self._data.move_to_end(nome)
+                    encontrados[nome] = self._data[nome]
+                else:
+                    faltando.append(nome)
+        return encontrados, faltando
+
+    def put_many(self, categorias):
+        with self._lock:
+            for nome, categoria in categorias.items():
+                self._data[nome] = categoria
+                self._data.move_to_end(nome)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def invalidate(self, nomes=None):
+        with self._lock:
+            if nomes is None:
+                self._data.clear()
+            else:
+                for nome in nomes:
+                    self._data.pop(nome, None)
+
+
+class ResultCache:
+    """
+    Resultados das leituras (DataFrames e listas) por (consulta, parâmetros),
+    válidos só para a geração de dados em que foram lidos. Toda escrita do
+    DatabaseManager chama bump() depois do commit, então um rerun sem mudança
+    não volta ao banco e uma mudança nunca devolve dado velho.
+    `max_age` (segundos) cobre escritas feitas por outro processo (ex.: bulk_import).
+    """
+
+    def __init__(self, max_entries=64, max_age=300.0):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """(True, valor) se houver resultado válido para a geração atual; senão (False, None)."""
+        with self._lock:
+            entrada = self._data.get(key)
+            if entrada is not None:
+                generation, lido_em, valor = entrada
+                if generation == self.generation and time.monotonic() - lido_em < self.max_age:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return True, valor
+                del self._data[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, valor, generation):
+        # `generation` é a de antes da leitura: se alguém escreveu no meio, descarta
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._data[key] = (generation, time.monotonic(), valor)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def bump(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "generation": self.generation,
+                "entries": len(self._data),
+            }
+
+
+def _copy_result(valor):
+    # Quem chama pode alterar o que recebe (ex.: colunas novas no DataFrame)
+    if isinstance(valor, pd.DataFrame):
+        return valor.copy()
+    if isinstance(valor, tuple):
+        return tuple(_copy_result(v) for v in valor)
+    if isinstance(valor, list):
+        return [_copy_result(v) for v in valor]
+    if isinstance(valor, dict):
+        return {k: _copy_result(v) for k, v in valor.items()}
+    return valor
+
+
+def cached_read(metodo):
+    """Leitura do DatabaseManager servida pelo ResultCache quando nada mudou."""
+    @functools.wraps(metodo)
+    def wrapper(self, *args, **kwargs):
+        key = (metodo.__name__, args, tuple(sorted(kwargs.items())))
+        with span(metodo.__qualname__, "db") as s:
+            achou, valor = self.result_cache.get(key)
+            s["cache"] = achou
+            if not achou:
+                generation = self.result_cache.generation
+                valor = metodo(self, *args, **kwargs)
+                self.result_cache.put(key, valor, generation)
+            if isinstance(valor, (pd.DataFrame, list)):
+                s["linhas"] = len(valor)
+            return _copy_result(valor)
+    return wrapper
+
+
+class DatabaseManager(StorageBackend):
+    """Backend de produção: Postgres com pool de conexões (storage.StorageBackend)."""
+
+    def __init__(self, db_url=None):
+        # db_url explícito = uso fora do Streamlit (CLI): erros sobem como exceção
+        headless = db_url is not None
         try:
             # Busca a conexão nos segredos do Streamlit
             # Formato esperado no secrets:
@@ -25,216 +300,834 @@ class DatabaseManager:
             # self.conn = st.connection("postgresql", type="sql").session 
             # Mas para manter compatibilidade com seu código atual, vamos usar psycopg2 direto:
             
-            db_url = st.secrets["DATABASE_URL"]
-            self.conn = psycopg2.connect(db_url)
-            self.conn.autocommit = False # Controle manual de transação igual fazíamos antes
-            self._create_tables()
+            if db_url is None:
+                db_url = st.secrets["DATABASE_URL"]
+            self.db_url = db_url
+
+            with _POOLS_LOCK:
+                if db_url not in _POOLS:
+                    _POOLS[db_url] = ConnectionPool(db_url)
+                    _MEMORY_CACHES[db_url] = LearnedCategoryCache()
+                    _RESULT_CACHES[db_url] = ResultCache()
+                self.pool = _POOLS[db_url]
+                self.memory_cache = _MEMORY_CACHES[db_url]
+                self.result_cache = _RESULT_CACHES[db_url]
+
+                if db_url not in _SCHEMA_READY:
+                    self._create_tables()
+                    _SCHEMA_READY.add(db_url)
             
         except Exception as e:
+            if headless:
+                raise
             st.error(f"Erro ao conectar no Banco de Dados: {e}")
             st.stop()
 
-    def _get_cursor(self):
+    def _connection(self):
+        # Empresta uma conexão do pool pelo tempo do bloco `with`
+        return self.pool.connection()
+
+    def _get_cursor(self, conn):
         # RealDictCursor faz o Postgres devolver dicionários igual o pandas gosta
-        return self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        return conn.cursor(cursor_factory=TracedRealDictCursor)
+
+    def _read_frame(self, conn, query, params=None, dtype=None, dates=()):
+        # Leitura rápida: COPY (SELECT ...) TO STDOUT num buffer, parseado direto com tipos
+        cur = conn.cursor()
+        try:
+            sql = cur.mogrify(query, params).decode("utf-8") if params else query
+            buf = io.BytesIO()
+            cur.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER true, NULL '{COPY_NULL}')", buf)
+        finally:
+            cur.close()
+        return frame_from_copy(buf, dtype, dates)
 
     def _create_tables(self):
-        cur = self.conn.cursor()
-        
-        # Tabela Notas (SERIAL é o autoincrement do Postgres)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS notas (
-                id SERIAL PRIMARY KEY,
-                data_compra TEXT NOT NULL,
-                loja TEXT NOT NULL,
-                total_nota REAL NOT NULL,
-                pagador TEXT NOT NULL,
-                forma_pagamento TEXT, 
-                data_registro TEXT NOT NULL
-            );
-        """)
-        
-        # Tabela Itens
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS itens (
-                id SERIAL PRIMARY KEY,
-                nota_id INTEGER NOT NULL,
-                item_nome TEXT NOT NULL,
-                valor REAL NOT NULL,
-                categoria TEXT NOT NULL,
-                kristian_parte REAL NOT NULL,
-                giulia_parte REAL NOT NULL,
-                FOREIGN KEY (nota_id) REFERENCES notas(id) ON DELETE CASCADE
-            );
-        """)
-        
-        # Tabela Reembolsos
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS reembolsos (
-                id SERIAL PRIMARY KEY,
-                data_pagamento TEXT NOT NULL,
-                pagador TEXT NOT NULL,
-                recebedor TEXT NOT NULL,
-                valor REAL NOT NULL,
-                comprovante TEXT,
-                data_registro TEXT NOT NULL
-            );
-        """)
-        
-        # Tabela Memória (Aprendizado)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS memoria_itens (
-                item_nome TEXT PRIMARY KEY,
-                categoria TEXT NOT NULL,
-                ultima_atualizacao TEXT
-            );
-        """)
-        
-        self.conn.commit()
-        cur.close()
+        # Schema versionado: cria as tabelas e aplica os passos pendentes (migrations.py)
+        with self._connection() as conn:
+            apply_migrations(conn)
 
     # --- FUNÇÕES DE APRENDIZADO ---
-    def get_learned_category(self, item_nome):
-        cur = self.conn.cursor()
-        cur.execute("SELECT categoria FROM memoria_itens WHERE item_nome = %s", (item_nome,))
-        result = cur.fetchone()
-        cur.close()
-        return result[0] if result else None
-
-    def learn_item(self, item_nome, categoria):
-        data_hoje = datetime.now().date()
-        cur = self.conn.cursor()
-        cur.execute(
+    # A memória é indexada pela chave normalizada (item_keys.normalize_item_key),
+    # tanto para gravar quanto para consultar: peso, código e acento não contam.
+    def similarity_index(self):
+        """
+        Índice de n-gramas de toda a memoria_itens, carregado uma vez por processo
+        (na primeira consulta que precisar) e mantido em dia pelas escritas.
+        """
+        with _POOLS_LOCK:
+            indice = _SIMILARITY_INDEXES.get(self.db_url)
+        if indice is None:
+            indice = NgramIndex()
+            indice.add_many(self.get_learned_memory().items())
+            with _POOLS_LOCK:
+                indice = _SIMILARITY_INDEXES.setdefault(self.db_url, indice)
+        return indice
+
+    @traced(tipo="db")
+    def get_learned_categories(self, nomes, similar=True):
+        """
+        Categoria aprendida de vários itens de uma vez: {nome: categoria}.
+        Itens nunca aprendidos ficam de fora. O que não está no cache é
+        resolvido numa única consulta (= ANY) em vez de uma por item.
+        Com `similar`, chaves sem registro exato usam a mais parecida do
+        índice de n-gramas, se passar do limiar.
+        """
+        chaves = {nome: normalize_item_key(nome) for nome in dict.fromkeys(nomes)}
+        unicas = [c for c in dict.fromkeys(chaves.values()) if c]
+        encontrados, faltando = self.memory_cache.get_many(unicas)
+
+        if faltando:
+            with self._connection() as conn:
+                cur = conn.cursor()
+                execute_prepared(
+                    cur, "get_learned_categories",
+                    "SELECT item_chave, categoria FROM memoria_itens WHERE item_chave = ANY($1)",
+                    (faltando,),
+                )
+                do_banco = dict(cur.fetchall())
+                cur.close()
+            novos = {chave: do_banco.get(chave) for chave in faltando}
+            self.memory_cache.put_many(novos)
+            encontrados.update(novos)
+
+        resultado = {}
+        indice = None
+        for nome, chave in chaves.items():
+            categoria = encontrados.get(chave)
+            if categoria is None and similar and chave:
+                if indice is None:
+                    indice = self.similarity_index()
+                parecido = indice.best_match(chave)
+                if parecido:
+                    categoria = parecido[1]
+            if categoria is not None:
+                resultado[nome] = categoria
+        return resultado
+
+    def get_learned_memory(self):
+        # Memória inteira de uma vez (chave normalizada -> categoria), para importações em massa
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT item_chave, categoria FROM memoria_itens")
+            memoria = dict(cur.fetchall())
+            cur.close()
+        return memoria
+
+    def _upsert_memory(self, cur, categorias, data_hoje):
+        """
+        Um único INSERT ... ON CONFLICT para todos os itens (sem commit aqui).
+        Devolve {chave: categoria} do que foi gravado, para atualizar os caches
+        depois do commit. Nomes com a mesma chave viram uma linha só (vale o
+        último), já que o Postgres recusa atualizar a mesma linha duas vezes.
+        """
+        por_chave = {}
+        for nome, categoria in categorias.items():
+            chave = normalize_item_key(nome)
+            if chave:
+                por_chave[chave] = (nome, categoria)
+        if not por_chave:
+            return {}
+        execute_prepared(
+            cur, "upsert_memoria_itens",
             """
-            INSERT INTO memoria_itens (item_nome, categoria, ultima_atualizacao)
-            VALUES (%s, %s, %s)
-            ON CONFLICT (item_nome)
-            DO UPDATE SET categoria = EXCLUDED.categoria,
-                          ultima_atualizacao = EXCLUDED.ultima_atualizacao;
+            INSERT INTO memoria_itens (item_chave, item_nome, categoria, ultima_atualizacao)
+            SELECT chave, nome, cat, $4
+            FROM unnest($1::text[], $2::text[], $3::text[]) AS t(chave, nome, cat)
+            ON CONFLICT (item_chave)
+            DO UPDATE SET item_nome = EXCLUDED.item_nome,
+                          categoria = EXCLUDED.categoria,
+                          ultima_atualizacao = EXCLUDED.ultima_atualizacao
             """,
-            (item_nome, categoria, data_hoje),
+            (
+                list(por_chave.keys()),
+                [nome for nome, _ in por_chave.values()],
+                [cat for _, cat in por_chave.values()],
+                data_hoje,
+            ),
         )
-        self.conn.commit()
-        cur.close()
+        return {chave: cat for chave, (_, cat) in por_chave.items()}
 
+    def _remember(self, aprendidas):
+        # Só depois do commit: cache LRU e índice de semelhança (se já carregado)
+        self.memory_cache.put_many(aprendidas)
+        with _POOLS_LOCK:
+            indice = _SIMILARITY_INDEXES.get(self.db_url)
+        if indice is not None:
+            indice.add_many(aprendidas.items())
+
+    @traced(tipo="db")
+    def learn_items(self, categorias):
+        """Ensina várias categorias ({nome: categoria}) num comando e num commit só."""
+        data_hoje = datetime.now().date()
+        with self._connection() as conn:
+            cur = conn.cursor()
+            aprendidas = self._upsert_memory(cur, categorias, data_hoje)
+            conn.commit()
+            self.result_cache.bump()
+            cur.close()
+        self._remember(aprendidas)
 
     # --- SALVAR NOTA ---
-    def save_invoice(self, data_nota, loja, total_nota, pagador, forma_pagamento, itens_processados):
+    @traced(tipo="db")
+    def save_invoice(self, data_nota, loja, total_nota, pagador, forma_pagamento, itens_processados, chave_acesso=None):
         # data_nota vem como string "dd/mm/YYYY" da UI: converte para date
         data_compra_date = datetime.strptime(data_nota, "%d/%m/%Y").date()
         data_registro = datetime.now()  # datetime completo
-        cur = self.conn.cursor()
-        try:
-            cur.execute(
-                """
-                INSERT INTO notas (data_compra, loja, total_nota, pagador, forma_pagamento, data_registro)
-                VALUES (%s, %s, %s, %s, %s, %s) RETURNING id;
-                """,
-                (data_compra_date, loja, total_nota, pagador, forma_pagamento, data_registro),
-            )
+        with self._connection() as conn:
+            cur = conn.cursor()
+            try:
+                # Cupom já salvo (mesma chave de acesso): recusa antes de gravar qualquer coisa.
+                # O índice único cobre a corrida entre duas abas salvando ao mesmo tempo
+                if chave_acesso and self._existing_access_keys(cur, [chave_acesso]):
+                    conn.rollback()
+                    cur.close()
+                    st.error("Esta nota já foi salva (mesma chave de acesso).")
+                    return False
+                execute_prepared(
+                    cur, "insert_nota_chave",
+                    """
+                    INSERT INTO notas (data_compra, loja, total_nota, pagador, forma_pagamento, data_registro, chave_acesso)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7) RETURNING id
+                    """,
+                    (data_compra_date, loja, total_nota, pagador, forma_pagamento, data_registro, chave_acesso),
+                )
             
-            nota_id = cur.fetchone()[0] # Pega o ID gerado
-
-            item_list = []
-            for item in itens_processados:
-                # Salva na lista para insert em lote
-                item_list.append((nota_id, item['Item'], item['Valor (R$)'], item['Categoria'], item['R$ Kristian'], item['R$ Giulia']))
-                
-                # Ensina o robô (um por um pois é rápido)
-                self.learn_item(item['Item'], item['Categoria'])
-
-            # Insert em lote no Postgres
-            args_str = ','.join(cur.mogrify("(%s,%s,%s,%s,%s,%s)", x).decode('utf-8') for x in item_list)
-            cur.execute("INSERT INTO itens (nota_id, item_nome, valor, categoria, kristian_parte, giulia_parte) VALUES " + args_str)
+                nota_id = cur.fetchone()[0] # Pega o ID gerado
+
+                # Ids dos itens reservados antes, para ligar as partes sem depender do RETURNING
+                item_ids = self._reserve_ids(cur, "itens", len(itens_processados))
+
+                item_list = []
+                partes = []
+                categorias = {}
+                for item_id, item in zip(item_ids, itens_processados):
+                    cents = self._item_shares(item)
+                    # Salva na lista para insert em lote
+                    item_list.append((
+                        item_id, nota_id, item['Item'], item['Valor (R$)'], item['Categoria'],
+                        cents.get("Kristian", 0) / 100, cents.get("Giulia", 0) / 100,
+                    ))
+                    partes.append((item_id, cents))
+                    # Se o item aparece duas vezes, vale a última categoria escolhida
+                    categorias[item['Item']] = item['Categoria']
+
+                # Insert em lote no Postgres
+                if item_list:
+                    args_str = ','.join(cur.mogrify("(%s,%s,%s,%s,%s,%s,%s)", x).decode('utf-8') for x in item_list)
+                    cur.execute("INSERT INTO itens (id, nota_id, item_nome, valor, categoria, kristian_parte, giulia_parte) VALUES " + args_str)
+                self._insert_shares(cur, partes)
+                self._apply_invoice_summary(cur, [nota_id], 1)
+
+                # Ensina o robô na mesma transação: a nota inteira é um commit só
+                aprendidas = self._upsert_memory(cur, categorias, data_registro.date())
             
-            self.conn.commit()
-            cur.close()
-            return True
-        except Exception as e:
-            self.conn.rollback()
+                conn.commit()
+                self.result_cache.bump()
+                cur.close()
+                self._remember(aprendidas)
+                return True
+            except Exception as e:
+                conn.rollback()
+                cur.close()
+                st.error(f"Erro ao salvar nota: {e}")
+                return False
+
+    def _existing_access_keys(self, cur, chaves):
+        # Das chaves de acesso informadas, as que já estão em alguma nota (idx_notas_chave_acesso)
+        cur.execute("SELECT chave_acesso FROM notas WHERE chave_acesso = ANY(%s)", (list(chaves),))
+        return {row[0] for row in cur.fetchall()}
+
+
+    # --- PARTES POR PARTICIPANTE (item_shares) ---
+    def _reserve_ids(self, cur, tabela, n):
+        # Reserva n ids na sequence da tabela (ligar filhos aos pais sem RETURNING)
+        if n <= 0:
+            return []
+        cur.execute(
+            f"SELECT nextval(pg_get_serial_sequence('{tabela}', 'id')) FROM generate_series(1, %s)",
+            (n,),
+        )
+        return [row[0] for row in cur.fetchall()]
+
+    def _participant_ids(self, cur, nomes):
+        # {nome: id} dos participantes, cadastrando quem ainda não existe
+        nomes = sorted(set(nomes))
+        if not nomes:
+            return {}
+        cur.execute(
+            "INSERT INTO participantes (nome) SELECT unnest(%s::text[]) ON CONFLICT (nome) DO NOTHING",
+            (nomes,),
+        )
+        cur.execute("SELECT nome, id FROM participantes WHERE nome = ANY(%s)", (nomes,))
+        return dict(cur.fetchall())
+
+    def _insert_shares(self, cur, partes):
+        # partes: [(item_id, {participante: centavos})]; partes zeradas não viram linha
+        ids = self._participant_ids(cur, [nome for _, cents in partes for nome in cents])
+        linhas = [
+            (item_id, ids[nome], valor)
+            for item_id, cents in partes for nome, valor in cents.items() if valor
+        ]
+        if not linhas:
+            return
+        item_ids, participant_ids, valores = zip(*linhas)
+        execute_prepared(
+            cur, "insert_item_shares",
+            """
+            INSERT INTO item_shares (item_id, participant_id, cents)
+            SELECT * FROM unnest($1::int[], $2::int[], $3::bigint[])
+            """,
+            (list(item_ids), list(participant_ids), list(valores)),
+        )
+
+    def get_participants(self):
+        # Nomes dos participantes, na ordem de cadastro
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT nome FROM participantes ORDER BY id")
+            nomes = [row[0] for row in cur.fetchall()]
             cur.close()
-            import streamlit as st
-            st.error(f"Erro ao salvar nota: {e}")
-            return False
+        return nomes
+
+    # --- IMPORTAÇÃO EM MASSA (COPY) ---
+    @traced(tipo="db")
+    def bulk_insert_invoices(self, notas, learn=False, skipped=None):
+        """
+        Grava várias notas de uma vez com COPY, numa única transação.
+        Cada nota é um dict com data_compra (date), loja, total_nota, pagador,
+        forma_pagamento e itens (mesmo formato de itens_processados do save_invoice).
+        Os ids são reservados antes na sequence para ligar itens às notas sem RETURNING.
+        Notas com "chave" (idempotência, save_queue.py) já gravadas são puladas, e
+        também as com "chave_acesso" de um cupom já salvo (ou repetida no lote);
+        com `learn`, as categorias dos itens são ensinadas na mesma transação.
+        Devolve quantas notas foram gravadas (as puladas vão para `skipped`).
+        """
+        if not notas:
+            return 0
+
+        data_registro = datetime.now()
+        with self._connection() as conn:
+            cur = conn.cursor()
+            try:
+                chaves = [nota["chave"] for nota in notas if nota.get("chave")]
+                ja_gravadas = set()
+                if chaves:
+                    cur.execute("SELECT chave FROM gravacoes WHERE chave = ANY(%s)", (chaves,))
+                    ja_gravadas = {row[0] for row in cur.fetchall()}
+                acessos = {nota["chave_acesso"] for nota in notas if nota.get("chave_acesso")}
+                acessos_salvos = self._existing_access_keys(cur, acessos) if acessos else set()
+                puladas = []
+                notas = self._split_known(notas, ja_gravadas, acessos_salvos, puladas)
+                if not notas:
+                    conn.rollback()
+                    cur.close()
+                    if skipped is not None:
+                        skipped.extend(puladas)
+                    return 0
+
+                ids = self._reserve_ids(cur, "notas", len(notas))
+                item_ids = iter(self._reserve_ids(cur, "itens", sum(len(nota["itens"]) for nota in notas)))
+
+                buf_notas = io.StringIO()
+                buf_itens = io.StringIO()
+                buf_partes = io.StringIO()
+                w_notas = csv.writer(buf_notas)
+                w_itens = csv.writer(buf_itens)
+                w_partes = csv.writer(buf_partes)
+                participantes = {}
+                for nota_id, nota in zip(ids, notas):
+                    w_notas.writerow((
+                        nota_id, nota["data_compra"], nota["loja"], nota["total_nota"],
+                        nota["pagador"], nota["forma_pagamento"], data_registro, nota.get("chave_acesso"),
+                    ))
+                    for item in nota["itens"]:
+                        item_id = next(item_ids)
+                        cents = self._item_shares(item)
+                        w_itens.writerow((
+                            item_id, nota_id, item['Item'], item['Valor (R$)'], item['Categoria'],
+                            cents.get("Kristian", 0) / 100, cents.get("Giulia", 0) / 100,
+                        ))
+                        for nome, valor in cents.items():
+                            if valor:
+                                if nome not in participantes:
+                                    participantes.update(self._participant_ids(cur, [nome]))
+                                w_partes.writerow((item_id, participantes[nome], valor))
 
+                buf_notas.seek(0)
+                buf_itens.seek(0)
+                buf_partes.seek(0)
+                cur.copy_expert(
+                    "COPY notas (id, data_compra, loja, total_nota, pagador, forma_pagamento, data_registro, chave_acesso) "
+                    "FROM STDIN WITH (FORMAT csv)",
+                    buf_notas,
+                )
+                cur.copy_expert(
+                    "COPY itens (id, nota_id, item_nome, valor, categoria, kristian_parte, giulia_parte) "
+                    "FROM STDIN WITH (FORMAT csv)",
+                    buf_itens,
+                )
+                cur.copy_expert(
+                    "COPY item_shares (item_id, participant_id, cents) FROM STDIN WITH (FORMAT csv)",
+                    buf_partes,
+                )
+                # Chaves das notas que sobraram (as puladas não entram de novo)
+                linhas_chaves = [
+                    (nota["chave"], nota_id, data_registro) for nota_id, nota in zip(ids, notas) if nota.get("chave")
+                ]
+                if linhas_chaves:
+                    args_str = ','.join(cur.mogrify("(%s,%s,%s)", linha).decode('utf-8') for linha in linhas_chaves)
+                    cur.execute("INSERT INTO gravacoes (chave, nota_id, gravada_em) VALUES " + args_str)
+                self._apply_invoice_summary(cur, ids, 1)
+                aprendidas = {}
+                if learn:
+                    aprendidas = self._upsert_memory(
+                        cur, {item['Item']: item['Categoria'] for nota in notas for item in nota["itens"]},
+                        data_registro.date(),
+                    )
+                conn.commit()
+                self.result_cache.bump()
+                cur.close()
+                self._remember(aprendidas)
+                if skipped is not None:
+                    skipped.extend(puladas)
+                return len(notas)
+            except Exception:
+                conn.rollback()
+                cur.close()
+                raise
 
     # --- SALVAR REEMBOLSO ---
+    @traced(tipo="db")
     def save_reimbursement(self, pagador, recebedor, valor):
         data_hoje = datetime.now().date()
         data_registro = datetime.now()
-        cur = self.conn.cursor()
-        try:
-            cur.execute(
-                """
-                INSERT INTO reembolsos (data_pagamento, pagador, recebedor, valor, data_registro)
-                VALUES (%s, %s, %s, %s, %s);
-                """,
-                (data_hoje, pagador, recebedor, valor, data_registro),
-            )
-            self.conn.commit()
-            cur.close()
-            return True
-        except Exception as e:
-            self.conn.rollback()
+        with self._connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute(
+                    """
+                    INSERT INTO reembolsos (data_pagamento, pagador, recebedor, valor, data_registro)
+                    VALUES (%s, %s, %s, %s, %s) RETURNING id;
+                    """,
+                    (data_hoje, pagador, recebedor, valor, data_registro),
+                )
+                self._apply_reimbursement_summary(cur, [cur.fetchone()[0]], 1)
+                conn.commit()
+                self.result_cache.bump()
+                cur.close()
+                return True
+            except Exception as e:
+                conn.rollback()
+                cur.close()
+                return False
+
+    # --- RESUMO MENSAL ---
+    # Mantido na mesma transação de cada escrita: soma (+1) depois de inserir,
+    # subtrai (-1) antes de apagar. Nunca dá commit sozinho.
+    def _apply_invoice_summary(self, cur, nota_ids, sinal):
+        execute_prepared(
+            cur, "resumo_notas",
+            _RESUMO_UPSERT.format(select=_RESUMO_NOTAS_SELECT.format(sinal="$2::float8", filtro="n.id = ANY($1)")),
+            (list(nota_ids), sinal),
+        )
+
+    def _apply_reimbursement_summary(self, cur, reembolso_ids, sinal):
+        execute_prepared(
+            cur, "resumo_reembolsos",
+            _RESUMO_UPSERT.format(select=_RESUMO_REEMBOLSOS_SELECT.format(sinal="$2::float8", filtro="r.id = ANY($1)")),
+            (list(reembolso_ids), sinal),
+        )
+
+    @cached_read
+    def get_balance_summary(self):
+        """
+        Totais acumulados de cada participante, numa consulta agrupada sobre o resumo_mensal:
+        {pessoa: {"consumo", "pago_loja", "pix_enviado", "pix_recebido", "saldo"}}.
+        saldo > 0: a pessoa tem a receber; saldo < 0: a pessoa deve.
+        """
+        totais = {}
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT p.nome, COALESCE(SUM(r.consumo), 0), COALESCE(SUM(r.pago_loja), 0),
+                       COALESCE(SUM(r.pix_enviado), 0), COALESCE(SUM(r.pix_recebido), 0)
+                FROM participantes p LEFT JOIN resumo_mensal r ON r.pessoa = p.nome
+                GROUP BY p.id, p.nome
+                ORDER BY p.id
+            """)
+            for pessoa, *valores in cur.fetchall():
+                linha = dict(zip(_RESUMO_COLUNAS, map(float, valores)))
+                linha["saldo"] = linha["pago_loja"] + linha["pix_enviado"] - linha["pix_recebido"] - linha["consumo"]
+                totais[pessoa] = linha
             cur.close()
-            return False
+        return totais
+
+    def check_summaries(self, repair=False, tolerancia=0.005):
+        """
+        Confere o resumo_mensal contra um recálculo completo a partir de notas/itens/reembolsos.
+        Devolve as linhas divergentes [(pessoa, mes, coluna, gravado, esperado)].
+        Com repair=True, reconstrói a tabela inteira numa transação se houver divergência.
+        """
+        esperado_sql = f"""
+            SELECT pessoa, mes, SUM(consumo) AS consumo, SUM(pago_loja) AS pago_loja,
+                   SUM(pix_enviado) AS pix_enviado, SUM(pix_recebido) AS pix_recebido
+            FROM ({_RESUMO_NOTAS_SELECT.format(sinal="1", filtro="TRUE")}
+                  UNION ALL
+                  {_RESUMO_REEMBOLSOS_SELECT.format(sinal="1", filtro="TRUE")}) t
+            GROUP BY pessoa, mes
+        """
+        with self._connection() as conn:
+            cur = conn.cursor()
+            try:
+                if repair:
+                    # Trava as escritas concorrentes entre a conferência e a reconstrução
+                    cur.execute("LOCK TABLE resumo_mensal IN EXCLUSIVE MODE")
+                cur.execute(f"""
+                    SELECT COALESCE(e.pessoa, r.pessoa), COALESCE(e.mes, r.mes),
+                           {", ".join(f"COALESCE(r.{c}, 0), COALESCE(e.{c}, 0)" for c in _RESUMO_COLUNAS)}
+                    FROM ({esperado_sql}) e
+                    FULL OUTER JOIN resumo_mensal r ON r.pessoa = e.pessoa AND r.mes = e.mes
+                """)
+                divergencias = []
+                for pessoa, mes, *valores in cur.fetchall():
+                    for i, coluna in enumerate(_RESUMO_COLUNAS):
+                        gravado, esperado = float(valores[2 * i]), float(valores[2 * i + 1])
+                        if abs(gravado - esperado) > tolerancia:
+                            divergencias.append((pessoa, mes, coluna, gravado, esperado))
+
+                if repair and divergencias:
+                    cur.execute("DELETE FROM resumo_mensal")
+                    cur.execute(
+                        "INSERT INTO resumo_mensal (pessoa, mes, consumo, pago_loja, pix_enviado, pix_recebido) "
+                        + esperado_sql
+                    )
+                    conn.commit()
+                    self.result_cache.bump()
+                cur.close()
+                return divergencias
+            except Exception:
+                conn.rollback()
+                cur.close()
+                raise
 
     # --- LEITURA DE DADOS ---
+    @cached_read
     def get_financial_data(self):
         query_notas = """
             SELECT n.id as nota_id, n.data_compra, n.loja, n.pagador, n.forma_pagamento,
                 i.item_nome, i.categoria, i.valor, i.kristian_parte, i.giulia_parte
             FROM notas n JOIN itens i ON n.id = i.nota_id
         """
-        # Pandas lê direto do Postgres se tiver a conexão
-        df_compras = pd.read_sql_query(query_notas, self.conn)
-        df_reembolsos = pd.read_sql_query("SELECT * FROM reembolsos", self.conn)
+        # COPY em CSV direto para o parser do pandas, já com os tipos compactos
+        with self._connection() as conn:
+            df_compras = self._read_frame(conn, query_notas, dtype=FINANCIAL_DTYPES, dates=("data_compra",))
+            df_reembolsos = self._read_frame(
+                conn,
+                "SELECT id, data_pagamento, pagador, recebedor, valor, comprovante, data_registro FROM reembolsos",
+                dtype=REIMBURSEMENT_DTYPES,
+                dates=("data_pagamento", "data_registro"),
+            )
         return df_compras, df_reembolsos
     
+    # --- CONSULTAS DO DASHBOARD (filtros e agregações no banco) ---
+    def _dashboard_filters(self, data_inicio=None, data_fim=None, categoria=None, loja=None):
+        # WHERE comum das consultas do dashboard; None (ou "Todas") = sem filtro
+        condicoes, params = [], []
+        if data_inicio is not None:
+            condicoes.append("n.data_compra >= %s")
+            params.append(data_inicio)
+        if data_fim is not None:
+            condicoes.append("n.data_compra <= %s")
+            params.append(data_fim)
+        if categoria and categoria != "Todas":
+            condicoes.append("i.categoria = %s")
+            params.append(categoria)
+        if loja and loja != "Todas":
+            condicoes.append("n.loja = %s")
+            params.append(loja)
+        where = " AND ".join(condicoes) or "TRUE"
+        return where, params
+
+    @cached_read
+    def get_filter_options(self):
+        """
+        Valores dos filtros do dashboard sem ler o histórico:
+        {"min_data", "max_data", "categorias", "lojas"} (datas None se não há compras).
+        """
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT MIN(n.data_compra), MAX(n.data_compra) FROM notas n
+                WHERE EXISTS (SELECT 1 FROM itens i WHERE i.nota_id = n.id)
+            """)
+            min_data, max_data = cur.fetchone()
+            cur.execute("SELECT DISTINCT categoria FROM itens ORDER BY categoria")
+            categorias = [row[0] for row in cur.fetchall()]
+            cur.execute("SELECT DISTINCT loja FROM notas ORDER BY loja")
+            lojas = [row[0] for row in cur.fetchall()]
+            cur.close()
+        return {"min_data": min_data, "max_data": max_data, "categorias": categorias, "lojas": lojas}
+
+    @cached_read
+    def get_spending_by_category(self, data_inicio=None, data_fim=None, categoria=None, loja=None):
+        # Uma linha por categoria: colunas categoria, valor
+        where, params = self._dashboard_filters(data_inicio, data_fim, categoria, loja)
+        query = f"""
+            SELECT i.categoria, SUM(i.valor::float8) AS valor
+            FROM notas n JOIN itens i ON n.id = i.nota_id
+            WHERE {where}
+            GROUP BY i.categoria
+        """
+        with self._connection() as conn:
+            return self._read_frame(conn, query, params, dtype={"valor": "float64"})
+
+    @cached_read
+    def get_spending_by_date(self, data_inicio=None, data_fim=None, categoria=None, loja=None):
+        # Uma linha por dia, em ordem: colunas data_compra (datetime64), valor
+        where, params = self._dashboard_filters(data_inicio, data_fim, categoria, loja)
+        query = f"""
+            SELECT n.data_compra, SUM(i.valor::float8) AS valor
+            FROM notas n JOIN itens i ON n.id = i.nota_id
+            WHERE {where}
+            GROUP BY n.data_compra
+            ORDER BY n.data_compra
+        """
+        with self._connection() as conn:
+            return self._read_frame(conn, query, params, dtype={"valor": "float64"}, dates=("data_compra",))
+
+    @cached_read
+    def get_filtered_items(self, data_inicio=None, data_fim=None, categoria=None, loja=None):
+        # Itens que passam nos filtros (tabela e CSV do dashboard)
+        where, params = self._dashboard_filters(data_inicio, data_fim, categoria, loja)
+        query = f"""
+            SELECT {", ".join(_FILTERED_ITEM_SQL)}
+            FROM notas n JOIN itens i ON n.id = i.nota_id
+            WHERE {where}
+            ORDER BY n.data_compra, n.id, i.id
+        """
+        with self._connection() as conn:
+            return self._read_frame(conn, query, params, dtype=FINANCIAL_DTYPES, dates=("data_compra",))
+
+    def iter_filtered_items(self, data_inicio=None, data_fim=None, categoria=None, loja=None, chunk_size=5000):
+        """
+        Mesmos itens do get_filtered_items, em blocos de até `chunk_size` tuplas,
+        lidos de um cursor nomeado (server-side): a memória não cresce com o total.
+        Colunas na ordem de FILTERED_ITEM_COLUMNS.
+        """
+        where, params = self._dashboard_filters(data_inicio, data_fim, categoria, loja)
+        with self._connection() as conn:
+            cur = conn.cursor(name=f"export_itens_{threading.get_ident()}")
+            cur.itersize = chunk_size
+            try:
+                cur.execute(
+                    f"""
+                    SELECT {", ".join(_FILTERED_ITEM_SQL)}
+                    FROM notas n JOIN itens i ON n.id = i.nota_id
+                    WHERE {where}
+                    ORDER BY n.data_compra, n.id, i.id
+                    """,
+                    params,
+                )
+                while True:
+                    linhas = cur.fetchmany(chunk_size)
+                    if not linhas:
+                        break
+                    yield linhas
+            finally:
+                cur.close()
+
+    @cached_read
     def get_all_invoices(self):
-        cur = self._get_cursor() # Usa cursor de dicionário
-        cur.execute("SELECT id, data_compra, loja, total_nota, pagador FROM notas ORDER BY data_compra DESC")
-        res = cur.fetchall()
-        cur.close()
+        with self._connection() as conn:
+            cur = self._get_cursor(conn) # Usa cursor de dicionário
+            cur.execute("SELECT id, data_compra, loja, total_nota, pagador FROM notas ORDER BY data_compra DESC")
+            res = cur.fetchall()
+            cur.close()
         # Converte para lista de dicts puros se necessário, mas RealDictCursor já ajuda
         return [dict(row) for row in res]
 
+    @traced(tipo="db")
+    def find_invoices_by_access_keys(self, chaves):
+        # Sem cache: a checagem de duplicidade precisa ver a nota salva há um instante
+        chaves = [chave for chave in chaves if chave]
+        if not chaves:
+            return {}
+        with self._connection() as conn:
+            cur = self._get_cursor(conn)
+            cur.execute(
+                "SELECT chave_acesso, id, data_compra, loja, total_nota FROM notas WHERE chave_acesso = ANY(%s)",
+                (chaves,),
+            )
+            res = cur.fetchall()
+            cur.close()
+        return {row["chave_acesso"]: {k: row[k] for k in ("id", "data_compra", "loja", "total_nota")} for row in res}
+
+    @cached_read
     def get_all_reimbursements(self):
-        cur = self._get_cursor()
-        cur.execute("SELECT id, data_pagamento, pagador, recebedor, valor FROM reembolsos ORDER BY data_pagamento DESC")
-        res = cur.fetchall()
-        cur.close()
+        with self._connection() as conn:
+            cur = self._get_cursor(conn)
+            cur.execute("SELECT id, data_pagamento, pagador, recebedor, valor FROM reembolsos ORDER BY data_pagamento DESC")
+            res = cur.fetchall()
+            cur.close()
         return [dict(row) for row in res]
 
-    # --- DELETAR ---
-    def delete_invoice(self, note_id):
-        cur = self.conn.cursor()
-        try:
-            # No Postgres, se configurarmos ON DELETE CASCADE na chave estrangeira,
-            # apagar a nota apaga os itens automaticamente. Mas vamos garantir:
-            cur.execute("DELETE FROM itens WHERE nota_id = %s", (note_id,))
-            cur.execute("DELETE FROM notas WHERE id = %s", (note_id,))
-            self.conn.commit()
-            cur.close()
-            return True
-        except:
-            self.conn.rollback()
+    # --- HISTÓRICO PAGINADO (keyset) ---
+    # Páginas em ordem decrescente de (data, id): a próxima página começa logo
+    # depois da última linha da anterior, sem OFFSET, e usa os índices de data.
+    @cached_read
+    def get_invoice_days(self, data_inicio=None, data_fim=None, loja=None, before=None, limit=20):
+        """
+        Uma página de dias com notas: ([{data_compra, n_notas, total}], cursor da próxima página ou None).
+        `before` é o cursor devolvido pela página anterior (a data do último dia).
+        """
+        where, params = self._dashboard_filters(data_inicio, data_fim, None, loja)
+        if before is not None:
+            where += " AND n.data_compra < %s"
+            params.append(before)
+        with self._connection() as conn:
+            cur = self._get_cursor(conn)
+            cur.execute(
+                f"""
+                SELECT n.data_compra, COUNT(*) AS n_notas, SUM(n.total_nota::float8) AS total
+                FROM notas n WHERE {where}
+                GROUP BY n.data_compra
+                ORDER BY n.data_compra DESC
+                LIMIT %s
+                """,
+                params + [limit + 1],
+            )
+            dias = [dict(row) for row in cur.fetchall()]
             cur.close()
-            return False
+        proximo = dias[limit - 1]["data_compra"] if len(dias) > limit else None
+        return dias[:limit], proximo
 
-    def delete_reimbursement(self, reimb_id):
-        cur = self.conn.cursor()
-        try:
-            cur.execute("DELETE FROM reembolsos WHERE id = %s", (reimb_id,))
-            self.conn.commit()
+    @cached_read
+    def get_invoices_page(self, data_inicio=None, data_fim=None, loja=None, after=None, limit=50):
+        """
+        Uma página de notas: ([{id, data_compra, loja, total_nota, pagador}], cursor ou None).
+        `after` é o cursor (data_compra, id) devolvido pela página anterior.
+        """
+        where, params = self._dashboard_filters(data_inicio, data_fim, None, loja)
+        if after is not None:
+            where += " AND (n.data_compra, n.id) < (%s, %s)"
+            params.extend(after)
+        with self._connection() as conn:
+            cur = self._get_cursor(conn)
+            cur.execute(
+                f"""
+                SELECT n.id, n.data_compra, n.loja, n.total_nota, n.pagador
+                FROM notas n WHERE {where}
+                ORDER BY n.data_compra DESC, n.id DESC
+                LIMIT %s
+                """,
+                params + [limit + 1],
+            )
+            notas = [dict(row) for row in cur.fetchall()]
             cur.close()
-            return True
-        except:
-            self.conn.rollback()
+        proximo = (notas[limit - 1]["data_compra"], notas[limit - 1]["id"]) if len(notas) > limit else None
+        return notas[:limit], proximo
+
+    @cached_read
+    def get_reimbursements_page(self, after=None, limit=20):
+        """
+        Uma página de reembolsos: ([{id, data_pagamento, pagador, recebedor, valor}], cursor ou None).
+        `after` é o cursor (data_pagamento, id) devolvido pela página anterior.
+        """
+        where, params = "TRUE", []
+        if after is not None:
+            where = "(data_pagamento, id) < (%s, %s)"
+            params.extend(after)
+        with self._connection() as conn:
+            cur = self._get_cursor(conn)
+            cur.execute(
+                f"""
+                SELECT id, data_pagamento, pagador, recebedor, valor FROM reembolsos
+                WHERE {where}
+                ORDER BY data_pagamento DESC, id DESC
+                LIMIT %s
+                """,
+                params + [limit + 1],
+            )
+            reembolsos = [dict(row) for row in cur.fetchall()]
             cur.close()
-            return False
+        proximo = (
+            (reembolsos[limit - 1]["data_pagamento"], reembolsos[limit - 1]["id"])
+            if len(reembolsos) > limit else None
+        )
+        return reembolsos[:limit], proximo
 
-    def close(self):
+    # --- DELETAR ---
+    # Um DELETE por lote (id = ANY): itens e item_shares saem pelo ON DELETE CASCADE.
+    # O resumo_mensal é descontado antes, na mesma transação.
+    @traced(tipo="db")
+    def delete_invoices(self, note_ids):
+        """Apaga várias notas de uma vez; devolve quantas foram apagadas (0 se falhar)."""
+        note_ids = sorted({int(n) for n in note_ids})
+        if not note_ids:
+            return 0
+        with self._connection() as conn:
+            cur = conn.cursor()
+            try:
+                # Trava as notas antes de calcular o que sai do resumo: outra sessão apagando
+                # as mesmas espera o COMMIT e depois não as encontra mais (não subtrai duas vezes)
+                cur.execute("SELECT id FROM notas WHERE id = ANY(%s) ORDER BY id FOR UPDATE", (note_ids,))
+                note_ids = [row[0] for row in cur.fetchall()]
+                if not note_ids:
+                    conn.rollback()
+                    cur.close()
+                    return 0
+                self._apply_invoice_summary(cur, note_ids, -1)
+                cur.execute("DELETE FROM notas WHERE id = ANY(%s)", (note_ids,))
+                apagadas = cur.rowcount
+                conn.commit()
+                self.result_cache.bump()
+                cur.close()
+                return apagadas
+            except Exception as e:
+                conn.rollback()
+                cur.close()
+                st.error(f"Erro ao excluir notas: {e}")
+                return 0
 
-        self.conn.close()
+    @traced(tipo="db")
+    def delete_reimbursements(self, reimb_ids):
+        """Apaga vários reembolsos de uma vez; devolve quantos foram apagados (0 se falhar)."""
+        reimb_ids = sorted({int(r) for r in reimb_ids})
+        if not reimb_ids:
+            return 0
+        with self._connection() as conn:
+            cur = conn.cursor()
+            try:
+                # Mesma trava das notas: o resumo só perde o que esta sessão apagar
+                cur.execute("SELECT id FROM reembolsos WHERE id = ANY(%s) ORDER BY id FOR UPDATE", (reimb_ids,))
+                reimb_ids = [row[0] for row in cur.fetchall()]
+                if not reimb_ids:
+                    conn.rollback()
+                    cur.close()
+                    return 0
+                self._apply_reimbursement_summary(cur, reimb_ids, -1)
+                cur.execute("DELETE FROM reembolsos WHERE id = ANY(%s)", (reimb_ids,))
+                apagados = cur.rowcount
+                conn.commit()
+                self.result_cache.bump()
+                cur.close()
+                return apagados
+            except Exception as e:
+                conn.rollback()
+                cur.close()
+                st.error(f"Erro ao excluir reembolsos: {e}")
+                return 0
 
+    def cache_stats(self):
+        # Acertos/erros do cache de leituras (ResultCache) deste processo
+        return self.result_cache.stats()
+
+    def close(self):
+        # Fecha o pool do processo inteiro (usado pela CLI ao terminar).
+        # No app o pool vive enquanto o servidor estiver de pé.
+        with _POOLS_LOCK:
+            _POOLS.pop(self.db_url, None)
+            _SIMILARITY_INDEXES.pop(self.db_url, None)
+            _SCHEMA_READY.discard(self.db_url)
+        self.pool.closeall()
@@ -0,0 +1,187 @@
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.extras
+import psycopg2.pool
+
+from tracing import span
+
+_RE_ESPACOS = re.compile(r'\s+')
+
+
+def _sql_rotulo(sql):
+    # SQL numa linha só e curto; os valores dos parâmetros não entram (o COPY já chega montado)
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", errors="replace")
+    texto = _RE_ESPACOS.sub(" ", str(sql)).strip()
+    return texto if len(texto) <= 160 else texto[:157] + "..."
+
+
+class _TracedQueries:
+    """Cada execute/copy vira um span "query" no rerun ativo (tracing.py), com as linhas afetadas."""
+
+    def execute(self, query, vars=None):
+        with span("query", "query", sql=_sql_rotulo(query)) as s:
+            try:
+                return super().execute(query, vars)
+            finally:
+                s["linhas"] = self.rowcount if self.rowcount >= 0 else None
+
+    def copy_expert(self, sql, file, size=8192):
+        with span("copy", "query", sql=_sql_rotulo(sql)) as s:
+            try:
+                return super().copy_expert(sql, file, size)
+            finally:
+                s["linhas"] = self.rowcount if self.rowcount >= 0 else None
+
+
+class TracedCursor(_TracedQueries, psycopg2.extensions.cursor):
+    pass
+
+
+class TracedRealDictCursor(_TracedQueries, psycopg2.extras.RealDictCursor):
+    pass
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """
+    Conexão do pool com um pouco de estado extra:
+    - quais statements já foram preparados (PREPARE) nesta sessão;
+    - se a sessão já perdeu statements alguma vez (DISCARD ALL, pooler externo);
+    - quando foi devolvida pela última vez (para o health check).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = TracedCursor
+        self.prepared = set()
+        self.lost_statements = False
+        self.last_used = time.monotonic()
+
+
+class ConnectionPool:
+    """
+    Pool de conexões thread-safe e bloqueante.
+    O ThreadedConnectionPool do psycopg2 estoura PoolError quando acaba;
+    aqui um semáforo faz a thread esperar (até `timeout`) por uma conexão livre.
+    No checkout, conexões fechadas são trocadas e conexões paradas há mais de
+    `ping_after` segundos passam por um ping antes de serem entregues; o ping
+    lê pg_prepared_statements e acerta o registro de statements da conexão.
+    """
+
+    def __init__(self, db_url, minconn=1, maxconn=8, timeout=30.0, ping_after=30.0):
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._pool = psycopg2.pool.ThreadedConnectionPool(
+            minconn, maxconn, db_url, connection_factory=PooledConnection
+        )
+
+    def _healthy(self, conn):
+        if conn.closed:
+            return False
+        if time.monotonic() - conn.last_used < self.ping_after:
+            return True
+        try:
+            # O ping é a lista de statements da sessão: o que sumiu (DISCARD ALL,
+            # reinício do pooler) sai do registro e é preparado de novo no próximo uso
+            cur = conn.cursor()
+            cur.execute("SELECT name FROM pg_prepared_statements")
+            conn.prepared &= {row[0] for row in cur.fetchall()}
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise psycopg2.pool.PoolError("Tempo esgotado esperando uma conexão livre do pool")
+        try:
+            for _ in range(3):
+                conn = self._pool.getconn()
+                conn.autocommit = False # Controle manual de transação
+                if self._healthy(conn):
+                    return conn
+                self._pool.putconn(conn, close=True)
+            raise psycopg2.OperationalError("Não foi possível obter uma conexão saudável do pool")
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, broken=False):
+        try:
+            if not broken and not conn.closed:
+                # Leituras deixam a transação aberta: encerra antes de devolver
+                if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                conn.last_used = time.monotonic()
+        except psycopg2.Error:
+            broken = True
+        finally:
+            self._pool.putconn(conn, close=broken or conn.closed)
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, broken=broken)
+
+    def closeall(self):
+        self._pool.closeall()
+
+
+def execute_prepared(cur, name, sql, params):
+    """
+    Executa `sql` (com placeholders $1, $2...) como statement preparado no servidor.
+    O PREPARE acontece só na primeira vez em cada conexão do pool
+    (statements preparados valem para a sessão, não para a transação).
+    O EXECUTE é uma ida ao servidor só. Se a sessão perdeu o statement mesmo
+    assim (o ping do pool costuma pegar antes), prepara de novo e repete:
+    direto, fora de transação; numa transação, só conexões que já perderam
+    statements antes pagam um savepoint para poder voltar até aqui.
+    """
+    conn = cur.connection
+    ocioso = conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    if name not in conn.prepared:
+        cur.execute(f"PREPARE {name} AS {sql}")
+        conn.prepared.add(name)
+    execute = f"EXECUTE {name} ({', '.join(['%s'] * len(params))})"
+
+    # Savepoint num cursor à parte, para não trocar o resultado do EXECUTE em `cur`
+    protegido = conn.lost_statements and not ocioso
+    if protegido:
+        with conn.cursor() as aux:
+            aux.execute("SAVEPOINT execute_prepared")
+    try:
+        cur.execute(execute, params)
+    except psycopg2.errors.InvalidSqlStatementName:
+        # Quem perde um statement perdeu todos (DISCARD ALL / DEALLOCATE ALL)
+        conn.prepared.clear()
+        conn.lost_statements = True
+        if protegido:
+            with conn.cursor() as aux:
+                aux.execute("ROLLBACK TO SAVEPOINT execute_prepared")
+        elif ocioso:
+            conn.rollback()
+        else:
+            # Transação já abortada: o erro sobe; as próximas desta conexão vêm protegidas
+            raise
+        cur.execute(f"PREPARE {name} AS {sql}")
+        conn.prepared.add(name)
+        cur.execute(execute, params)
+    if protegido:
+        with conn.cursor() as aux:
+            aux.execute("RELEASE SAVEPOINT execute_prepared")
@@ -0,0 +1,113 @@
+"""
+Exportação dos itens (com os filtros do dashboard) em CSV ou Parquet.
+
+As linhas vêm em blocos (cursor nomeado no Postgres, keyset nos backends
+embutidos) e cada bloco é escrito no destino assim que chega: a memória
+fica estável não importa o tamanho da exportação. O dashboard usa
+export_items(); fora do app:
+    python export.py saida.parquet --inicio 2024-01-01 --fim 2024-12-31 --loja "MERCADO X"
+O formato sai da extensão (.csv / .parquet) ou de --formato.
+Parquet precisa do pyarrow (opcional, só para este formato).
+"""
+import argparse
+import csv
+import io
+import os
+from datetime import date
+
+from database import FILTERED_ITEM_COLUMNS
+from storage import open_storage
+
+FORMATOS = ("csv", "parquet")
+
+
+def _write_csv(blocos, arquivo):
+    # arquivo binário; datas em dd/mm/YYYY como o CSV antigo do dashboard
+    texto = io.TextIOWrapper(arquivo, encoding="utf-8", newline="")
+    writer = csv.writer(texto)
+    writer.writerow(FILTERED_ITEM_COLUMNS)
+    total = 0
+    for linhas in blocos:
+        writer.writerows(
+            (linha[0].strftime("%d/%m/%Y"),) + tuple(linha[1:]) for linha in linhas
+        )
+        total += len(linhas)
+    texto.flush()
+    texto.detach() # Devolve o arquivo binário sem fechá-lo
+    return total
+
+
+def _write_parquet(blocos, arquivo):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Exportar em Parquet precisa do pacote pyarrow (pip install pyarrow)") from e
+
+    texto = pa.string()
+    numero = pa.float64()
+    schema = pa.schema([
+        ("data_compra", pa.date32()), ("loja", texto), ("pagador", texto),
+        ("forma_pagamento", texto), ("item_nome", texto), ("categoria", texto),
+        ("valor", numero), ("kristian_parte", numero), ("giulia_parte", numero),
+    ])
+    total = 0
+    with pq.ParquetWriter(arquivo, schema, compression="zstd") as writer:
+        for linhas in blocos:
+            colunas = list(zip(*linhas))
+            writer.write_batch(pa.RecordBatch.from_arrays(
+                [pa.array(col, type=campo.type) for col, campo in zip(colunas, schema)],
+                schema=schema,
+            ))
+            total += len(linhas)
+    return total
+
+
+def export_items(db_manager, destino, formato="csv", chunk_size=5000, **filtros):
+    """
+    Escreve os itens filtrados (data_inicio, data_fim, categoria, loja) em `destino`,
+    um caminho ou um arquivo binário aberto. Devolve quantas linhas foram escritas.
+    """
+    formato = formato.lower()
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconhecido: {formato} (use {' ou '.join(FORMATOS)})")
+
+    blocos = db_manager.iter_filtered_items(chunk_size=chunk_size, **filtros)
+    escrever = _write_csv if formato == "csv" else _write_parquet
+
+    if isinstance(destino, (str, os.PathLike)):
+        with open(destino, "wb") as arquivo:
+            return escrever(blocos, arquivo)
+    return escrever(blocos, destino)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Exporta os itens (com filtros) em CSV ou Parquet.")
+    ap.add_argument("saida", help="Arquivo de saída (.csv ou .parquet)")
+    ap.add_argument("--formato", choices=FORMATOS, default=None)
+    ap.add_argument("--inicio", type=date.fromisoformat, default=None, help="Data inicial (YYYY-MM-DD)")
+    ap.add_argument("--fim", type=date.fromisoformat, default=None, help="Data final (YYYY-MM-DD)")
+    ap.add_argument("--categoria", default=None)
+    ap.add_argument("--loja", default=None)
+    ap.add_argument("--bloco", type=int, default=5000, help="Linhas por bloco lido do banco")
+    ap.add_argument("--database-url", default=os.environ.get("DATABASE_URL"))
+    args = ap.parse_args(argv)
+    if not args.database_url:
+        ap.error("informe --database-url ou a variável DATABASE_URL")
+
+    formato = args.formato or ("parquet" if args.saida.lower().endswith(".parquet") else "csv")
+
+    db_manager = open_storage(args.database_url)
+    try:
+        total = export_items(
+            db_manager, args.saida, formato, chunk_size=args.bloco,
+            data_inicio=args.inicio, data_fim=args.fim, categoria=args.categoria, loja=args.loja,
+        )
+    finally:
+        db_manager.close()
+    print(f"{total} itens exportados para {args.saida} ({formato})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
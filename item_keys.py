@@ -0,0 +1,99 @@
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+# Pesos/volumes/unidades que o parser deixa no nome ("0,500 KG", "350ML", "12 UN")
+_RE_MEDIDA = re.compile(
+    r'\b\d+(?:[.,]\d+)?\s*(?:KG|KGS|G|GR|GRS|MG|L|LT|LTS|ML|UN|UND|UNID|PCT|PC|CX|DZ|M|CM|MM)\b'
+)
+# Unidade solta no fim do nome ("PAO FRANCES KG")
+_RE_UNIDADE_FINAL = re.compile(r'(?:\s(?:KG|KGS|LT|LTS|ML|UN|UND|UNID|PCT|CX))+$')
+_RE_DIGITO_LETRA = re.compile(r'(?<=\d)(?=[A-Z])|(?<=[A-Z])(?=\d)')
+_RE_NUMERO_SOLTO = re.compile(r'\b\d+(?:[.,]\d+)*\b') # Códigos de produto e números avulsos
+_RE_NAO_ALFANUM = re.compile(r'[^A-Z0-9 ]+')
+_RE_ESPACOS = re.compile(r'\s+')
+
+
+def normalize_item_key(item_nome: Optional[str]) -> str:
+    """
+    Chave canônica de um item para a memória de categorias.
+    "6675 Banana Prata 0,500KG" e "BANANA  PRATA 0,480 KG" viram "BANANA PRATA":
+    maiúsculas, sem acentos, sem pesos/unidades, sem códigos e com espaço único.
+    Usada tanto ao gravar quanto ao consultar memoria_itens; se mudar,
+    as chaves gravadas precisam ser refeitas num passo novo de migrations.py.
+    """
+    if not item_nome:
+        return ""
+    texto = unicodedata.normalize("NFKD", str(item_nome).upper())
+    texto = "".join(ch for ch in texto if not unicodedata.combining(ch))
+    texto = _RE_DIGITO_LETRA.sub(" ", texto)
+    texto = _RE_MEDIDA.sub(" ", texto)
+    texto = _RE_NUMERO_SOLTO.sub(" ", texto)
+    texto = _RE_NAO_ALFANUM.sub(" ", texto)
+    texto = _RE_ESPACOS.sub(" ", texto).strip()
+    return _RE_UNIDADE_FINAL.sub("", texto)
+
+
+def _ngrams(chave: str, n: int) -> Set[str]:
+    texto = f" {chave} "
+    if len(texto) <= n:
+        return {texto}
+    return {texto[i:i + n] for i in range(len(texto) - n + 1)}
+
+
+class NgramIndex:
+    """
+    Índice invertido de n-gramas de caracteres sobre as chaves aprendidas.
+    Busca por semelhança (coeficiente de Dice) olhando só as chaves que
+    compartilham algum n-grama com a consulta, sem varrer a tabela inteira.
+    """
+
+    def __init__(self, n: int = 3, threshold: float = 0.75) -> None:
+        self.n = n
+        self.threshold = threshold
+        self._categorias: Dict[str, str] = {}
+        self._grams: Dict[str, Set[str]] = {}
+        self._postings: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._categorias)
+
+    def add(self, chave: str, categoria: str) -> None:
+        if not chave:
+            return
+        with self._lock:
+            self._categorias[chave] = categoria
+            if chave in self._grams:
+                return
+            grams = _ngrams(chave, self.n)
+            self._grams[chave] = grams
+            for g in grams:
+                self._postings.setdefault(g, set()).add(chave)
+
+    def add_many(self, itens: Iterable[Tuple[str, str]]) -> None:
+        for chave, categoria in itens:
+            self.add(chave, categoria)
+
+    def best_match(self, chave: str, threshold: Optional[float] = None) -> Optional[Tuple[str, str, float]]:
+        """(chave parecida, categoria, semelhança) acima do limiar, ou None."""
+        if not chave:
+            return None
+        limiar = self.threshold if threshold is None else threshold
+        grams = _ngrams(chave, self.n)
+
+        with self._lock:
+            if chave in self._categorias:
+                return chave, self._categorias[chave], 1.0
+
+            comuns: Counter = Counter()
+            for g in grams:
+                comuns.update(self._postings.get(g, ()))
+            melhor = None
+            for candidata, n_comuns in comuns.items():
+                dice = 2.0 * n_comuns / (len(grams) + len(self._grams[candidata]))
+                if dice >= limiar and (melhor is None or dice > melhor[2]):
+                    melhor = (candidata, self._categorias[candidata], dice)
+        return melhor
@@ -0,0 +1,346 @@
+"""
+Migrações versionadas do schema.
+
+Cada passo tem um número, uma descrição e uma função que recebe o cursor.
+apply_migrations() roda, em ordem, só os passos que ainda não constam em
+schema_migrations, cada um na mesma transação que grava sua versão.
+Os passos também são idempotentes por conta própria (IF NOT EXISTS,
+conferência do tipo atual da coluna), então rodar de novo nunca quebra.
+
+Para aplicar fora do app:
+    python migrations.py --database-url postgresql://...
+Para conferir (e, com --reparar, reconstruir) o resumo_mensal:
+    python migrations.py --verificar-resumo [--reparar]
+"""
+import argparse
+import os
+
+import psycopg2
+import psycopg2.extras
+
+from item_keys import normalize_item_key
+
+# Chave do pg_advisory_xact_lock: dois processos subindo juntos não migram em paralelo
+_LOCK_KEY = 4815162342
+
+
+def _column_type(cur, tabela, coluna):
+    cur.execute(
+        """
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s
+        """,
+        (tabela, coluna),
+    )
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _m001_tabelas_iniciais(cur):
+    # Tabela Notas (SERIAL é o autoincrement do Postgres)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS notas (
+            id SERIAL PRIMARY KEY,
+            data_compra TEXT NOT NULL,
+            loja TEXT NOT NULL,
+            total_nota REAL NOT NULL,
+            pagador TEXT NOT NULL,
+            forma_pagamento TEXT,
+            data_registro TEXT NOT NULL
+        );
+    """)
+
+    # Tabela Itens
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS itens (
+            id SERIAL PRIMARY KEY,
+            nota_id INTEGER NOT NULL,
+            item_nome TEXT NOT NULL,
+            valor REAL NOT NULL,
+            categoria TEXT NOT NULL,
+            kristian_parte REAL NOT NULL,
+            giulia_parte REAL NOT NULL,
+            FOREIGN KEY (nota_id) REFERENCES notas(id) ON DELETE CASCADE
+        );
+    """)
+
+    # Tabela Reembolsos
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS reembolsos (
+            id SERIAL PRIMARY KEY,
+            data_pagamento TEXT NOT NULL,
+            pagador TEXT NOT NULL,
+            recebedor TEXT NOT NULL,
+            valor REAL NOT NULL,
+            comprovante TEXT,
+            data_registro TEXT NOT NULL
+        );
+    """)
+
+    # Tabela Memória (Aprendizado)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS memoria_itens (
+            item_nome TEXT PRIMARY KEY,
+            categoria TEXT NOT NULL,
+            ultima_atualizacao TEXT
+        );
+    """)
+
+
+# Textos antigos podem estar em "dd/mm/YYYY" (versões antigas do app)
+# ou em ISO (psycopg2 gravando date/datetime numa coluna TEXT).
+_PARA_DATE = """
+    CASE WHEN {col} ~ '^\\d{{2}}/\\d{{2}}/\\d{{4}}' THEN to_date(substr({col}, 1, 10), 'DD/MM/YYYY')
+         ELSE {col}::date END
+"""
+_PARA_TIMESTAMP = """
+    CASE WHEN {col} ~ '^\\d{{2}}/\\d{{2}}/\\d{{4}}$' THEN to_date({col}, 'DD/MM/YYYY')::timestamp
+         WHEN {col} ~ '^\\d{{2}}/\\d{{2}}/\\d{{4}}' THEN to_timestamp({col}, 'DD/MM/YYYY HH24:MI:SS')::timestamp
+         ELSE {col}::timestamp END
+"""
+
+
+def _m002_datas_tipadas(cur):
+    colunas = [
+        ("notas", "data_compra", "DATE", _PARA_DATE),
+        ("notas", "data_registro", "TIMESTAMP", _PARA_TIMESTAMP),
+        ("reembolsos", "data_pagamento", "DATE", _PARA_DATE),
+        ("reembolsos", "data_registro", "TIMESTAMP", _PARA_TIMESTAMP),
+        ("memoria_itens", "ultima_atualizacao", "DATE", _PARA_DATE),
+    ]
+    for tabela, coluna, tipo, conversao in colunas:
+        if _column_type(cur, tabela, coluna) != "text":
+            continue
+        cur.execute(
+            f"ALTER TABLE {tabela} ALTER COLUMN {coluna} TYPE {tipo} "
+            f"USING ({conversao.format(col=coluna)})"
+        )
+
+
+def _m003_indices(cur):
+    # Filtros por período/loja/categoria e o JOIN nota -> itens
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_itens_nota_id ON itens (nota_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_itens_categoria ON itens (categoria)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_notas_data_compra ON notas (data_compra, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_notas_loja_data ON notas (loja, data_compra)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_reembolsos_data_pagamento ON reembolsos (data_pagamento, id)")
+
+
+def _m004_chave_normalizada(cur):
+    # memoria_itens passa a ser indexada pela chave canônica (item_keys.normalize_item_key).
+    # item_nome fica só como o último nome "cru" visto para aquela chave.
+    # Se o normalizador mudar, re-chavear num passo novo; este fica como está.
+    if _column_type(cur, "memoria_itens", "item_chave") is not None:
+        return
+    cur.execute("ALTER TABLE memoria_itens ADD COLUMN item_chave TEXT")
+
+    # Nomes que viram a mesma chave: fica a categoria aprendida mais recentemente.
+    # Nomes sem chave (só código/peso) nunca mais seriam encontrados: saem.
+    cur.execute("""
+        SELECT item_nome FROM memoria_itens
+        ORDER BY ultima_atualizacao NULLS FIRST, item_nome
+    """)
+    vencedores = {}
+    for (nome,) in cur.fetchall():
+        chave = normalize_item_key(nome)
+        if chave:
+            vencedores[chave] = nome
+
+    cur.execute(
+        "DELETE FROM memoria_itens WHERE NOT (item_nome = ANY(%s))",
+        (list(vencedores.values()),),
+    )
+    if vencedores:
+        psycopg2.extras.execute_values(
+            cur,
+            """
+            UPDATE memoria_itens m SET item_chave = v.chave
+            FROM (VALUES %s) AS v(nome, chave) WHERE m.item_nome = v.nome
+            """,
+            [(nome, chave) for chave, nome in vencedores.items()],
+        )
+    cur.execute("ALTER TABLE memoria_itens DROP CONSTRAINT IF EXISTS memoria_itens_pkey")
+    cur.execute("ALTER TABLE memoria_itens ALTER COLUMN item_chave SET NOT NULL")
+    cur.execute("ALTER TABLE memoria_itens ADD PRIMARY KEY (item_chave)")
+
+
+def _m005_resumo_mensal(cur):
+    # Totais por pessoa e mês (consumo, pago na loja, Pix enviado/recebido) mantidos
+    # pelas escritas do DatabaseManager; o "Balanço Atual" lê só estas linhas.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS resumo_mensal (
+            pessoa TEXT NOT NULL,
+            mes DATE NOT NULL,
+            consumo DOUBLE PRECISION NOT NULL DEFAULT 0,
+            pago_loja DOUBLE PRECISION NOT NULL DEFAULT 0,
+            pix_enviado DOUBLE PRECISION NOT NULL DEFAULT 0,
+            pix_recebido DOUBLE PRECISION NOT NULL DEFAULT 0,
+            PRIMARY KEY (pessoa, mes)
+        );
+    """)
+    # Carga inicial a partir do histórico existente
+    cur.execute("DELETE FROM resumo_mensal")
+    cur.execute("""
+        INSERT INTO resumo_mensal (pessoa, mes, consumo, pago_loja, pix_enviado, pix_recebido)
+        SELECT pessoa, mes, SUM(consumo), SUM(pago_loja), SUM(pix_enviado), SUM(pix_recebido)
+        FROM (
+            SELECT p.pessoa, date_trunc('month', n.data_compra)::date AS mes,
+                   p.consumo::float8, CASE WHEN n.pagador = p.pessoa THEN i.valor::float8 ELSE 0 END AS pago_loja,
+                   0 AS pix_enviado, 0 AS pix_recebido
+            FROM notas n JOIN itens i ON i.nota_id = n.id
+            CROSS JOIN LATERAL (VALUES ('Kristian', i.kristian_parte), ('Giulia', i.giulia_parte)) AS p(pessoa, consumo)
+            UNION ALL
+            SELECT p.pessoa, date_trunc('month', r.data_pagamento)::date,
+                   0, 0,
+                   CASE WHEN r.pagador = p.pessoa THEN r.valor::float8 ELSE 0 END,
+                   CASE WHEN r.recebedor = p.pessoa THEN r.valor::float8 ELSE 0 END
+            FROM reembolsos r CROSS JOIN (VALUES ('Kristian'), ('Giulia')) AS p(pessoa)
+        ) t
+        GROUP BY pessoa, mes
+    """)
+
+
+def _m006_partes_por_participante(cur):
+    # Divisão em formato estreito: uma linha por (item, participante), em centavos.
+    # kristian_parte/giulia_parte continuam gravadas para compatibilidade.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS participantes (
+            id SERIAL PRIMARY KEY,
+            nome TEXT NOT NULL UNIQUE
+        );
+    """)
+    cur.execute("INSERT INTO participantes (nome) VALUES ('Kristian'), ('Giulia') ON CONFLICT (nome) DO NOTHING")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS item_shares (
+            item_id INTEGER NOT NULL REFERENCES itens(id) ON DELETE CASCADE,
+            participant_id INTEGER NOT NULL REFERENCES participantes(id),
+            cents BIGINT NOT NULL,
+            PRIMARY KEY (item_id, participant_id)
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_item_shares_participant ON item_shares (participant_id)")
+    cur.execute("""
+        INSERT INTO item_shares (item_id, participant_id, cents)
+        SELECT i.id, p.id, round(v.parte::numeric * 100)::bigint
+        FROM itens i
+        CROSS JOIN LATERAL (VALUES ('Kristian', i.kristian_parte), ('Giulia', i.giulia_parte)) AS v(nome, parte)
+        JOIN participantes p ON p.nome = v.nome
+        WHERE v.parte <> 0
+        ON CONFLICT DO NOTHING
+    """)
+
+
+def _m007_chaves_de_gravacao(cur):
+    # Chave de idempotência de cada nota vinda da fila de gravação (save_queue.py):
+    # reenviar a mesma chave depois de uma falha ambígua não duplica a nota
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS gravacoes (
+            chave TEXT PRIMARY KEY,
+            nota_id INTEGER NOT NULL REFERENCES notas(id) ON DELETE CASCADE,
+            gravada_em TIMESTAMP NOT NULL
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_gravacoes_nota_id ON gravacoes (nota_id)")
+
+
+def _m008_chave_de_acesso(cur):
+    # Chave de acesso (44 dígitos) da NFC-e: o mesmo cupom não entra duas vezes.
+    # Notas antigas e digitadas à mão ficam com NULL, fora do índice único
+    cur.execute("ALTER TABLE notas ADD COLUMN IF NOT EXISTS chave_acesso TEXT")
+    cur.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_notas_chave_acesso ON notas (chave_acesso) "
+        "WHERE chave_acesso IS NOT NULL"
+    )
+
+
+# Ordem importa: nunca renumerar nem editar um passo já publicado; criar um novo.
+MIGRATIONS = [
+    (1, "Tabelas iniciais", _m001_tabelas_iniciais),
+    (2, "Datas como DATE/TIMESTAMP", _m002_datas_tipadas),
+    (3, "Índices de data, loja, categoria e nota_id", _m003_indices),
+    (4, "Memória de itens pela chave normalizada", _m004_chave_normalizada),
+    (5, "Resumo mensal por pessoa", _m005_resumo_mensal),
+    (6, "Participantes e partes por item (item_shares)", _m006_partes_por_participante),
+    (7, "Chaves de idempotência das gravações", _m007_chaves_de_gravacao),
+    (8, "Chave de acesso da NFC-e nas notas", _m008_chave_de_acesso),
+]
+
+
+def current_version(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        cur.close()
+        return 0
+    cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    version = cur.fetchone()[0]
+    cur.close()
+    return version
+
+
+def apply_migrations(conn):
+    """
+    Aplica os passos pendentes e devolve a lista de versões aplicadas agora.
+    Em caso de erro, o passo que falhou é desfeito inteiro (DDL é transacional
+    no Postgres) e a exceção sobe.
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                descricao TEXT NOT NULL,
+                aplicada_em TIMESTAMP NOT NULL DEFAULT now()
+            );
+        """)
+        conn.commit()
+
+        aplicadas = []
+        for version, descricao, passo in MIGRATIONS:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (_LOCK_KEY,))
+            cur.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+            if cur.fetchone():
+                conn.commit()
+                continue
+            passo(cur)
+            cur.execute(
+                "INSERT INTO schema_migrations (version, descricao) VALUES (%s, %s)",
+                (version, descricao),
+            )
+            conn.commit()
+            aplicadas.append(version)
+        return aplicadas
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Aplica as migrações pendentes do banco.")
+    ap.add_argument("--database-url", default=os.environ.get("DATABASE_URL"))
+    ap.add_argument("--verificar-resumo", action="store_true", help="Confere o resumo_mensal contra o histórico")
+    ap.add_argument("--reparar", action="store_true", help="Reconstrói o resumo_mensal se houver divergência")
+    args = ap.parse_args()
+    if not args.database_url:
+        ap.error("informe --database-url ou a variável DATABASE_URL")
+
+    if args.verificar_resumo:
+        from database import DatabaseManager
+        db_manager = DatabaseManager(args.database_url)
+        try:
+            divergencias = db_manager.check_summaries(repair=args.reparar)
+        finally:
+            db_manager.close()
+        for pessoa, mes, coluna, gravado, esperado in divergencias:
+            print(f"{pessoa} {mes:%m/%Y} {coluna}: gravado {gravado:.2f}, esperado {esperado:.2f}")
+        print(f"{len(divergencias)} divergência(s)" + (" (reconstruído)" if args.reparar and divergencias else ""))
+        raise SystemExit(1 if divergencias and not args.reparar else 0)
+
+    conn = psycopg2.connect(args.database_url)
+    try:
+        aplicadas = apply_migrations(conn)
+        print(f"Versão atual: {current_version(conn)} | aplicadas agora: {aplicadas or 'nenhuma'}")
+    finally:
+        conn.close()
@@ -0,0 +1,224 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from parser import InvoiceParser, PARSER_VERSION
+from tracing import span
+
+
+class ParseCache:
+    """
+    Cache dos resultados do InvoiceParser, endereçado pelo conteúdo do PDF.
+    - Chave: hash SHA-256 dos bytes do arquivo + versão do parser.
+    - Nível 1: LRU em memória (dicts prontos, sem reabrir o PDF).
+    - Nível 2: arquivos JSON em disco, com limite de tamanho total
+      (os menos usados recentemente saem primeiro).
+    Mudou o parser (PARSER_VERSION)? As entradas antigas deixam de ser
+    encontradas e são apagadas do disco na inicialização.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_memory_items: int = 64,
+        max_disk_bytes: int = 20 * 1024 * 1024,
+        parser_version: str = PARSER_VERSION,
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.parser_version = parser_version
+
+        self._memory: "OrderedDict[str, dict]" = OrderedDict()
+        # caminho -> ((tamanho, mtime), hash): evita reler o PDF a cada rerun
+        self._hashes: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._drop_other_versions()
+        self._enforce_disk_limit()
+
+    # -------------------------
+    # Chaves
+    # -------------------------
+    def file_hash(self, pdf_path: str) -> str:
+        """
+        Hash do conteúdo do PDF. Memorizado por (tamanho, mtime) para que
+        reruns do Streamlit não precisem reler o arquivo inteiro.
+        """
+        stat = os.stat(pdf_path)
+        signature = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            known = self._hashes.get(pdf_path)
+        if known and known[0] == signature:
+            return known[1]
+
+        digest = hashlib.sha256()
+        with open(pdf_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        file_hash = digest.hexdigest()
+
+        with self._lock:
+            self._hashes[pdf_path] = (signature, file_hash)
+        return file_hash
+
+    def _key(self, file_hash: str) -> str:
+        return f"{file_hash}-v{self.parser_version}"
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    # -------------------------
+    # Leitura / escrita
+    # -------------------------
+    def get(self, pdf_path: str) -> Optional[dict]:
+        """Retorna o resultado em cache (memória ou disco) ou None."""
+        key = self._key(self.file_hash(pdf_path))
+
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return copy.deepcopy(self._memory[key])
+
+        disk_path = self._disk_path(key)
+        try:
+            with open(disk_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        # Marca como usado recentemente para a política de despejo do disco
+        try:
+            os.utime(disk_path, None)
+        except OSError:
+            pass
+
+        with self._lock:
+            self._remember(key, data)
+        return copy.deepcopy(data)
+
+    def put(self, pdf_path: str, data: dict) -> None:
+        key = self._key(self.file_hash(pdf_path))
+        data = copy.deepcopy(data)
+
+        with self._lock:
+            self._remember(key, data)
+
+        # Escrita atômica: grava num temporário e renomeia
+        disk_path = self._disk_path(key)
+        tmp_path = f"{disk_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, disk_path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        self._enforce_disk_limit()
+
+    def parse(self, pdf_path: str) -> dict:
+        """
+        Equivalente a InvoiceParser(pdf_path).parse(), mas só abre o PDF
+        quando o conteúdo ainda não foi lido por esta versão do parser.
+        Erros de leitura não são cacheados (sobem para quem chamou).
+        """
+        with span("ParseCache.parse", "parser") as s:
+            data = self.get(pdf_path)
+            s["cache"] = data is not None
+            if data is not None:
+                return data
+
+            data = InvoiceParser(pdf_path).parse()
+            self.put(pdf_path, data)
+            return copy.deepcopy(data)
+
+    def invalidate(self, pdf_path: str) -> None:
+        """
+        Remove as entradas ligadas a um arquivo. Deve ser chamado antes de
+        apagar o PDF da fila (enquanto ainda dá para calcular o hash).
+        """
+        with self._lock:
+            known = self._hashes.pop(pdf_path, None)
+        file_hash = known[1] if known else None
+
+        if file_hash is None:
+            try:
+                file_hash = self.file_hash(pdf_path)
+            except OSError:
+                return
+            with self._lock:
+                self._hashes.pop(pdf_path, None)
+
+        key = self._key(file_hash)
+        with self._lock:
+            self._memory.pop(key, None)
+        try:
+            os.remove(self._disk_path(key))
+        except OSError:
+            pass
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._hashes.clear()
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".json"):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+    # -------------------------
+    # Despejo
+    # -------------------------
+    def _remember(self, key: str, data: dict) -> None:
+        # Chamado com o lock já adquirido
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _drop_other_versions(self) -> None:
+        suffix = f"-v{self.parser_version}.json"
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".json") and not name.endswith(suffix):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+    def _enforce_disk_limit(self) -> None:
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+            total += stat.st_size
+
+        if total <= self.max_disk_bytes:
+            return
+
+        # Mais antigos (menos usados) primeiro
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            if total <= self.max_disk_bytes:
+                break
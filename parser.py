@@ -1,164 +1,374 @@
 import pdfplumber
 import re
 
+from tracing import span
+
+# Versão do formato de saída do parser. Incrementar sempre que a lógica de
+# extração mudar: o cache de notas lidas (parse_cache.py) usa este valor na chave.
+PARSER_VERSION = "3"
+
+# ===============================================================
+# PADRÕES PRÉ-COMPILADOS (uma vez por processo, não a cada linha)
+# ===============================================================
+_RE_DATA = re.compile(r'(\d{2}/\d{2}/\d{4})')
+_RE_CPF = re.compile(r'(\d{3}\.\d{3}\.\d{3}-\d{2})')
+_RE_CPF_REMOVER = re.compile(r'(?i)(CPF|CNPJ):?\s*[\d\.\/-]{11,18}')
+_RE_DESCONTO = re.compile(r'(?:DESCONTOS?|DESC\.?|R\$).+?(\d+,\d{2})', re.IGNORECASE)
+_RE_ITEM_CHECK = re.compile(r'\d+,\d{2}\s+\d+,\d{2}\s*$') # Termina com dois preços?
+_RE_PROTOCOLO = re.compile(r'(?i)Protocolo.*?\d+')
+_RE_CHAVE_ACESSO = re.compile(r'(?:\d{4}\s?){11}')
+# Chave de acesso inteira (44 dígitos, em blocos de 4 ou corrida), para guardar
+_RE_CHAVE_44 = re.compile(r'(?<!\d)((?:\d{4}\s?){10}\d{4})(?!\d)')
+# Fronteira número/letra em qualquer sentido: "0,500KG" -> "0,500 KG"
+_RE_DESGRUDAR = re.compile(r'(?<=\d)(?=[a-zA-Z])|(?<=[a-zA-Z])(?=\d)')
+# Qtd -> Un -> Unit -> Total (lido do FIM para o COMEÇO)
+_RE_ITEM_COMPLETO = re.compile(r'(\d+(?:,\d+)?)\s+([a-zA-Z]{2,3})\s+(\d+(?:,\d+)?)\s+(\d+(?:,\d+)?)\s*$')
+_RE_ITEM_TOTAL = re.compile(r'(\d+,\d{2})\s*$')
+_RE_CODIGO_INICIO = re.compile(r'^\d+\s+')
+
+# Palavras-gatilho procuradas na linha em maiúsculas
+_LOJA = frozenset(["DISTRIBUIDORA", "SUPERMERCADO", "LTDA"])
+_DOCUMENTO = frozenset(["CPF", "CNPJ"])
+_FIM_ITENS = frozenset(["VALOR TOTAL", "TOTAL R$"])
+_SISTEMA = frozenset(["PÁGINA", "PAGE", "DANFE", "CONSUMIDOR", "NFC-E", "VERSÃO"])
+_GATILHOS = (
+    _LOJA | _DOCUMENTO | _FIM_ITENS | _SISTEMA
+    | {"DESCONTO", "CARTÃO", "CREDITO", "DEBITO", "PIX", "DINHEIRO", "CÓDIGO", "DESCRIÇÃO", "VALOR", "PROTOCOLO"}
+)
+# Uma única varredura por linha. Os mais longos vêm primeiro para que
+# "VALOR TOTAL" ganhe de "VALOR" na mesma posição.
+_RE_GATILHOS = re.compile("|".join(re.escape(k) for k in sorted(_GATILHOS, key=len, reverse=True)))
+
+# A varredura não se sobrepõe: se um destes aparecer, o seguinte pode ter
+# "grudado" nele (ex.: "CREDITOTAL R$") e é conferido à parte.
+_SOBREPOSICOES = {
+    "VALOR TOTAL": ("VALOR", "TOTAL R$", "LTDA"),
+    "DESCONTO": ("TOTAL R$",),
+    "CREDITO": ("TOTAL R$",),
+    "DEBITO": ("TOTAL R$",),
+    "LTDA": ("DANFE",),
+}
+
+
+def access_key_valid(chave):
+    """Confere o dígito verificador (módulo 11, pesos 2 a 9 da direita para a esquerda)."""
+    if not chave or len(chave) != 44 or not chave.isdigit():
+        return False
+    soma = sum(int(d) * (2 + i % 8) for i, d in enumerate(reversed(chave[:43])))
+    resto = soma % 11
+    return int(chave[43]) == (0 if resto < 2 else 11 - resto)
+
+
+def find_access_key(line):
+    """A chave de acesso (44 dígitos, sem espaços) contida na linha, ou None."""
+    for match in _RE_CHAVE_44.finditer(line):
+        chave = re.sub(r'\s', '', match.group(1))
+        if access_key_valid(chave):
+            return chave
+    return None
+
+
+def _convert_br_number(value_str):
+    if not value_str: return 0.0
+    try:
+        return float(value_str.replace('.', '').replace(',', '.'))
+    except (AttributeError, ValueError):
+        return 0.0
+
+
+def _search_tail(pattern, line, n_tokens):
+    """
+    Busca um padrão ancorado no fim da linha ($) que ocupa no máximo os
+    últimos `n_tokens` blocos separados por espaço. Começar a busca no
+    início desses blocos dá o mesmo match e evita varrer o nome do item.
+    """
+    parts = line.rsplit(None, n_tokens)
+    if len(parts) < n_tokens: return None
+    pos = 0 if len(parts) == n_tokens else line.index(parts[1], len(parts[0]))
+    return pattern.search(line, pos)
+
+
+def _find_gatilhos(line_upper):
+    found = set(_RE_GATILHOS.findall(line_upper))
+    for gatilho in found.intersection(_SOBREPOSICOES):
+        for seguinte in _SOBREPOSICOES[gatilho]:
+            if seguinte not in found and seguinte in line_upper:
+                found.add(seguinte)
+    return found
+
+
+class LineKind:
+    """Tipos de linha reconhecidos pelo InvoiceLineEngine."""
+    METADATA = "metadata"          # Data, loja, CPF, pagamento, total
+    HEADER = "header"              # Cabeçalho "Código Descrição ..."
+    ITEM = "item"                  # Qtd + Un + Unit + Total na mesma linha
+    BROKEN_ITEM = "broken_item"    # Só o total, ou pedaço do nome que continua na próxima
+    DISCOUNT = "discount"          # Linha de desconto somada ao abatimento
+    NOISE = "noise"                # Descartada
+
+
+class InvoiceLineEngine:
+    """
+    Motor de leitura linha a linha da NFC-e.
+    Cada linha passa por uma única varredura de palavras-gatilho e é
+    classificada (LineKind) enquanto preenche o dict de dados da nota.
+    O resultado é o mesmo `data` que o InvoiceParser sempre devolveu.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.kind_counts = dict.fromkeys(
+            (LineKind.METADATA, LineKind.HEADER, LineKind.ITEM,
+             LineKind.BROKEN_ITEM, LineKind.DISCOUNT, LineKind.NOISE), 0
+        )
+
+        # --- ESTADOS DO LEITOR ---
+        self.lendo_itens = False # Só vira True quando passar pelo cabeçalho
+        self.linha_anterior_pendente = ""
+        self.acumulado_desconto = 0.0
+        self.viu_total = False # Já passou pelo "Valor Total"?
+
+    @property
+    def section_complete(self):
+        """Total e forma de pagamento já lidos: o resto do PDF não muda a nota."""
+        return self.viu_total and self.data["forma_pagamento"] != "Indefinido"
+
+    def feed(self, line):
+        """Processa uma linha e devolve o LineKind dela (None para linha vazia)."""
+        line_clean = line.strip()
+        if not line_clean: return None
+        kind = self._classify(line_clean)
+        self.kind_counts[kind] += 1
+        return kind
+
+    def _classify(self, line_clean):
+        data = self.data
+        line_upper = line_clean.upper()
+        gatilhos = _find_gatilhos(line_upper)
+        kind = LineKind.NOISE
+
+        # ===============================================================
+        # 1. METADADOS GERAIS (Lê em qualquer lugar da nota)
+        # ===============================================================
+
+        # Data (a primeira que aparecer)
+        if not data["data"]:
+            date_match = _RE_DATA.search(line_clean)
+            if date_match:
+                data["data"] = date_match.group(1)
+                kind = LineKind.METADATA
+
+        # Loja (Geralmente nas primeiras linhas)
+        if not data["loja"] and not _LOJA.isdisjoint(gatilhos):
+            data["loja"] = line_clean
+            kind = LineKind.METADATA
+
+        # CPF (Pega e limpa da linha)
+        if not _DOCUMENTO.isdisjoint(gatilhos):
+            cpf_match = _RE_CPF.search(line_clean)
+            if cpf_match:
+                data["cpf_consumidor"] = cpf_match.group(1)
+                kind = LineKind.METADATA
+            # Remove o CPF da linha para não sujar se estiver grudado no item
+            line_clean = _RE_CPF_REMOVER.sub('', line_clean).strip()
+
+        # Chave de acesso (44 dígitos com dígito verificador válido)
+        if data.get("chave_acesso") is None and len(line_clean) >= 44:
+            chave = find_access_key(line_clean)
+            if chave:
+                data["chave_acesso"] = chave
+                kind = LineKind.METADATA
+
+        # Desconto (Pega e soma)
+        if "DESCONTO" in gatilhos:
+            match_desc = _RE_DESCONTO.search(line_clean)
+            if match_desc:
+                self.acumulado_desconto += _convert_br_number(match_desc.group(1))
+                kind = LineKind.DISCOUNT
+
+        # Forma de Pagamento (Geralmente no final)
+        forma = None
+        if "CARTÃO" in gatilhos or "CREDITO" in gatilhos: forma = "Cartão de Crédito"
+        elif "DEBITO" in gatilhos: forma = "Débito"
+        elif "PIX" in gatilhos: forma = "Pix"
+        elif "DINHEIRO" in gatilhos: forma = "Dinheiro"
+        if forma:
+            data["forma_pagamento"] = forma
+            if kind == LineKind.NOISE: kind = LineKind.METADATA
+
+        # ===============================================================
+        # 2. CONTROLE DE ESTADO (Onde começa e onde termina a lista?)
+        # ===============================================================
+
+        # GATILHO DE FIM: Se achou "Valor Total", acabou a lista.
+        if not _FIM_ITENS.isdisjoint(gatilhos):
+            self.lendo_itens = False
+            self.viu_total = True
+            return LineKind.METADATA if kind == LineKind.NOISE else kind
+
+        # GATILHO DE INÍCIO: Se achou o cabeçalho da tabela, começa na próxima.
+        if "CÓDIGO" in gatilhos and "DESCRIÇÃO" in gatilhos:
+            self.lendo_itens = True
+            return LineKind.HEADER
+
+        # Segurança caso o PDF não tenha o texto "Código Descrição" legível:
+        # a linha JÁ É um item (termina com dois preços)?
+        if not self.lendo_itens and "VALOR" not in gatilhos and _search_tail(_RE_ITEM_CHECK, line_clean, 2):
+            self.lendo_itens = True
+
+        if not self.lendo_itens:
+            return kind
+
+        # ===============================================================
+        # 3. LEITURA DE ITENS (Só processa se lendo_itens == True)
+        # ===============================================================
+
+        # Limpeza de lixo específico dentro da área de itens
+        # (a linha original só muda antes daqui se tinha CPF/CNPJ)
+        if "PROTOCOLO" in gatilhos or not _DOCUMENTO.isdisjoint(gatilhos):
+            line_clean = _RE_PROTOCOLO.sub('', line_clean).strip() # Protocolo
+        line_clean = _RE_CHAVE_ACESSO.sub('', line_clean).strip() # Chave de acesso
+
+        # Injeção de espaço (Desgrudar "0,500KG")
+        line_clean = _RE_DESGRUDAR.sub(' ', line_clean)
+
+        item_data = None
+        match = _search_tail(_RE_ITEM_COMPLETO, line_clean, 4)
+
+        if match:
+            # Achou padrão completo. Nome é o que sobrou no começo,
+            # sem o CÓDIGO numérico inútil (ex: "6675")
+            texto_nome = _RE_CODIGO_INICIO.sub('', line_clean[:match.start()].strip()).strip()
+            item_data = {
+                "item": texto_nome,
+                "qtd": _convert_br_number(match.group(1)),
+                "un": match.group(2),
+                "vl_unit": _convert_br_number(match.group(3)),
+                "valor": _convert_br_number(match.group(4)),
+            }
+            kind = LineKind.ITEM
+        else:
+            match_total = _search_tail(_RE_ITEM_TOTAL, line_clean, 1)
+            if match_total:
+                # Achou só o total (item quebrado)
+                vl_total = _convert_br_number(match_total.group(1))
+                texto_nome = _RE_CODIGO_INICIO.sub('', line_clean[:match_total.start()].strip()).strip()
+
+                # Se tiver texto suficiente, é item
+                if len(texto_nome) > 2:
+                    item_data = {"item": texto_nome, "qtd": 1.0, "un": "UN", "vl_unit": vl_total, "valor": vl_total}
+                    kind = LineKind.BROKEN_ITEM
+
+        # Salva ou Junta com anterior
+        if item_data:
+            if self.linha_anterior_pendente:
+                item_data["item"] = f"{self.linha_anterior_pendente} {item_data['item']}"
+                self.linha_anterior_pendente = ""
+            data["itens"].append(item_data)
+        elif len(line_clean) > 3 and _SISTEMA.isdisjoint(gatilhos):
+            # Se tem texto mas não é comando de sistema, guarda
+            self.linha_anterior_pendente = line_clean
+            if kind == LineKind.NOISE: kind = LineKind.BROKEN_ITEM
+
+        return kind
+
+    def finish(self):
+        # --- FIM DO LOOP: Adiciona o Desconto como Item ---
+        if self.acumulado_desconto > 0:
+            self.data["itens"].append({
+                "item": "💸 DESCONTO / ABATIMENTO",
+                "qtd": 1, "un": "UN", "vl_unit": -self.acumulado_desconto,
+                "valor": -self.acumulado_desconto
+            })
+
+        self.data["total_nota"] = sum(item["valor"] for item in self.data["itens"])
+        return self.data
+
+
 class InvoiceParser:
-    def __init__(self, pdf_path):
+    def __init__(self, pdf_path, streaming=True):
         self.pdf_path = pdf_path
+        # streaming=True: lê página a página e para depois do total/pagamento.
+        # streaming=False: modo antigo, guarda o texto inteiro em raw_text.
+        self.streaming = streaming
         self.raw_text = ""
+        self.pages_read = 0
         self.data = {
             "loja": None,
             "data": None,
             "cpf_consumidor": None,
             "forma_pagamento": "Indefinido",
+            "chave_acesso": None,
             "total_nota": 0.0,
             "itens": [] # Desconto entrará aqui como negativo
         }
 
     def _convert_br_number(self, value_str):
-        if not value_str: return 0.0
-        try:
-            return float(value_str.replace('.', '').replace(',', '.'))
-        except:
-            return 0.0
+        return _convert_br_number(value_str)
 
     def parse(self):
+        with span("InvoiceParser.parse", "parser") as s:
+            data = self._parse_pdf()
+            s["paginas"] = self.pages_read
+            s["itens"] = len(data["itens"])
+            return data
+
+    def _parse_pdf(self):
         with pdfplumber.open(self.pdf_path) as pdf:
+            if self.streaming:
+                engine = InvoiceLineEngine(self.data)
+                for line in self._stream_lines(pdf, engine):
+                    engine.feed(line)
+                return engine.finish()
+
             full_text = ""
             for page in pdf.pages:
-                full_text += page.extract_text(layout=True) or "" 
+                full_text += page.extract_text(layout=True) or ""
+                self.pages_read += 1
             self.raw_text = full_text
 
-        lines = self.raw_text.split('\n')
-        
-        # --- ESTADOS DO LEITOR ---
-        lendo_itens = False # Só vira True quando passar pelo cabeçalho
-        linha_anterior_pendente = ""
-        acumulado_desconto = 0.0
+        return self.parse_lines(self.raw_text.split('\n'))
 
-        for line in lines:
-            line_clean = line.strip()
-            if not line_clean: continue
-            line_upper = line_clean.upper()
-
-            # ===============================================================
-            # 1. METADADOS GERAIS (Lê em qualquer lugar da nota)
-            # ===============================================================
-            
-            # Data
-            date_match = re.search(r'(\d{2}/\d{2}/\d{4})', line_clean)
-            if date_match and not self.data["data"]:
-                self.data["data"] = date_match.group(1)
-
-            # Loja (Geralmente nas primeiras linhas)
-            if not self.data["loja"] and ("DISTRIBUIDORA" in line_upper or "SUPERMERCADO" in line_upper or "LTDA" in line_upper):
-                self.data["loja"] = line_clean
-
-            # CPF (Pega e limpa da linha) [cite: 16]
-            if "CPF" in line_upper or "CNPJ" in line_upper:
-                cpf_match = re.search(r'(\d{3}\.\d{3}\.\d{3}-\d{2})', line_clean)
-                if cpf_match: self.data["cpf_consumidor"] = cpf_match.group(1)
-                # Remove o CPF da linha para não sujar se estiver grudado no item
-                line_clean = re.sub(r'(?i)(CPF|CNPJ):?\s*[\d\.\/-]{11,18}', '', line_clean).strip()
-
-            # Desconto (Pega e soma)
-            if "DESCONTO" in line_upper:
-                match_desc = re.search(r'(?:DESCONTOS?|DESC\.?|R\$).+?(\d+,\d{2})', line_clean, re.IGNORECASE)
-                if match_desc:
-                    acumulado_desconto += self._convert_br_number(match_desc.group(1))
-
-            # Forma de Pagamento (Geralmente no final)
-            if "CARTÃO" in line_upper or "CREDITO" in line_upper: self.data["forma_pagamento"] = "Cartão de Crédito"
-            elif "DEBITO" in line_upper: self.data["forma_pagamento"] = "Débito"
-            elif "PIX" in line_upper: self.data["forma_pagamento"] = "Pix"
-            elif "DINHEIRO" in line_upper: self.data["forma_pagamento"] = "Dinheiro"
-
-            # ===============================================================
-            # 2. CONTROLE DE ESTADO (Onde começa e onde termina a lista?)
-            # ===============================================================
-
-            # GATILHO DE FIM: Se achou "Valor Total", acabou a lista. 
-            if "VALOR TOTAL" in line_upper or "TOTAL R$" in line_upper:
-                lendo_itens = False
-                continue
-
-            # GATILHO DE INÍCIO: Se achou o cabeçalho da tabela, começa na próxima. 
-            # Verifica palavras chaves do cabeçalho
-            if "CÓDIGO" in line_upper and "DESCRIÇÃO" in line_upper:
-                lendo_itens = True
-                continue # Pula a linha do cabeçalho em si
-
-            # Se ainda não ativou o modo leitura (e não é cabeçalho explícito),
-            # verifica se a linha JÁ É um item (caso o cabeçalho não tenha sido lido corretamente)
-            # Isso é uma segurança caso o PDF não tenha o texto "Código Descrição" legível.
-            regex_item_check = r'\d+,\d{2}\s+\d+,\d{2}\s*$' # Termina com dois preços?
-            if not lendo_itens and re.search(regex_item_check, line_clean) and not "VALOR" in line_upper:
-                lendo_itens = True
-
-            # ===============================================================
-            # 3. LEITURA DE ITENS (Só processa se lendo_itens == True)
-            # ===============================================================
-            
-            if lendo_itens:
-                # Limpeza de lixo específico dentro da área de itens
-                line_clean = re.sub(r'(?i)Protocolo.*?\d+', '', line_clean).strip() # Protocolo
-                line_clean = re.sub(r'(?:\d{4}\s?){11}', '', line_clean).strip() # Chave de acesso [cite: 13]
-                
-                # Injeção de espaço (Desgrudar "0,500KG") 
-                line_clean = re.sub(r'(\d)([a-zA-Z])', r'\1 \2', line_clean)
-                line_clean = re.sub(r'([a-zA-Z])(\d)', r'\1 \2', line_clean)
-
-                # Regex do Item: Pega do FIM para o COMEÇO
-                # Qtd -> Un -> Unit -> Total
-                regex_completo = r'(\d+(?:,\d+)?)\s+([a-zA-Z]{2,3})\s+(\d+(?:,\d+)?)\s+(\d+(?:,\d+)?)\s*$'
-                match = re.search(regex_completo, line_clean)
-                
-                item_data = {}
-
-                if match:
-                    # Achou padrão completo
-                    qtd = self._convert_br_number(match.group(1))
-                    un = match.group(2)
-                    vl_unit = self._convert_br_number(match.group(3))
-                    vl_total = self._convert_br_number(match.group(4))
-                    
-                    # Nome é o que sobrou no começo
-                    texto_nome = line_clean[:match.start()].strip()
-                    # Remove o CÓDIGO numérico inútil do início (ex: "6675") 
-                    texto_nome = re.sub(r'^\d+\s+', '', texto_nome).strip()
-                    
-                    item_data = {"item": texto_nome, "qtd": qtd, "un": un, "vl_unit": vl_unit, "valor": vl_total}
-
-                elif re.search(r'(\d+,\d{2})\s*$', line_clean):
-                    # Achou só o total (item quebrado)
-                    match_total = re.search(r'(\d+,\d{2})\s*$', line_clean)
-                    vl_total = self._convert_br_number(match_total.group(1))
-                    
-                    texto_nome = line_clean[:match_total.start()].strip()
-                    texto_nome = re.sub(r'^\d+\s+', '', texto_nome).strip()
-                    
-                    # Se tiver texto suficiente, é item
-                    if len(texto_nome) > 2:
-                        item_data = {"item": texto_nome, "qtd": 1.0, "un": "UN", "vl_unit": vl_total, "valor": vl_total}
-
-                # Salva ou Junta com anterior
-                if item_data:
-                    if linha_anterior_pendente:
-                        item_data["item"] = f"{linha_anterior_pendente} {item_data['item']}"
-                        linha_anterior_pendente = ""
-                    self.data["itens"].append(item_data)
-                else:
-                    # Se tem texto mas não é comando de sistema, guarda
-                    palavras_sistema = ["PÁGINA", "PAGE", "DANFE", "CONSUMIDOR", "NFC-E", "VERSÃO"]
-                    if len(line_clean) > 3 and not any(p in line_upper for p in palavras_sistema):
-                        linha_anterior_pendente = line_clean
+    def _stream_lines(self, pdf, engine):
+        """
+        Gera as linhas uma página por vez, liberando o cache de cada página
+        logo após extrair o texto. As páginas são concatenadas sem separador
+        (igual ao modo antigo), então a última linha de uma página continua
+        na primeira da seguinte. Para nas fronteiras de página assim que o
+        motor já leu o total e a forma de pagamento; se a chave de acesso
+        (logo abaixo do pagamento) ainda não apareceu, lê no máximo mais uma.
+        """
+        resto = ""
+        pagina_extra = False
+        for page in pdf.pages:
+            try:
+                text = page.extract_text(layout=True) or ""
+            finally:
+                self._release_page(page)
+            self.pages_read += 1
 
-        # --- FIM DO LOOP: Adiciona o Desconto como Item ---
-        if acumulado_desconto > 0:
-            self.data["itens"].append({
-                "item": "💸 DESCONTO / ABATIMENTO",
-                "qtd": 1, "un": "UN", "vl_unit": -acumulado_desconto, 
-                "valor": -acumulado_desconto
-            })
+            lines = (resto + text).split('\n')
+            resto = lines.pop()
+            yield from lines
 
-        self.data["total_nota"] = sum(item["valor"] for item in self.data["itens"])
-        return self.data
\ No newline at end of file
+            if engine.section_complete:
+                if self.data["chave_acesso"] is not None or pagina_extra:
+                    break
+                pagina_extra = True
+
+        if resto:
+            yield resto
+
+    @staticmethod
+    def _release_page(page):
+        # pdfplumber >= 0.10 tem close(); versões antigas só flush_cache()
+        release = getattr(page, "close", None) or getattr(page, "flush_cache", None)
+        if release:
+            release()
+
+    def parse_lines(self, lines):
+        """Roda o motor sobre linhas de texto já extraídas (sem abrir PDF)."""
+        engine = InvoiceLineEngine(self.data)
+        for line in lines:
+            engine.feed(line)
+        return engine.finish()
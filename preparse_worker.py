@@ -0,0 +1,170 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from parse_cache import ParseCache
+from parser import InvoiceParser
+
+# Estados exibidos na fila
+PENDING = "pendente"
+PARSED = "lida"
+FAILED = "falhou"
+
+
+def _parse_pdf(pdf_path):
+    # Roda no processo filho
+    return InvoiceParser(pdf_path).parse()
+
+
+class PreParseWorker:
+    """
+    Lê em segundo plano os PDFs que chegam na fila (notas_pendentes).
+    - Uma thread vigia a pasta a cada `poll_interval` segundos.
+    - O parse roda num pool de processos (pdfplumber é CPU puro e não
+      deve disputar o GIL com a thread que desenha a tela).
+    - O resultado vai para o ParseCache, então ao selecionar a nota os
+      itens aparecem sem abrir o PDF de novo. A chave de acesso lida fica
+      também no estado, para a tela apontar duplicadas sem reabrir nada.
+    """
+
+    def __init__(
+        self,
+        buffer_dir: str,
+        parse_cache: ParseCache,
+        max_workers: int = 2,
+        poll_interval: float = 2.0,
+        settle_seconds: float = 1.0,
+    ) -> None:
+        self.buffer_dir = buffer_dir
+        self.parse_cache = parse_cache
+        self.poll_interval = poll_interval
+        # Arquivos modificados há menos tempo que isto podem estar sendo gravados
+        self.settle_seconds = settle_seconds
+
+        self._pool = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        # nome -> (assinatura (tamanho, mtime), estado, erro, chave de acesso)
+        self._states: Dict[str, Tuple[Tuple[int, int], str, Optional[str], Optional[str]]] = {}
+        self._events: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # -------------------------
+    # Ciclo de vida
+    # -------------------------
+    def start(self) -> "PreParseWorker":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="preparse-worker", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval * 2)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.scan()
+            except Exception:
+                # A vigia nunca pode morrer por causa de um arquivo estranho
+                pass
+            self._stop.wait(self.poll_interval)
+
+    # -------------------------
+    # Varredura
+    # -------------------------
+    def scan(self) -> None:
+        """Agenda os PDFs novos (ou alterados) e esquece os que saíram da fila."""
+        agora = time.time()
+        vistos = set()
+
+        for entry in os.scandir(self.buffer_dir):
+            if not entry.is_file() or not entry.name.lower().endswith(".pdf"):
+                continue
+            vistos.add(entry.name)
+            stat = entry.stat()
+            signature = (stat.st_size, stat.st_mtime_ns)
+
+            with self._lock:
+                atual = self._states.get(entry.name)
+            if atual and atual[0] == signature:
+                continue
+            if agora - stat.st_mtime < self.settle_seconds:
+                continue
+
+            self._submit(entry.name, entry.path, signature)
+
+        with self._lock:
+            for nome in list(self._states):
+                if nome not in vistos:
+                    del self._states[nome]
+                    self._events.pop(nome, None)
+
+    def _submit(self, nome: str, path: str, signature: Tuple[int, int]) -> None:
+        evento = threading.Event()
+
+        try:
+            cached = self.parse_cache.get(path)
+        except OSError:
+            return
+        if cached is not None:
+            evento.set()
+            with self._lock:
+                self._states[nome] = (signature, PARSED, None, cached.get("chave_acesso"))
+                self._events[nome] = evento
+            return
+
+        with self._lock:
+            self._states[nome] = (signature, PENDING, None, None)
+            self._events[nome] = evento
+
+        future = self._pool.submit(_parse_pdf, path)
+
+        def _done(fut):
+            try:
+                data = fut.result()
+                self.parse_cache.put(path, data)
+                resultado = (signature, PARSED, None, data.get("chave_acesso"))
+            except Exception as e:
+                resultado = (signature, FAILED, f"{type(e).__name__}: {e}", None)
+            with self._lock:
+                # O arquivo pode ter saído (ou mudado) enquanto era lido
+                if self._states.get(nome, (None,))[0] == signature:
+                    self._states[nome] = resultado
+            evento.set()
+
+        future.add_done_callback(_done)
+
+    # -------------------------
+    # Consulta
+    # -------------------------
+    def state(self, nome: str) -> Tuple[str, Optional[str]]:
+        """(estado, erro) de um arquivo da fila; desconhecido conta como pendente."""
+        with self._lock:
+            atual = self._states.get(nome)
+        if atual is None:
+            return PENDING, None
+        return atual[1], atual[2]
+
+    def access_key(self, nome: str) -> Optional[str]:
+        """Chave de acesso de um arquivo já lido (None se ainda não lido ou sem chave)."""
+        with self._lock:
+            atual = self._states.get(nome)
+        return atual[3] if atual else None
+
+    def wait(self, nome: str, timeout: Optional[float] = None) -> bool:
+        """Espera o parse em andamento de um arquivo terminar (True se terminou)."""
+        with self._lock:
+            evento = self._events.get(nome)
+        if evento is None:
+            return False
+        return evento.wait(timeout)
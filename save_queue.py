@@ -0,0 +1,218 @@
+"""
+Fila de gravação em segundo plano (write-behind) das notas.
+
+Com o modo ligado, "Salvar nota" só registra a nota num diário local (um
+SQLite ao lado da fila de PDFs, gravado com fsync) e a tela já passa para a
+próxima nota. Uma thread esvazia o diário no banco em lotes
+(bulk_insert_invoices com learn=True); se o banco falhar, a entrada fica no
+diário e volta a ser tentada com espera exponencial. Cada nota leva uma chave
+de idempotência gravada na mesma transação (tabela gravacoes): se o commit
+aconteceu mas a resposta se perdeu, o reenvio não duplica a nota.
+Um cupom que o banco já tem (mesma chave de acesso) não some: a entrada fica
+no diário como "duplicada", para a tela mostrar e o usuário descartar.
+O diário sobrevive a um restart: o que ficou pendente sai quando a fila voltar.
+"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from storage import SKIP_DUPLICATE
+
+# Estados exibidos na tela
+QUEUED = "na fila"
+RETRYING = "tentando de novo"
+DUPLICATE = "duplicada" # Cupom já salvo: não é reenviada, espera o descarte
+
+
+def _encode(nota: Dict) -> str:
+    return json.dumps(
+        dict(nota, data_compra=nota["data_compra"].isoformat()), ensure_ascii=False
+    )
+
+
+def _decode(texto: str) -> Dict:
+    nota = json.loads(texto)
+    nota["data_compra"] = date.fromisoformat(nota["data_compra"])
+    return nota
+
+
+class SaveQueue:
+    """
+    Diário durável + thread que envia as notas para o StorageBackend.
+    - enqueue() grava no diário e acorda a thread (não espera o banco);
+    - a thread envia até `batch_size` notas por transação; um lote que falha
+      é reenviado nota a nota, para uma nota ruim não travar as outras;
+    - cada falha espera retry_base * 2^tentativas segundos (até retry_max).
+    """
+
+    def __init__(
+        self,
+        journal_path: str,
+        storage,
+        batch_size: int = 20,
+        poll_interval: float = 5.0,
+        retry_base: float = 2.0,
+        retry_max: float = 300.0,
+    ) -> None:
+        self.journal_path = journal_path
+        self.storage = storage
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.saved = 0 # Notas gravadas no banco desde que o processo subiu
+
+        self._conn = sqlite3.connect(journal_path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL") # A nota só "saiu da tela" depois do fsync
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS diario (
+                chave TEXT PRIMARY KEY,
+                criada_em TEXT NOT NULL,
+                resumo TEXT NOT NULL,
+                nota TEXT NOT NULL,
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                proxima_tentativa REAL NOT NULL DEFAULT 0,
+                ultimo_erro TEXT,
+                estado TEXT
+            )
+        """)
+        colunas = [linha[1] for linha in self._conn.execute("PRAGMA table_info(diario)")]
+        if "estado" not in colunas: # Diário criado antes das duplicadas
+            self._conn.execute("ALTER TABLE diario ADD COLUMN estado TEXT")
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # -------------------------
+    # Ciclo de vida
+    # -------------------------
+    def start(self) -> "SaveQueue":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="save-queue", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval * 2)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.flush()
+            except Exception:
+                # A thread nunca pode morrer: o erro já ficou registrado na entrada
+                pass
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    # -------------------------
+    # API usada pela tela
+    # -------------------------
+    def enqueue(self, nota: Dict, resumo: str = "") -> str:
+        """
+        Registra a nota (formato do bulk_insert_invoices) no diário e devolve a
+        chave de idempotência. Volta assim que o diário está no disco.
+        """
+        chave = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO diario (chave, criada_em, resumo, nota) VALUES (?, ?, ?, ?)",
+                (chave, datetime.now().isoformat(timespec="seconds"), resumo, _encode(dict(nota, chave=chave))),
+            )
+        self._wake.set()
+        return chave
+
+    def pending(self) -> List[Dict]:
+        """Entradas ainda não gravadas no banco, das mais antigas para as mais novas."""
+        with self._lock:
+            linhas = self._conn.execute(
+                "SELECT chave, criada_em, resumo, tentativas, proxima_tentativa, ultimo_erro, estado "
+                "FROM diario ORDER BY rowid"
+            ).fetchall()
+        return [
+            {
+                "chave": chave, "criada_em": criada_em, "resumo": resumo, "tentativas": tentativas,
+                "estado": estado or (RETRYING if tentativas else QUEUED),
+                "proxima_em": max(0.0, proxima - time.time()) if tentativas and not estado else 0.0,
+                "erro": erro,
+            }
+            for chave, criada_em, resumo, tentativas, proxima, erro, estado in linhas
+        ]
+
+    def retry_now(self) -> None:
+        """Tira a espera de todas as entradas e acorda a thread."""
+        with self._lock:
+            self._conn.execute("UPDATE diario SET proxima_tentativa = 0 WHERE estado IS NULL")
+        self._wake.set()
+
+    def discard(self, chave: str) -> None:
+        """Desiste de uma entrada (ex.: nota que o banco sempre recusa ou duplicada)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM diario WHERE chave = ?", (chave,))
+
+    # -------------------------
+    # Envio
+    # -------------------------
+    def flush(self) -> int:
+        """Envia tudo o que já pode ser tentado; devolve quantas notas foram gravadas."""
+        gravadas = 0
+        with self._flush_lock:
+            while not self._stop.is_set():
+                with self._lock:
+                    lote = self._conn.execute(
+                        "SELECT chave, nota, tentativas FROM diario "
+                        "WHERE estado IS NULL AND proxima_tentativa <= ? ORDER BY rowid LIMIT ?",
+                        (time.time(), self.batch_size),
+                    ).fetchall()
+                if not lote:
+                    break
+                gravadas += self._send(lote)
+        return gravadas
+
+    def _send(self, lote) -> int:
+        try:
+            puladas = []
+            gravadas = self.storage.bulk_insert_invoices(
+                [_decode(nota) for _, nota, _ in lote], learn=True, skipped=puladas
+            )
+            duplicadas = [nota["chave"] for nota, motivo in puladas if motivo == SKIP_DUPLICATE]
+            self._done([chave for chave, _, _ in lote if chave not in duplicadas], gravadas)
+            self._mark_duplicate(duplicadas)
+            return gravadas
+        except Exception as e:
+            if len(lote) > 1:
+                return sum(self._send([entrada]) for entrada in lote)
+            chave, _, tentativas = lote[0]
+            espera = min(self.retry_max, self.retry_base * 2 ** tentativas)
+            with self._lock:
+                self._conn.execute(
+                    "UPDATE diario SET tentativas = ?, proxima_tentativa = ?, ultimo_erro = ? WHERE chave = ?",
+                    (tentativas + 1, time.time() + espera, f"{type(e).__name__}: {e}", chave),
+                )
+            return 0
+
+    def _done(self, chaves: List[str], gravadas: int) -> None:
+        # Chave já gravada antes (reenvio) conta como feita: sai do diário do mesmo jeito
+        with self._lock:
+            self._conn.executemany("DELETE FROM diario WHERE chave = ?", [(chave,) for chave in chaves])
+            self.saved += gravadas
+
+    def _mark_duplicate(self, chaves: List[str]) -> None:
+        # Fica no diário, fora dos envios, até o usuário descartar na tela
+        if not chaves:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE diario SET estado = ?, ultimo_erro = ? WHERE chave = ?",
+                [(DUPLICATE, "Cupom já salvo no banco (mesma chave de acesso)", chave) for chave in chaves],
+            )
@@ -0,0 +1,231 @@
+"""
+Interface de armazenamento do DivCount.
+
+O app, a importação em massa e a exportação falam com um StorageBackend;
+open_storage() escolhe a implementação pela URL:
+    postgresql://...          DatabaseManager (database.py): Postgres com pool, o de produção
+    sqlite:///caminho.db      SQLiteStorage (storage_embedded.py): arquivo local, sem servidor
+    sqlite:///:memory:        o mesmo, só em memória (some ao fechar)
+    duckdb:///caminho.duckdb  DuckDBStorage (storage_embedded.py): motor colunar, as
+                              agregações do dashboard rodam nele (duckdb é opcional)
+Todos seguem o mesmo contrato de retorno (colunas, tipos e ordenações), que o
+storage_check.py confere rodando o mesmo roteiro contra cada backend.
+"""
+import os
+from abc import ABC, abstractmethod
+
+ESQUEMAS = ("postgresql", "postgres", "sqlite", "duckdb")
+
+# Motivos de uma nota pulada pelo bulk_insert_invoices
+SKIP_SAVED = "gravada"  # chave de idempotência já gravada: a nota já está no banco
+SKIP_DUPLICATE = "duplicada"  # chave de acesso de um cupom já salvo (ou repetida no lote)
+
+
+class StorageBackend(ABC):
+    """
+    Operações que as telas e as ferramentas de linha de comando usam.
+    As leituras devolvem os mesmos formatos em todos os backends:
+    DataFrames com os tipos de database.FINANCIAL_DTYPES / REIMBURSEMENT_DTYPES,
+    listas de dicts e páginas (linhas, cursor da próxima página ou None).
+    """
+
+    # --- ESCRITAS ---
+    @abstractmethod
+    def save_invoice(self, data_nota, loja, total_nota, pagador, forma_pagamento, itens_processados, chave_acesso=None):
+        """
+        Grava uma nota ("dd/mm/YYYY") com itens e partes e ensina as categorias; True/False.
+        Com `chave_acesso` de um cupom já salvo, não grava nada e devolve False.
+        """
+
+    @abstractmethod
+    def bulk_insert_invoices(self, notas, learn=False, skipped=None):
+        """
+        Grava várias notas numa transação (dicts com data_compra, loja, ..., itens e,
+        opcionais, "chave" de idempotência e "chave_acesso" da NFC-e: nota com
+        qualquer uma das duas já gravada é pulada); com `learn`
+        ensina as categorias dos itens junto. Devolve quantas notas foram gravadas;
+        se `skipped` for uma lista, recebe (nota, SKIP_SAVED ou SKIP_DUPLICATE)
+        de cada nota pulada, depois do commit.
+        """
+
+    @abstractmethod
+    def save_reimbursement(self, pagador, recebedor, valor):
+        """Registra um Pix de hoje entre os participantes; True/False."""
+
+    @abstractmethod
+    def delete_invoices(self, note_ids):
+        """Apaga notas (com itens e partes); devolve quantas foram apagadas (0 se falhar)."""
+
+    @abstractmethod
+    def delete_reimbursements(self, reimb_ids):
+        """Apaga reembolsos; devolve quantos foram apagados (0 se falhar)."""
+
+    def delete_invoice(self, note_id):
+        return self.delete_invoices([note_id]) > 0
+
+    def delete_reimbursement(self, reimb_id):
+        return self.delete_reimbursements([reimb_id]) > 0
+
+    def _split_known(self, notas, gravadas, acessos_salvos, puladas):
+        # Tira do lote as notas com chave de idempotência já gravada e os cupons
+        # (chave de acesso) já salvos ou repetidos no lote; o motivo vai para `puladas`
+        acessos = set(acessos_salvos)
+        novas = []
+        for nota in notas:
+            acesso = nota.get("chave_acesso")
+            if nota.get("chave") in gravadas:
+                puladas.append((nota, SKIP_SAVED))
+            elif acesso and acesso in acessos:
+                puladas.append((nota, SKIP_DUPLICATE))
+            else:
+                if acesso:
+                    acessos.add(acesso)
+                novas.append(nota)
+        return novas
+
+    def _item_shares(self, item):
+        # Partes do item em centavos: {participante: centavos}.
+        # Itens montados sem "Partes" (formato antigo) usam as colunas R$ Kristian/R$ Giulia
+        if item.get("Partes") is not None:
+            return item["Partes"]
+        return {
+            "Kristian": int(round(float(item.get("R$ Kristian", 0.0)) * 100)),
+            "Giulia": int(round(float(item.get("R$ Giulia", 0.0)) * 100)),
+        }
+
+    # --- APRENDIZADO ---
+    @abstractmethod
+    def get_learned_categories(self, nomes, similar=True):
+        """{nome: categoria} dos itens aprendidos (exatos ou, com `similar`, o mais parecido)."""
+
+    @abstractmethod
+    def get_learned_memory(self):
+        """Memória inteira: {chave normalizada: categoria}."""
+
+    @abstractmethod
+    def learn_items(self, categorias):
+        """Ensina várias categorias ({nome: categoria}) de uma vez."""
+
+    @abstractmethod
+    def similarity_index(self):
+        """item_keys.NgramIndex com toda a memória, mantido em dia pelas escritas."""
+
+    def get_learned_category(self, item_nome):
+        return self.get_learned_categories([item_nome]).get(item_nome)
+
+    def learn_item(self, item_nome, categoria):
+        self.learn_items({item_nome: categoria})
+
+    # --- LEITURAS ---
+    @abstractmethod
+    def get_participants(self):
+        """Nomes dos participantes, na ordem de cadastro."""
+
+    @abstractmethod
+    def get_balance_summary(self):
+        """{pessoa: {"consumo", "pago_loja", "pix_enviado", "pix_recebido", "saldo"}}."""
+
+    @abstractmethod
+    def get_financial_data(self):
+        """(itens com dados da nota, reembolsos) como DataFrames."""
+
+    @abstractmethod
+    def get_filter_options(self):
+        """{"min_data", "max_data", "categorias", "lojas"} para os filtros do dashboard."""
+
+    @abstractmethod
+    def get_spending_by_category(self, data_inicio=None, data_fim=None, categoria=None, loja=None):
+        """DataFrame categoria, valor (float64)."""
+
+    @abstractmethod
+    def get_spending_by_date(self, data_inicio=None, data_fim=None, categoria=None, loja=None):
+        """DataFrame data_compra (datetime64), valor (float64), em ordem de data."""
+
+    @abstractmethod
+    def get_filtered_items(self, data_inicio=None, data_fim=None, categoria=None, loja=None):
+        """DataFrame com FILTERED_ITEM_COLUMNS, em ordem de (data, nota, item)."""
+
+    @abstractmethod
+    def iter_filtered_items(self, data_inicio=None, data_fim=None, categoria=None, loja=None, chunk_size=5000):
+        """Os mesmos itens em blocos de tuplas, sem carregar tudo na memória."""
+
+    @abstractmethod
+    def get_all_invoices(self):
+        """[{id, data_compra, loja, total_nota, pagador}], mais recentes primeiro."""
+
+    @abstractmethod
+    def find_invoices_by_access_keys(self, chaves):
+        """{chave_acesso: {id, data_compra, loja, total_nota}} das chaves já salvas (sem cache)."""
+
+    @abstractmethod
+    def get_all_reimbursements(self):
+        """[{id, data_pagamento, pagador, recebedor, valor}], mais recentes primeiro."""
+
+    @abstractmethod
+    def get_invoice_days(self, data_inicio=None, data_fim=None, loja=None, before=None, limit=20):
+        """Página de dias com notas: ([{data_compra, n_notas, total}], cursor ou None)."""
+
+    @abstractmethod
+    def get_invoices_page(self, data_inicio=None, data_fim=None, loja=None, after=None, limit=50):
+        """Página de notas: ([{id, data_compra, loja, total_nota, pagador}], cursor ou None)."""
+
+    @abstractmethod
+    def get_reimbursements_page(self, after=None, limit=20):
+        """Página de reembolsos: ([{id, data_pagamento, pagador, recebedor, valor}], cursor ou None)."""
+
+    # --- MANUTENÇÃO ---
+    @abstractmethod
+    def cache_stats(self):
+        """Acertos/erros do cache de leituras."""
+
+    @abstractmethod
+    def close(self):
+        """Libera conexões (CLI ao terminar)."""
+
+
+def storage_url(cli_url=None):
+    """
+    URL do armazenamento: a da linha de comando, a variável DATABASE_URL ou
+    o DATABASE_URL do secrets.toml do Streamlit, nessa ordem.
+    """
+    if cli_url:
+        return cli_url
+    if os.environ.get("DATABASE_URL"):
+        return os.environ["DATABASE_URL"]
+    import streamlit as st
+    return st.secrets["DATABASE_URL"]
+
+
+def open_storage(url=None):
+    """
+    Abre o backend da URL. Sem `url` (o app), lê o DATABASE_URL dos segredos
+    do Streamlit e, se for Postgres, mantém o tratamento de erro na tela do
+    DatabaseManager; com `url` explícita os erros sobem como exceção.
+    """
+    if url is None:
+        import streamlit as st
+        segredo = st.secrets.get("DATABASE_URL", "")
+        if segredo.split(":", 1)[0] not in ("sqlite", "duckdb"):
+            from database import DatabaseManager
+            return DatabaseManager()
+        url = segredo
+
+    esquema = url.split(":", 1)[0].lower()
+    if esquema in ("postgresql", "postgres"):
+        from database import DatabaseManager
+        return DatabaseManager(url)
+    if esquema == "sqlite":
+        from storage_embedded import SQLiteStorage
+        return SQLiteStorage(_embedded_path(url))
+    if esquema == "duckdb":
+        from storage_embedded import DuckDBStorage
+        return DuckDBStorage(_embedded_path(url))
+    raise ValueError(f"URL de armazenamento não suportada: {url!r} (use {', '.join(ESQUEMAS)})")
+
+
+def _embedded_path(url):
+    # sqlite:///dados/divcount.db -> dados/divcount.db; sqlite:////abs/x.db -> /abs/x.db
+    _, _, caminho = url.partition("://")
+    if caminho.startswith("/"):
+        caminho = caminho[1:]
+    return caminho or ":memory:"
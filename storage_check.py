@@ -0,0 +1,366 @@
+"""
+Roteiro de conformidade dos backends de armazenamento (storage.py).
+
+O projeto não tem suíte de testes; este script faz esse papel para os
+backends: o mesmo roteiro (gravar, ler, filtrar, paginar, aprender, apagar)
+roda contra cada URL e confere colunas, tipos, ordenações e valores contra o
+que foi gravado. Um backend novo só entra se passar aqui como os outros.
+    python storage_check.py                                   # SQLite em memória (+ DuckDB se instalado)
+    python storage_check.py duckdb:///tmp/x.duckdb postgresql://localhost/divcount_teste --apagar-dados
+Um banco que já tem notas só é usado com --apagar-dados (as tabelas são esvaziadas).
+Sai com código 1 se alguma verificação falhar.
+"""
+import argparse
+import importlib.util
+import sys
+from datetime import date, datetime
+
+import pandas as pd
+
+from benchmarks.synthetic import gerar_notas
+from database import FILTERED_ITEM_COLUMNS, FINANCIAL_DTYPES
+from storage import SKIP_DUPLICATE, SKIP_SAVED, open_storage
+
+TOLERANCIA = 0.01
+
+# Duas notas pela tela (save_invoice): uma com Partes em centavos, outra no formato antigo (R$)
+NOTA_KRISTIAN = ("10/01/2024", "MERCADO CONFERENCIA", 40.50, "Kristian", "PIX", [
+    {"Item": "ARROZ TIPO 1 CAMIL 5KG", "Valor (R$)": 10.00, "Categoria": "Geral",
+     "Partes": {"Kristian": 500, "Giulia": 500}},
+    {"Item": "1234 FILE DE FRANGO 0,750KG", "Valor (R$)": 30.50, "Categoria": "Carnes",
+     "Partes": {"Kristian": 3050, "Giulia": 0}},
+])
+NOTA_GIULIA = ("10/01/2024", "ADEGA CONFERENCIA", 45.90, "Giulia", "Dinheiro", [
+    {"Item": "VINHO TINTO 750ML", "Valor (R$)": 45.90, "Categoria": "Bebidas",
+     "R$ Kristian": 22.95, "R$ Giulia": 22.95},
+])
+
+
+def _perto(a, b):
+    return abs(float(a) - float(b)) <= TOLERANCIA
+
+
+class Conferencia:
+    """Acumula as verificações de um backend."""
+
+    def __init__(self, url):
+        self.url = url
+        self.total = 0
+        self.falhas = []
+
+    def __call__(self, nome, ok, detalhe=""):
+        self.total += 1
+        if not ok:
+            self.falhas.append(f"{nome}: {detalhe}" if detalhe else nome)
+        return ok
+
+
+def _como_nota(args):
+    data_nota, loja, total, pagador, forma, itens = args
+    return {
+        "data_compra": datetime.strptime(data_nota, "%d/%m/%Y").date(), "loja": loja,
+        "total_nota": total, "pagador": pagador, "forma_pagamento": forma, "itens": itens,
+    }
+
+
+def _partes(item):
+    if item.get("Partes") is not None:
+        return item["Partes"]
+    return {"Kristian": round(item["R$ Kristian"] * 100), "Giulia": round(item["R$ Giulia"] * 100)}
+
+
+def _esperado_saldo(notas, reembolsos):
+    totais = {p: dict.fromkeys(("consumo", "pago_loja", "pix_enviado", "pix_recebido"), 0.0)
+              for p in ("Kristian", "Giulia")}
+    for nota in notas:
+        for item in nota["itens"]:
+            totais[nota["pagador"]]["pago_loja"] += item["Valor (R$)"]
+            for pessoa, cents in _partes(item).items():
+                totais[pessoa]["consumo"] += cents / 100
+    for pagador, recebedor, valor in reembolsos:
+        totais[pagador]["pix_enviado"] += valor
+        totais[recebedor]["pix_recebido"] += valor
+    for linha in totais.values():
+        linha["saldo"] = linha["pago_loja"] + linha["pix_enviado"] - linha["pix_recebido"] - linha["consumo"]
+    return totais
+
+
+def _conferir_saldo(conferir, db, notas, reembolsos, rotulo):
+    saldo = db.get_balance_summary()
+    esperado = _esperado_saldo(notas, reembolsos)
+    conferir(f"{rotulo}: participantes do saldo", list(saldo) == ["Kristian", "Giulia"], list(saldo))
+    for pessoa, linha in esperado.items():
+        for coluna, valor in linha.items():
+            obtido = saldo.get(pessoa, {}).get(coluna)
+            conferir(f"{rotulo}: {pessoa}.{coluna}", obtido is not None and _perto(obtido, valor), f"{obtido} != {valor:.2f}")
+
+
+def _esvaziar(db):
+    # Só para bancos já usados (--apagar-dados)
+    from database import DatabaseManager
+    if isinstance(db, DatabaseManager):
+        with db._connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "TRUNCATE notas, itens, item_shares, gravacoes, reembolsos, memoria_itens, resumo_mensal RESTART IDENTITY"
+            )
+            cur.execute("DELETE FROM participantes WHERE nome NOT IN ('Kristian', 'Giulia')")
+            conn.commit()
+            cur.close()
+        db.memory_cache.invalidate()
+    else:
+        with db._transaction():
+            for tabela in ("item_shares", "gravacoes", "itens", "notas", "reembolsos", "memoria_itens"):
+                db._run(f"DELETE FROM {tabela}")
+            db._run("DELETE FROM participantes WHERE nome NOT IN ('Kristian', 'Giulia')")
+        db.memory_cache.invalidate()
+        db._indice = None
+    db.result_cache.bump()
+
+
+def roteiro(db, conferir):
+    # --- Banco vazio ---
+    opcoes = db.get_filter_options()
+    conferir("vazio: filtros sem datas", opcoes["min_data"] is None and opcoes["max_data"] is None, opcoes)
+    conferir("vazio: itens filtrados", len(db.get_filtered_items()) == 0)
+    conferir("participantes iniciais", db.get_participants() == ["Kristian", "Giulia"], db.get_participants())
+
+    # --- Escritas ---
+    conferir("save_invoice (Partes)", db.save_invoice(*NOTA_KRISTIAN) is True)
+    conferir("save_invoice (formato antigo)", db.save_invoice(*NOTA_GIULIA) is True)
+    lote = list(gerar_notas(300, seed=7, inicio=date(2023, 6, 1), dias=400))
+    conferir("bulk_insert_invoices", db.bulk_insert_invoices(lote) == len(lote))
+    conferir("bulk_insert_invoices vazio", db.bulk_insert_invoices([]) == 0)
+    reembolsos = [("Giulia", "Kristian", 12.34), ("Kristian", "Giulia", 5.0)]
+    for pagador, recebedor, valor in reembolsos:
+        conferir("save_reimbursement", db.save_reimbursement(pagador, recebedor, valor) is True)
+
+    notas = [_como_nota(NOTA_KRISTIAN), _como_nota(NOTA_GIULIA)] + lote
+    itens = [(nota, item) for nota in notas for item in nota["itens"]]
+    _conferir_saldo(conferir, db, notas, reembolsos, "saldo")
+
+    # --- Leituras do dashboard ---
+    df_compras, df_reembolsos = db.get_financial_data()
+    conferir("financeiro: linhas", len(df_compras) == len(itens), f"{len(df_compras)} != {len(itens)}")
+    for coluna, tipo in FINANCIAL_DTYPES.items():
+        conferir(f"financeiro: tipo de {coluna}", str(df_compras[coluna].dtype) == tipo, df_compras[coluna].dtype)
+    conferir("financeiro: data_compra datetime64", pd.api.types.is_datetime64_any_dtype(df_compras["data_compra"]))
+    conferir("financeiro: reembolsos", len(df_reembolsos) == len(reembolsos))
+    conferir("financeiro: data_pagamento datetime64", pd.api.types.is_datetime64_any_dtype(df_reembolsos["data_pagamento"]))
+
+    opcoes = db.get_filter_options()
+    datas = sorted(nota["data_compra"] for nota in notas)
+    conferir("filtros: datas", (opcoes["min_data"], opcoes["max_data"]) == (datas[0], datas[-1]), opcoes)
+    conferir("filtros: tipo das datas", type(opcoes["min_data"]) is date, type(opcoes["min_data"]))
+    conferir("filtros: categorias", opcoes["categorias"] == sorted({i["Categoria"] for _, i in itens}), opcoes["categorias"])
+    conferir("filtros: lojas", opcoes["lojas"] == sorted({n["loja"] for n in notas}), opcoes["lojas"])
+
+    filtrados = db.get_filtered_items()
+    conferir("filtrados: colunas", tuple(filtrados.columns) == FILTERED_ITEM_COLUMNS, list(filtrados.columns))
+    ordem = [i["Item"] for _, i in sorted(itens, key=lambda par: par[0]["data_compra"])]
+    conferir("filtrados: ordem (data, nota, item)", list(filtrados["item_nome"]) == ordem)
+    conferir("filtrados: categoria", str(filtrados["categoria"].dtype) == "category")
+
+    blocos = list(db.iter_filtered_items(chunk_size=7))
+    linhas = [linha for bloco in blocos for linha in bloco]
+    conferir("blocos: tamanho máximo", all(len(bloco) <= 7 for bloco in blocos))
+    conferir("blocos: mesmas linhas", [linha[4] for linha in linhas] == ordem, f"{len(linhas)} linhas")
+    conferir("blocos: data como date", bool(linhas) and isinstance(linhas[0][0], date))
+
+    por_categoria = db.get_spending_by_category()
+    conferir("por categoria: colunas", list(por_categoria.columns) == ["categoria", "valor"], list(por_categoria.columns))
+    conferir("por categoria: float64", str(por_categoria["valor"].dtype) == "float64")
+    esperado_cat = {}
+    for _, item in itens:
+        esperado_cat[item["Categoria"]] = esperado_cat.get(item["Categoria"], 0) + item["Valor (R$)"]
+    obtido_cat = dict(zip(por_categoria["categoria"], por_categoria["valor"]))
+    conferir("por categoria: valores", obtido_cat.keys() == esperado_cat.keys()
+             and all(_perto(obtido_cat[c], v) for c, v in esperado_cat.items()))
+
+    por_dia = db.get_spending_by_date()
+    conferir("por dia: datetime64", pd.api.types.is_datetime64_any_dtype(por_dia["data_compra"]))
+    conferir("por dia: ordenado", por_dia["data_compra"].is_monotonic_increasing)
+    conferir("por dia: total", _perto(por_dia["valor"].sum(), sum(i["Valor (R$)"] for _, i in itens)))
+
+    # Filtros combinados
+    inicio, fim = date(2024, 1, 1), date(2024, 3, 31)
+    filtro = {"data_inicio": inicio, "data_fim": fim, "categoria": "Carnes", "loja": "Todas"}
+    esperado = [i for n, i in itens if inicio <= n["data_compra"] <= fim and i["Categoria"] == "Carnes"]
+    obtido = db.get_filtered_items(**filtro)
+    conferir("filtro período+categoria", len(obtido) == len(esperado), f"{len(obtido)} != {len(esperado)}")
+    conferir("filtro período+categoria: soma", _perto(db.get_spending_by_category(**filtro)["valor"].sum(),
+                                                      sum(i["Valor (R$)"] for i in esperado)))
+    loja = "MERCADO CONFERENCIA"
+    conferir("filtro loja", list(db.get_filtered_items(loja=loja)["item_nome"]) == [i["Item"] for i in NOTA_KRISTIAN[5]])
+
+    # --- Histórico paginado ---
+    invoices = db.get_all_invoices()
+    conferir("todas as notas", len(invoices) == len(notas))
+    conferir("todas as notas: recentes primeiro",
+             all(a["data_compra"] >= b["data_compra"] for a, b in zip(invoices, invoices[1:])))
+
+    vistos, cursor, paginas = [], None, 0
+    while True:
+        pagina, cursor = db.get_invoices_page(after=cursor, limit=7)
+        vistos += pagina
+        paginas += 1
+        if cursor is None or paginas > len(notas):
+            break
+    chaves = [(n["data_compra"], n["id"]) for n in vistos]
+    conferir("páginas de notas: todas, sem repetir", len(set(chaves)) == len(notas), f"{len(set(chaves))} de {len(notas)}")
+    conferir("páginas de notas: (data, id) decrescente", chaves == sorted(chaves, reverse=True))
+    conferir("páginas de notas: colunas", bool(vistos) and set(vistos[0]) == {"id", "data_compra", "loja", "total_nota", "pagador"})
+
+    dias, cursor = [], None
+    while True:
+        pagina, cursor = db.get_invoice_days(before=cursor, limit=5)
+        dias += pagina
+        if cursor is None or len(dias) > len(notas):
+            break
+    por_data = {}
+    for nota in notas:
+        por_data[nota["data_compra"]] = por_data.get(nota["data_compra"], 0) + 1
+    conferir("páginas de dias: datas", [d["data_compra"] for d in dias] == sorted(por_data, reverse=True))
+    conferir("páginas de dias: contagens", all(d["n_notas"] == por_data.get(d["data_compra"]) for d in dias))
+
+    dia = date(2024, 1, 10)
+    do_dia, _ = db.get_invoices_page(dia, dia, None, limit=50)
+    conferir("notas de um dia", sum(1 for n in notas if n["data_compra"] == dia) == len(do_dia))
+
+    pagina1, cursor = db.get_reimbursements_page(limit=1)
+    pagina2, fim_pag = db.get_reimbursements_page(after=cursor, limit=1)
+    conferir("páginas de reembolsos", len(pagina1) == 1 and len(pagina2) == 1 and fim_pag is None
+             and pagina1[0]["id"] > pagina2[0]["id"])
+    conferir("todos os reembolsos", len(db.get_all_reimbursements()) == len(reembolsos))
+
+    # --- Aprendizado ---
+    aprendidas = db.get_learned_categories(["ARROZ TIPO 1 CAMIL 1KG", "9999 FILE DE FRANGO 1,2KG", "NUNCA VISTO XYZ"])
+    conferir("memória: mesma chave", aprendidas.get("ARROZ TIPO 1 CAMIL 1KG") == "Geral", aprendidas)
+    conferir("memória: sem código e peso", aprendidas.get("9999 FILE DE FRANGO 1,2KG") == "Carnes", aprendidas)
+    conferir("memória: desconhecido fica de fora", "NUNCA VISTO XYZ" not in aprendidas)
+    db.learn_items({"DETERGENTE YPE 500ML": "Limpeza"})
+    conferir("learn_items", db.get_learned_category("DETERGENTE YPE 1L") == "Limpeza")
+    db.learn_item("VINHO TINTO 750ML", "Lazer")
+    conferir("learn_item sobrescreve", db.get_learned_category("VINHO TINTO") == "Lazer")
+    conferir("memória inteira", db.get_learned_memory().get("DETERGENTE YPE") == "Limpeza")
+    parecido = db.similarity_index().best_match("DETERGENTE YPE NEUTRO")
+    conferir("índice de semelhança", parecido is not None and parecido[1] == "Limpeza", parecido)
+    conferir("semelhante via get_learned_categories",
+             db.get_learned_categories(["DETERGENTE YPE NEUTRO"]).get("DETERGENTE YPE NEUTRO") == "Limpeza")
+
+    # --- Cache de leituras ---
+    antes = db.cache_stats()["hits"]
+    db.get_balance_summary()
+    db.get_balance_summary()
+    conferir("cache de leituras", db.cache_stats()["hits"] >= antes + 1)
+    df = db.get_filtered_items()
+    df["nova"] = 1
+    conferir("cache devolve cópia", "nova" not in db.get_filtered_items().columns)
+
+    # --- Apagar ---
+    ids = [n["id"] for n in db.get_invoices_page(dia, dia, "MERCADO CONFERENCIA")[0]]
+    conferir("delete_invoices", db.delete_invoices(ids + [10 ** 8]) == 1)
+    notas = [n for n in notas if n["loja"] != "MERCADO CONFERENCIA"]
+    _conferir_saldo(conferir, db, notas, reembolsos, "saldo após apagar nota")
+    conferir("itens saem com a nota", len(db.get_financial_data()[0]) == sum(len(n["itens"]) for n in notas))
+
+    ids = [n["id"] for n in db.get_invoices_page(dia, dia, "ADEGA CONFERENCIA")[0]]
+    conferir("delete_invoice", len(ids) == 1 and db.delete_invoice(ids[0]) is True)
+    conferir("delete_invoices vazio", db.delete_invoices([]) == 0)
+
+    ids = [r["id"] for r in db.get_all_reimbursements()]
+    conferir("delete_reimbursement", db.delete_reimbursement(ids[0]) is True)
+    conferir("delete_reimbursements", db.delete_reimbursements(ids) == 1)
+    notas = [n for n in notas if n["loja"] != "ADEGA CONFERENCIA"]
+    _conferir_saldo(conferir, db, notas, [], "saldo final")
+    conferir("sem reembolsos", db.get_reimbursements_page() == ([], None))
+
+    # --- Chaves de idempotência (fila de gravação) ---
+    nota = dict(_como_nota(NOTA_GIULIA), chave="conferencia-1", itens=[
+        {"Item": "CHA MATE LEAO 25G", "Valor (R$)": 7.0, "Categoria": "Bebidas", "Partes": {"Kristian": 350, "Giulia": 350}},
+    ])
+    conferir("chave nova grava", db.bulk_insert_invoices([nota], learn=True) == 1)
+    puladas = []
+    conferir("chave repetida é pulada", db.bulk_insert_invoices([nota], learn=True, skipped=puladas) == 0)
+    conferir("skipped: já gravada", [(n["chave"], m) for n, m in puladas] == [("conferencia-1", SKIP_SAVED)], puladas)
+    conferir("lote com chave repetida", db.bulk_insert_invoices([nota, dict(nota, chave="conferencia-2")]) == 1)
+    sem_chave = dict(nota, chave=None, loja="ADEGA CONFERENCIA")
+    conferir("lote: chave pulada + nota sem chave", db.bulk_insert_invoices([nota, sem_chave]) == 1)
+    conferir("learn=True ensina", db.get_learned_category("CHA MATE LEAO") == "Bebidas")
+    ids = [n["id"] for n in db.get_invoices_page(dia, dia, "ADEGA CONFERENCIA")[0]]
+    conferir("apagar notas com e sem chave", db.delete_invoices(ids) == 3)
+    conferir("chave livre depois de apagar", db.bulk_insert_invoices([nota]) == 1)
+
+    # --- Chave de acesso da NFC-e (cupom duplicado) ---
+    acesso = "43240112345678000190650010000123451000123456"
+    padaria = ("11/01/2024", "PADARIA CONFERENCIA", 9.0, "Kristian", "PIX", [
+        {"Item": "PAO FRANCES KG", "Valor (R$)": 9.0, "Categoria": "Geral", "Partes": {"Kristian": 450, "Giulia": 450}},
+    ])
+    conferir("chave de acesso: ainda livre", db.find_invoices_by_access_keys([acesso]) == {})
+    conferir("save_invoice com chave de acesso", db.save_invoice(*padaria, chave_acesso=acesso) is True)
+    achadas = db.find_invoices_by_access_keys([acesso, "0" * 44, None])
+    conferir(
+        "chave de acesso: encontrada",
+        list(achadas) == [acesso] and achadas[acesso]["loja"] == "PADARIA CONFERENCIA"
+        and achadas[acesso]["data_compra"] == date(2024, 1, 11) and _perto(achadas[acesso]["total_nota"], 9.0),
+        achadas,
+    )
+    conferir("save_invoice duplicado é recusado", db.save_invoice(*padaria, chave_acesso=acesso) is False)
+    conferir("sem chave de acesso não colide", db.save_invoice(*padaria) is True)
+    outra = "43240112345678000190650010000123461000123457"
+    conferir("bulk: chave de acesso já salva é pulada", db.bulk_insert_invoices([dict(_como_nota(padaria), chave_acesso=acesso)]) == 0)
+    puladas = []
+    conferir(
+        "bulk: chave de acesso repetida no lote",
+        db.bulk_insert_invoices([dict(_como_nota(padaria), chave_acesso=outra)] * 2, skipped=puladas) == 1,
+    )
+    conferir("skipped: duplicada", [m for _, m in puladas] == [SKIP_DUPLICATE], puladas)
+    ids = [n["id"] for n in db.get_invoices_page(date(2024, 1, 11), date(2024, 1, 11), "PADARIA CONFERENCIA")[0]]
+    conferir("só uma nota por cupom", len(ids) == 3, ids)
+    conferir("apagar libera a chave de acesso", db.delete_invoices(ids) == 3 and db.find_invoices_by_access_keys([acesso, outra]) == {})
+
+
+def conferir_backend(url, apagar_dados=False):
+    conferir = Conferencia(url)
+    try:
+        db = open_storage(url)
+    except Exception as e:
+        conferir("abrir o backend", False, f"{type(e).__name__}: {e}")
+        return conferir
+    try:
+        if db.get_all_invoices() or db.get_all_reimbursements() or db.get_learned_memory():
+            if not apagar_dados:
+                raise SystemExit(f"{url}: o banco já tem dados; use --apagar-dados para esvaziá-lo")
+            _esvaziar(db)
+        roteiro(db, conferir)
+    except SystemExit:
+        raise
+    except Exception as e:
+        conferir("roteiro completo", False, f"{type(e).__name__}: {e}")
+    finally:
+        db.close()
+    return conferir
+
+
+def main(argv=None):
+    padrao = ["sqlite:///:memory:"]
+    if importlib.util.find_spec("duckdb"):
+        padrao.append("duckdb:///:memory:")
+    ap = argparse.ArgumentParser(description="Confere os backends de armazenamento com o mesmo roteiro.")
+    ap.add_argument("urls", nargs="*", default=padrao, help="URLs (postgresql://, sqlite:///, duckdb:///)")
+    ap.add_argument("--apagar-dados", action="store_true", help="Esvazia bancos que já têm dados")
+    args = ap.parse_args(argv)
+
+    falhou = False
+    for url in args.urls:
+        resultado = conferir_backend(url, args.apagar_dados)
+        ok = resultado.total - len(resultado.falhas)
+        print(f"{'OK   ' if not resultado.falhas else 'FALHA'} {url}: {ok}/{resultado.total} verificações")
+        for falha in resultado.falhas:
+            print(f"      - {falha}")
+        falhou = falhou or bool(resultado.falhas)
+    return 1 if falhou else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
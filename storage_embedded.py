@@ -0,0 +1,754 @@
+"""
+Backends embutidos (sem servidor) do StorageBackend: SQLite e DuckDB.
+
+Mesmo esquema lógico do Postgres (notas, itens, reembolsos, memoria_itens,
+participantes, item_shares), criado na abertura; o SQL é o mesmo nos dois
+motores (placeholders ?), as diferenças ficam nas subclasses:
+- SQLiteStorage: um arquivo local (ou :memory:) para rodar o app, a CLI e os
+  benchmarks sem Postgres, com latência zero;
+- DuckDBStorage: motor colunar; as agregações do dashboard (por categoria, por
+  dia, saldo) rodam nele e os DataFrames saem direto do resultado colunar.
+Uma conexão por backend, protegida por um RLock (as sessões do Streamlit
+dividem a mesma instância). Sem resumo_mensal: o saldo é agregado na hora.
+"""
+import sqlite3
+import threading
+from abc import abstractmethod
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import pandas as pd
+import streamlit as st
+
+from database import (
+    FILTERED_ITEM_COLUMNS, FINANCIAL_DTYPES, REIMBURSEMENT_DTYPES,
+    LearnedCategoryCache, ResultCache, cached_read,
+)
+from db_pool import _sql_rotulo
+from item_keys import NgramIndex, normalize_item_key
+from storage import StorageBackend
+from tracing import span, traced
+
+PARTICIPANTES_INICIAIS = ("Kristian", "Giulia")
+
+_TABELAS = (
+    """
+    CREATE TABLE IF NOT EXISTS notas (
+        id INTEGER PRIMARY KEY,
+        data_compra DATE NOT NULL,
+        loja TEXT NOT NULL,
+        total_nota REAL NOT NULL,
+        pagador TEXT NOT NULL,
+        forma_pagamento TEXT,
+        data_registro TIMESTAMP NOT NULL,
+        chave_acesso TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS itens (
+        id INTEGER PRIMARY KEY,
+        nota_id INTEGER NOT NULL,
+        item_nome TEXT NOT NULL,
+        valor REAL NOT NULL,
+        categoria TEXT NOT NULL,
+        kristian_parte REAL NOT NULL,
+        giulia_parte REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS reembolsos (
+        id INTEGER PRIMARY KEY,
+        data_pagamento DATE NOT NULL,
+        pagador TEXT NOT NULL,
+        recebedor TEXT NOT NULL,
+        valor REAL NOT NULL,
+        comprovante TEXT,
+        data_registro TIMESTAMP NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS memoria_itens (
+        item_chave TEXT PRIMARY KEY,
+        item_nome TEXT NOT NULL,
+        categoria TEXT NOT NULL,
+        ultima_atualizacao DATE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS participantes (
+        id INTEGER PRIMARY KEY,
+        nome TEXT NOT NULL UNIQUE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS item_shares (
+        item_id INTEGER NOT NULL,
+        participant_id INTEGER NOT NULL,
+        cents BIGINT NOT NULL,
+        PRIMARY KEY (item_id, participant_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS gravacoes (
+        chave TEXT PRIMARY KEY,
+        nota_id INTEGER NOT NULL,
+        gravada_em TIMESTAMP NOT NULL
+    )
+    """,
+)
+
+# Os mesmos índices do Postgres (migrations.py), para o SQLite
+_INDICES = (
+    "CREATE INDEX IF NOT EXISTS idx_itens_nota_id ON itens (nota_id)",
+    "CREATE INDEX IF NOT EXISTS idx_itens_categoria ON itens (categoria)",
+    "CREATE INDEX IF NOT EXISTS idx_notas_data_compra ON notas (data_compra, id)",
+    "CREATE INDEX IF NOT EXISTS idx_notas_loja_data ON notas (loja, data_compra)",
+    "CREATE INDEX IF NOT EXISTS idx_reembolsos_data_pagamento ON reembolsos (data_pagamento, id)",
+    "CREATE INDEX IF NOT EXISTS idx_item_shares_participant ON item_shares (participant_id)",
+    "CREATE INDEX IF NOT EXISTS idx_gravacoes_nota_id ON gravacoes (nota_id)",
+)
+
+# Em qualquer motor: um cupom (chave de acesso) só entra uma vez. NULLs não colidem,
+# então notas sem chave ficam de fora sem precisar de índice parcial
+_INDICES_UNICOS = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_notas_chave_acesso ON notas (chave_acesso)",
+)
+
+_FILTERED_ITEM_SQL = ", ".join(
+    ("i." if coluna in ("item_nome", "categoria", "valor", "kristian_parte", "giulia_parte") else "n.") + coluna
+    for coluna in FILTERED_ITEM_COLUMNS
+)
+
+
+def _em(valores):
+    # "(?, ?, ?)" para um IN com len(valores) parâmetros
+    return "(" + ", ".join("?" * len(valores)) + ")"
+
+
+def _as_date(valor):
+    # MIN/MAX perdem o tipo declarado no SQLite e voltam como texto ISO
+    if isinstance(valor, str):
+        return date.fromisoformat(valor[:10])
+    if isinstance(valor, datetime):
+        return valor.date()
+    return valor
+
+
+class EmbeddedStorage(StorageBackend):
+    """Implementação comum aos motores embutidos; as subclasses abrem a conexão e leem DataFrames."""
+
+    BEGIN = "BEGIN"
+    INDICES = _INDICES
+
+    def __init__(self, path=":memory:"):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = self._connect(path)
+        self.memory_cache = LearnedCategoryCache()
+        self.result_cache = ResultCache()
+        self._indice = None
+        self._create_tables()
+
+    # --- CONEXÃO (por motor) ---
+    @abstractmethod
+    def _connect(self, path):
+        """Conexão do motor com o arquivo (ou :memory:)."""
+
+    @abstractmethod
+    def _fetch_frame(self, sql, params):
+        """DataFrame cru do resultado (os tipos são acertados em _frame)."""
+
+    def _insert_rows(self, tabela, colunas, linhas):
+        self._conn.executemany(
+            f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES {_em(colunas)}", linhas
+        )
+
+    # --- EXECUÇÃO ---
+    def _run(self, sql, params=()):
+        # Um comando, como span "query" no rerun ativo (igual aos cursores do Postgres)
+        with self._lock, span("query", "query", sql=_sql_rotulo(sql)):
+            return self._conn.execute(sql, params)
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._run(sql, params).fetchall()
+
+    def _query_dicts(self, sql, params=()):
+        with self._lock:
+            cur = self._run(sql, params)
+            colunas = [d[0] for d in cur.description]
+            return [dict(zip(colunas, linha)) for linha in cur.fetchall()]
+
+    def _frame(self, sql, params=(), dtype=None, dates=()):
+        with self._lock, span("query", "query", sql=_sql_rotulo(sql)) as s:
+            df = self._fetch_frame(sql, params)
+            s["linhas"] = len(df)
+        for coluna, tipo in (dtype or {}).items():
+            if coluna in df.columns:
+                df[coluna] = df[coluna].astype(tipo)
+        for coluna in dates:
+            df[coluna] = pd.to_datetime(df[coluna]).astype("datetime64[ns]")
+        return df
+
+    @contextmanager
+    def _transaction(self):
+        # Tudo ou nada; o lock fica com a thread até o COMMIT/ROLLBACK
+        with self._lock:
+            self._conn.execute(self.BEGIN)
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _next_ids(self, tabela, n):
+        # Ids seguintes ao maior da tabela (dentro da transação, com o lock)
+        inicio = self._run(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {tabela}").fetchone()[0]
+        return list(range(inicio, inicio + n))
+
+    def _create_tables(self):
+        with self._transaction():
+            for ddl in _TABELAS:
+                self._run(ddl)
+            # Arquivo criado antes da chave de acesso: acrescenta a coluna (antes dos índices)
+            colunas = [d[0] for d in self._run("SELECT * FROM notas LIMIT 0").description]
+            if "chave_acesso" not in colunas:
+                self._run("ALTER TABLE notas ADD COLUMN chave_acesso TEXT")
+            for ddl in self.INDICES + _INDICES_UNICOS:
+                self._run(ddl)
+            existentes = {nome for (nome,) in self._run("SELECT nome FROM participantes").fetchall()}
+            faltando = [nome for nome in PARTICIPANTES_INICIAIS if nome not in existentes]
+            if faltando:
+                self._insert_rows("participantes", ("id", "nome"), list(zip(self._next_ids("participantes", len(faltando)), faltando)))
+
+    # --- FUNÇÕES DE APRENDIZADO ---
+    def similarity_index(self):
+        with self._lock:
+            if self._indice is None:
+                indice = NgramIndex()
+                indice.add_many(self.get_learned_memory().items())
+                self._indice = indice
+            return self._indice
+
+    @traced(tipo="db")
+    def get_learned_categories(self, nomes, similar=True):
+        chaves = {nome: normalize_item_key(nome) for nome in dict.fromkeys(nomes)}
+        unicas = [c for c in dict.fromkeys(chaves.values()) if c]
+        encontrados, faltando = self.memory_cache.get_many(unicas)
+
+        if faltando:
+            do_banco = dict(self._query(
+                f"SELECT item_chave, categoria FROM memoria_itens WHERE item_chave IN {_em(faltando)}", faltando
+            ))
+            novos = {chave: do_banco.get(chave) for chave in faltando}
+            self.memory_cache.put_many(novos)
+            encontrados.update(novos)
+
+        resultado = {}
+        for nome, chave in chaves.items():
+            categoria = encontrados.get(chave)
+            if categoria is None and similar and chave:
+                parecido = self.similarity_index().best_match(chave)
+                if parecido:
+                    categoria = parecido[1]
+            if categoria is not None:
+                resultado[nome] = categoria
+        return resultado
+
+    def get_learned_memory(self):
+        return dict(self._query("SELECT item_chave, categoria FROM memoria_itens"))
+
+    def _upsert_memory(self, categorias, data_hoje):
+        # Uma linha por chave normalizada (vale o último nome); devolve {chave: categoria}
+        por_chave = {}
+        for nome, categoria in categorias.items():
+            chave = normalize_item_key(nome)
+            if chave:
+                por_chave[chave] = (nome, categoria)
+        if por_chave:
+            self._conn.executemany(
+                """
+                INSERT INTO memoria_itens (item_chave, item_nome, categoria, ultima_atualizacao)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (item_chave) DO UPDATE SET item_nome = excluded.item_nome,
+                                                       categoria = excluded.categoria,
+                                                       ultima_atualizacao = excluded.ultima_atualizacao
+                """,
+                [(chave, nome, cat, data_hoje) for chave, (nome, cat) in por_chave.items()],
+            )
+        return {chave: cat for chave, (_, cat) in por_chave.items()}
+
+    def _remember(self, aprendidas):
+        # Só depois do commit: cache LRU e índice de semelhança (se já carregado)
+        self.memory_cache.put_many(aprendidas)
+        if self._indice is not None:
+            self._indice.add_many(aprendidas.items())
+
+    @traced(tipo="db")
+    def learn_items(self, categorias):
+        with self._transaction():
+            aprendidas = self._upsert_memory(categorias, datetime.now().date())
+        self.result_cache.bump()
+        self._remember(aprendidas)
+
+    # --- NOTAS ---
+    def _participant_ids(self, nomes):
+        # {nome: id}, cadastrando quem ainda não existe (dentro da transação)
+        ids = dict(self._run("SELECT nome, id FROM participantes").fetchall())
+        novos = sorted(set(nomes) - set(ids))
+        if novos:
+            linhas = list(zip(self._next_ids("participantes", len(novos)), novos))
+            self._insert_rows("participantes", ("id", "nome"), linhas)
+            ids.update((nome, pid) for pid, nome in linhas)
+        return ids
+
+    def _insert_invoices(self, notas, data_registro):
+        # Notas, itens e partes em três inserts em lote (dentro da transação)
+        nota_ids = self._next_ids("notas", len(notas))
+        item_ids = iter(self._next_ids("itens", sum(len(nota["itens"]) for nota in notas)))
+        linhas_notas, linhas_itens, partes = [], [], []
+        for nota_id, nota in zip(nota_ids, notas):
+            linhas_notas.append((
+                nota_id, nota["data_compra"], nota["loja"], nota["total_nota"],
+                nota["pagador"], nota["forma_pagamento"], data_registro, nota.get("chave_acesso"),
+            ))
+            for item in nota["itens"]:
+                item_id = next(item_ids)
+                cents = self._item_shares(item)
+                linhas_itens.append((
+                    item_id, nota_id, item['Item'], item['Valor (R$)'], item['Categoria'],
+                    cents.get("Kristian", 0) / 100, cents.get("Giulia", 0) / 100,
+                ))
+                partes.append((item_id, cents))
+
+        participantes = self._participant_ids([nome for _, cents in partes for nome in cents])
+        linhas_partes = [
+            (item_id, participantes[nome], valor)
+            for item_id, cents in partes for nome, valor in cents.items() if valor
+        ]
+        self._insert_rows(
+            "notas",
+            ("id", "data_compra", "loja", "total_nota", "pagador", "forma_pagamento", "data_registro", "chave_acesso"),
+            linhas_notas,
+        )
+        if linhas_itens:
+            self._insert_rows(
+                "itens", ("id", "nota_id", "item_nome", "valor", "categoria", "kristian_parte", "giulia_parte"),
+                linhas_itens,
+            )
+        if linhas_partes:
+            self._insert_rows("item_shares", ("item_id", "participant_id", "cents"), linhas_partes)
+        linhas_chaves = [
+            (nota["chave"], nota_id, data_registro) for nota_id, nota in zip(nota_ids, notas) if nota.get("chave")
+        ]
+        if linhas_chaves:
+            self._insert_rows("gravacoes", ("chave", "nota_id", "gravada_em"), linhas_chaves)
+
+    @traced(tipo="db")
+    def save_invoice(self, data_nota, loja, total_nota, pagador, forma_pagamento, itens_processados, chave_acesso=None):
+        nota = {
+            "data_compra": datetime.strptime(data_nota, "%d/%m/%Y").date(),
+            "loja": loja, "total_nota": total_nota, "pagador": pagador,
+            "forma_pagamento": forma_pagamento, "itens": itens_processados, "chave_acesso": chave_acesso,
+        }
+        data_registro = datetime.now()
+        try:
+            with self._transaction():
+                if chave_acesso and self._existing_access_keys([chave_acesso]):
+                    st.error("Esta nota já foi salva (mesma chave de acesso).")
+                    return False
+                self._insert_invoices([nota], data_registro)
+                # Se o item aparece duas vezes, vale a última categoria escolhida
+                aprendidas = self._upsert_memory(
+                    {item['Item']: item['Categoria'] for item in itens_processados}, data_registro.date()
+                )
+        except Exception as e:
+            st.error(f"Erro ao salvar nota: {e}")
+            return False
+        self.result_cache.bump()
+        self._remember(aprendidas)
+        return True
+
+    def _existing_access_keys(self, chaves):
+        # Das chaves de acesso informadas, as que já estão em alguma nota (índice único)
+        chaves = list(dict.fromkeys(chaves))
+        if not chaves:
+            return set()
+        return {c for (c,) in self._query(f"SELECT chave_acesso FROM notas WHERE chave_acesso IN {_em(chaves)}", chaves)}
+
+    @traced(tipo="db")
+    def bulk_insert_invoices(self, notas, learn=False, skipped=None):
+        if not notas:
+            return 0
+        data_registro = datetime.now()
+        aprendidas = {}
+        puladas = []
+        with self._transaction():
+            chaves = [nota["chave"] for nota in notas if nota.get("chave")]
+            ja_gravadas = set()
+            if chaves:
+                ja_gravadas = {
+                    c for (c,) in self._run(f"SELECT chave FROM gravacoes WHERE chave IN {_em(chaves)}", chaves).fetchall()
+                }
+            acessos_salvos = self._existing_access_keys([nota["chave_acesso"] for nota in notas if nota.get("chave_acesso")])
+            notas = self._split_known(notas, ja_gravadas, acessos_salvos, puladas)
+            if notas:
+                self._insert_invoices(notas, data_registro)
+                if learn:
+                    aprendidas = self._upsert_memory(
+                        {item['Item']: item['Categoria'] for nota in notas for item in nota["itens"]},
+                        data_registro.date(),
+                    )
+        if notas:
+            self.result_cache.bump()
+            self._remember(aprendidas)
+        if skipped is not None:
+            skipped.extend(puladas)
+        return len(notas)
+
+    @traced(tipo="db")
+    def save_reimbursement(self, pagador, recebedor, valor):
+        data_registro = datetime.now()
+        try:
+            with self._transaction():
+                self._insert_rows(
+                    "reembolsos", ("id", "data_pagamento", "pagador", "recebedor", "valor", "data_registro"),
+                    [(self._next_ids("reembolsos", 1)[0], data_registro.date(), pagador, recebedor, valor, data_registro)],
+                )
+        except Exception:
+            return False
+        self.result_cache.bump()
+        return True
+
+    # --- DELETAR ---
+    # Sem chaves estrangeiras: partes, itens e chaves de gravação saem explicitamente, na mesma transação
+    @traced(tipo="db")
+    def delete_invoices(self, note_ids):
+        note_ids = sorted({int(n) for n in note_ids})
+        if not note_ids:
+            return 0
+        em = _em(note_ids)
+        try:
+            with self._transaction():
+                apagadas = self._run(f"SELECT COUNT(*) FROM notas WHERE id IN {em}", note_ids).fetchone()[0]
+                self._run(f"DELETE FROM item_shares WHERE item_id IN (SELECT id FROM itens WHERE nota_id IN {em})", note_ids)
+                self._run(f"DELETE FROM itens WHERE nota_id IN {em}", note_ids)
+                self._run(f"DELETE FROM gravacoes WHERE nota_id IN {em}", note_ids)
+                self._run(f"DELETE FROM notas WHERE id IN {em}", note_ids)
+        except Exception as e:
+            st.error(f"Erro ao excluir notas: {e}")
+            return 0
+        self.result_cache.bump()
+        return apagadas
+
+    @traced(tipo="db")
+    def delete_reimbursements(self, reimb_ids):
+        reimb_ids = sorted({int(r) for r in reimb_ids})
+        if not reimb_ids:
+            return 0
+        em = _em(reimb_ids)
+        try:
+            with self._transaction():
+                apagados = self._run(f"SELECT COUNT(*) FROM reembolsos WHERE id IN {em}", reimb_ids).fetchone()[0]
+                self._run(f"DELETE FROM reembolsos WHERE id IN {em}", reimb_ids)
+        except Exception as e:
+            st.error(f"Erro ao excluir reembolsos: {e}")
+            return 0
+        self.result_cache.bump()
+        return apagados
+
+    # --- LEITURA DE DADOS ---
+    def get_participants(self):
+        return [nome for (nome,) in self._query("SELECT nome FROM participantes ORDER BY id")]
+
+    @cached_read
+    def get_balance_summary(self):
+        # Agregado na hora a partir das partes, dos itens e dos reembolsos
+        totais = {}
+        linhas = self._query("""
+            SELECT p.nome,
+                   COALESCE((SELECT SUM(s.cents) FROM item_shares s WHERE s.participant_id = p.id), 0) / 100.0,
+                   COALESCE((SELECT SUM(CAST(i.valor AS DOUBLE)) FROM notas n JOIN itens i ON i.nota_id = n.id
+                             WHERE n.pagador = p.nome), 0),
+                   COALESCE((SELECT SUM(CAST(r.valor AS DOUBLE)) FROM reembolsos r WHERE r.pagador = p.nome), 0),
+                   COALESCE((SELECT SUM(CAST(r.valor AS DOUBLE)) FROM reembolsos r WHERE r.recebedor = p.nome), 0)
+            FROM participantes p
+            ORDER BY p.id
+        """)
+        for pessoa, *valores in linhas:
+            linha = dict(zip(("consumo", "pago_loja", "pix_enviado", "pix_recebido"), map(float, valores)))
+            linha["saldo"] = linha["pago_loja"] + linha["pix_enviado"] - linha["pix_recebido"] - linha["consumo"]
+            totais[pessoa] = linha
+        return totais
+
+    @cached_read
+    def get_financial_data(self):
+        df_compras = self._frame(
+            """
+            SELECT n.id AS nota_id, n.data_compra, n.loja, n.pagador, n.forma_pagamento,
+                   i.item_nome, i.categoria, i.valor, i.kristian_parte, i.giulia_parte
+            FROM notas n JOIN itens i ON n.id = i.nota_id
+            """,
+            dtype=FINANCIAL_DTYPES, dates=("data_compra",),
+        )
+        df_reembolsos = self._frame(
+            "SELECT id, data_pagamento, pagador, recebedor, valor, comprovante, data_registro FROM reembolsos",
+            dtype=REIMBURSEMENT_DTYPES, dates=("data_pagamento", "data_registro"),
+        )
+        return df_compras, df_reembolsos
+
+    # --- CONSULTAS DO DASHBOARD ---
+    def _dashboard_filters(self, data_inicio=None, data_fim=None, categoria=None, loja=None):
+        # Mesmo WHERE do DatabaseManager, com placeholders ?
+        condicoes, params = [], []
+        if data_inicio is not None:
+            condicoes.append("n.data_compra >= ?")
+            params.append(data_inicio)
+        if data_fim is not None:
+            condicoes.append("n.data_compra <= ?")
+            params.append(data_fim)
+        if categoria and categoria != "Todas":
+            condicoes.append("i.categoria = ?")
+            params.append(categoria)
+        if loja and loja != "Todas":
+            condicoes.append("n.loja = ?")
+            params.append(loja)
+        return " AND ".join(condicoes) or "TRUE", params
+
+    @cached_read
+    def get_filter_options(self):
+        min_data, max_data = self._query("""
+            SELECT MIN(n.data_compra), MAX(n.data_compra) FROM notas n
+            WHERE EXISTS (SELECT 1 FROM itens i WHERE i.nota_id = n.id)
+        """)[0]
+        categorias = [row[0] for row in self._query("SELECT DISTINCT categoria FROM itens ORDER BY categoria")]
+        lojas = [row[0] for row in self._query("SELECT DISTINCT loja FROM notas ORDER BY loja")]
+        return {"min_data": _as_date(min_data), "max_data": _as_date(max_data), "categorias": categorias, "lojas": lojas}
+
+    @cached_read
+    def get_spending_by_category(self, data_inicio=None, data_fim=None, categoria=None, loja=None):
+        where, params = self._dashboard_filters(data_inicio, data_fim, categoria, loja)
+        return self._frame(
+            f"""
+            SELECT i.categoria, SUM(CAST(i.valor AS DOUBLE)) AS valor
+            FROM notas n JOIN itens i ON n.id = i.nota_id
+            WHERE {where}
+            GROUP BY i.categoria
+            """,
+            params, dtype={"valor": "float64"},
+        )
+
+    @cached_read
+    def get_spending_by_date(self, data_inicio=None, data_fim=None, categoria=None, loja=None):
+        where, params = self._dashboard_filters(data_inicio, data_fim, categoria, loja)
+        return self._frame(
+            f"""
+            SELECT n.data_compra, SUM(CAST(i.valor AS DOUBLE)) AS valor
+            FROM notas n JOIN itens i ON n.id = i.nota_id
+            WHERE {where}
+            GROUP BY n.data_compra
+            ORDER BY n.data_compra
+            """,
+            params, dtype={"valor": "float64"}, dates=("data_compra",),
+        )
+
+    @cached_read
+    def get_filtered_items(self, data_inicio=None, data_fim=None, categoria=None, loja=None):
+        where, params = self._dashboard_filters(data_inicio, data_fim, categoria, loja)
+        return self._frame(
+            f"""
+            SELECT {_FILTERED_ITEM_SQL}
+            FROM notas n JOIN itens i ON n.id = i.nota_id
+            WHERE {where}
+            ORDER BY n.data_compra, n.id, i.id
+            """,
+            params, dtype=FINANCIAL_DTYPES, dates=("data_compra",),
+        )
+
+    def iter_filtered_items(self, data_inicio=None, data_fim=None, categoria=None, loja=None, chunk_size=5000):
+        """
+        Blocos por keyset em (data, nota, item): cada bloco é uma consulta curta,
+        então o lock não fica preso enquanto quem chama escreve o arquivo.
+        """
+        where, params = self._dashboard_filters(data_inicio, data_fim, categoria, loja)
+        depois = None
+        while True:
+            condicao, extra = where, []
+            if depois is not None:
+                data, nota_id, item_id = depois
+                condicao += (
+                    " AND (n.data_compra > ? OR (n.data_compra = ?"
+                    " AND (n.id > ? OR (n.id = ? AND i.id > ?))))"
+                )
+                extra = [data, data, nota_id, nota_id, item_id]
+            linhas = self._query(
+                f"""
+                SELECT {_FILTERED_ITEM_SQL}, n.id, i.id
+                FROM notas n JOIN itens i ON n.id = i.nota_id
+                WHERE {condicao}
+                ORDER BY n.data_compra, n.id, i.id
+                LIMIT ?
+                """,
+                params + extra + [chunk_size],
+            )
+            if not linhas:
+                break
+            depois = (linhas[-1][0], linhas[-1][-2], linhas[-1][-1])
+            yield [linha[:-2] for linha in linhas]
+            if len(linhas) < chunk_size:
+                break
+
+    @cached_read
+    def get_all_invoices(self):
+        return self._query_dicts("SELECT id, data_compra, loja, total_nota, pagador FROM notas ORDER BY data_compra DESC")
+
+    @traced(tipo="db")
+    def find_invoices_by_access_keys(self, chaves):
+        # Sem cache: a checagem de duplicidade precisa ver a nota salva há um instante
+        chaves = list(dict.fromkeys(chave for chave in chaves if chave))
+        if not chaves:
+            return {}
+        linhas = self._query_dicts(
+            f"SELECT chave_acesso, id, data_compra, loja, total_nota FROM notas WHERE chave_acesso IN {_em(chaves)}",
+            chaves,
+        )
+        return {linha.pop("chave_acesso"): linha for linha in linhas}
+
+    @cached_read
+    def get_all_reimbursements(self):
+        return self._query_dicts(
+            "SELECT id, data_pagamento, pagador, recebedor, valor FROM reembolsos ORDER BY data_pagamento DESC"
+        )
+
+    # --- HISTÓRICO PAGINADO (keyset) ---
+    @cached_read
+    def get_invoice_days(self, data_inicio=None, data_fim=None, loja=None, before=None, limit=20):
+        where, params = self._dashboard_filters(data_inicio, data_fim, None, loja)
+        if before is not None:
+            where += " AND n.data_compra < ?"
+            params.append(before)
+        dias = self._query_dicts(
+            f"""
+            SELECT n.data_compra, COUNT(*) AS n_notas, SUM(CAST(n.total_nota AS DOUBLE)) AS total
+            FROM notas n WHERE {where}
+            GROUP BY n.data_compra
+            ORDER BY n.data_compra DESC
+            LIMIT ?
+            """,
+            params + [limit + 1],
+        )
+        for dia in dias:
+            dia["data_compra"] = _as_date(dia["data_compra"])
+        proximo = dias[limit - 1]["data_compra"] if len(dias) > limit else None
+        return dias[:limit], proximo
+
+    @cached_read
+    def get_invoices_page(self, data_inicio=None, data_fim=None, loja=None, after=None, limit=50):
+        where, params = self._dashboard_filters(data_inicio, data_fim, None, loja)
+        if after is not None:
+            where += " AND (n.data_compra < ? OR (n.data_compra = ? AND n.id < ?))"
+            params.extend((after[0], after[0], after[1]))
+        notas = self._query_dicts(
+            f"""
+            SELECT n.id, n.data_compra, n.loja, n.total_nota, n.pagador
+            FROM notas n WHERE {where}
+            ORDER BY n.data_compra DESC, n.id DESC
+            LIMIT ?
+            """,
+            params + [limit + 1],
+        )
+        proximo = (notas[limit - 1]["data_compra"], notas[limit - 1]["id"]) if len(notas) > limit else None
+        return notas[:limit], proximo
+
+    @cached_read
+    def get_reimbursements_page(self, after=None, limit=20):
+        where, params = "TRUE", []
+        if after is not None:
+            where = "(data_pagamento < ? OR (data_pagamento = ? AND id < ?))"
+            params.extend((after[0], after[0], after[1]))
+        reembolsos = self._query_dicts(
+            f"""
+            SELECT id, data_pagamento, pagador, recebedor, valor FROM reembolsos
+            WHERE {where}
+            ORDER BY data_pagamento DESC, id DESC
+            LIMIT ?
+            """,
+            params + [limit + 1],
+        )
+        proximo = (
+            (reembolsos[limit - 1]["data_pagamento"], reembolsos[limit - 1]["id"])
+            if len(reembolsos) > limit else None
+        )
+        return reembolsos[:limit], proximo
+
+    def cache_stats(self):
+        return self.result_cache.stats()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ===============================================================
+# SQLITE
+# ===============================================================
+# Datas gravadas como texto ISO e devolvidas como date/datetime pelas colunas
+# DATE/TIMESTAMP (os adaptadores padrão do sqlite3 estão obsoletos desde o 3.12)
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda valor: valor.isoformat(" "))
+sqlite3.register_converter("DATE", lambda texto: date.fromisoformat(texto.decode()))
+sqlite3.register_converter("TIMESTAMP", lambda texto: datetime.fromisoformat(texto.decode()))
+
+
+class SQLiteStorage(EmbeddedStorage):
+    """Arquivo SQLite local (ou :memory:): o app e a CLI sem servidor nenhum."""
+
+    BEGIN = "BEGIN IMMEDIATE" # Trava a escrita já no início: MAX(id)+1 seguro entre processos
+
+    def _connect(self, path):
+        conn = sqlite3.connect(
+            path, detect_types=sqlite3.PARSE_DECLTYPES, isolation_level=None, check_same_thread=False,
+        )
+        if path != ":memory:":
+            # WAL: leitores (ex.: o app) não bloqueiam a importação em massa e vice-versa
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _fetch_frame(self, sql, params):
+        cur = self._conn.execute(sql, params)
+        colunas = [d[0] for d in cur.description]
+        return pd.DataFrame.from_records(cur.fetchall(), columns=colunas)
+
+
+# ===============================================================
+# DUCKDB
+# ===============================================================
+class DuckDBStorage(EmbeddedStorage):
+    """
+    DuckDB: as agregações do dashboard rodam no motor colunar e o resultado
+    vira DataFrame direto (.df()), sem passar por tuplas Python.
+    Os lotes entram como DataFrame registrado (INSERT ... SELECT), não linha a linha.
+    """
+
+    BEGIN = "BEGIN TRANSACTION"
+    INDICES = () # Zone maps do formato colunar bastam; índices ART só pesariam nos inserts
+
+    def _connect(self, path):
+        try:
+            import duckdb
+        except ImportError:
+            raise RuntimeError("O backend DuckDB precisa do pacote duckdb: pip install duckdb") from None
+        return duckdb.connect(path)
+
+    def _fetch_frame(self, sql, params):
+        return self._conn.execute(sql, params).df()
+
+    def _insert_rows(self, tabela, colunas, linhas):
+        lote = pd.DataFrame.from_records(linhas, columns=colunas)
+        self._conn.register("_lote", lote)
+        try:
+            self._conn.execute(f"INSERT INTO {tabela} ({', '.join(colunas)}) SELECT * FROM _lote")
+        finally:
+            self._conn.unregister("_lote")
@@ -0,0 +1,151 @@
+"""
+Medição leve dos caminhos quentes: parser, consultas ao banco, categorização e telas.
+
+Cada rerun do Streamlit abre um RerunTrace (TraceBuffer.begin_rerun) na thread
+do script; span() cronometra um bloco e o guarda no rerun ativo daquela thread,
+com o nível de aninhamento e os atributos que o bloco quiser anotar (linhas,
+páginas, acerto de cache...). Fora de um rerun (CLI, worker em segundo plano)
+span() não guarda nada. O TraceBuffer mantém só os últimos reruns.
+"""
+import functools
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+_local = threading.local()
+
+
+class RerunTrace:
+    """Spans de um rerun, na ordem em que terminaram."""
+
+    def __init__(self, numero, rotulo="", max_spans=2000):
+        self.numero = numero
+        self.rotulo = rotulo
+        self.inicio = datetime.now()
+        self.spans = []
+        self.descartados = 0 # Spans além de max_spans (contados, não guardados)
+        self.max_spans = max_spans
+        self._t0 = time.perf_counter()
+        self._fim = None
+        self._nivel = 0
+
+    @property
+    def duracao_ms(self):
+        fim = self._fim if self._fim is not None else time.perf_counter()
+        return (fim - self._t0) * 1000
+
+    def _add(self, registro):
+        if len(self.spans) < self.max_spans:
+            self.spans.append(registro)
+        else:
+            self.descartados += 1
+
+    def to_dict(self):
+        return {
+            "numero": self.numero,
+            "rotulo": self.rotulo,
+            "inicio": self.inicio.isoformat(timespec="milliseconds"),
+            "duracao_ms": round(self.duracao_ms, 3),
+            "descartados": self.descartados,
+            "spans": sorted(self.spans, key=lambda s: s["inicio_ms"]),
+        }
+
+
+class TraceBuffer:
+    """
+    Buffer circular dos últimos `max_reruns` reruns (um por sessão, guardado
+    no session_state). Thread-safe: o painel lê enquanto o script escreve.
+    """
+
+    def __init__(self, max_reruns=20, max_spans=2000):
+        self.max_spans = max_spans
+        self._reruns = deque(maxlen=max_reruns)
+        self._contador = 0
+        self._lock = threading.Lock()
+
+    def begin_rerun(self, rotulo=""):
+        """Abre um rerun e o torna o ativo da thread atual."""
+        with self._lock:
+            self._contador += 1
+            rerun = RerunTrace(self._contador, rotulo, self.max_spans)
+            self._reruns.append(rerun)
+        _local.atual = rerun
+        return rerun
+
+    @staticmethod
+    def end_rerun():
+        rerun = getattr(_local, "atual", None)
+        if rerun is not None:
+            rerun._fim = time.perf_counter()
+        _local.atual = None
+
+    def reruns(self):
+        with self._lock:
+            return list(self._reruns)
+
+    def clear(self):
+        with self._lock:
+            self._reruns.clear()
+
+    def slowest(self, n=20, tipo=None):
+        """Os `n` spans mais lentos do buffer inteiro (com o número do rerun)."""
+        todos = [
+            dict(span, rerun=rerun.numero)
+            for rerun in self.reruns() for span in list(rerun.spans)
+            if tipo is None or span["tipo"] == tipo
+        ]
+        return sorted(todos, key=lambda s: s["duracao_ms"], reverse=True)[:n]
+
+    def to_json(self, indent=2):
+        return json.dumps(
+            {"reruns": [rerun.to_dict() for rerun in self.reruns()]},
+            ensure_ascii=False, indent=indent, default=str,
+        )
+
+
+def current_rerun():
+    return getattr(_local, "atual", None)
+
+
+@contextmanager
+def span(nome, tipo="span", **atributos):
+    """
+    Cronometra o bloco no rerun ativo. Devolve o dict do span para o bloco
+    anotar atributos (ex.: s["linhas"] = n); sem rerun ativo é um dict solto.
+    """
+    rerun = getattr(_local, "atual", None)
+    if rerun is None:
+        yield atributos
+        return
+
+    registro = {"nome": nome, "tipo": tipo, "nivel": rerun._nivel}
+    registro.update(atributos)
+    rerun._nivel += 1
+    inicio = time.perf_counter()
+    try:
+        yield registro
+    except BaseException as e:
+        registro["erro"] = type(e).__name__
+        raise
+    finally:
+        fim = time.perf_counter()
+        rerun._nivel -= 1
+        registro["inicio_ms"] = round((inicio - rerun._t0) * 1000, 3)
+        registro["duracao_ms"] = round((fim - inicio) * 1000, 3)
+        rerun._add(registro)
+
+
+def traced(nome=None, tipo="span"):
+    """Decorador: a chamada inteira vira um span (nome padrão: o __qualname__ da função)."""
+    def decorador(func):
+        rotulo = nome or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(rotulo, tipo):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorador
@@ -1,8 +1,24 @@
 import streamlit as st
-import pandas as pd
 import altair as alt
+import os
+import tempfile
+import time
 from datetime import datetime
 
+from export import export_items
+from tracing import traced
+
+# Formato da tabela completa (Styler sobre o get_filtered_items)
+FORMATO_TABELA = {
+    "valor": "R$ {:.2f}",
+    "kristian_parte": "R$ {:.2f}",
+    "giulia_parte": "R$ {:.2f}",
+    "data_compra": lambda t: t.strftime('%d/%m/%Y')
+}
+
+# Arquivos de exportação esquecidos (sessão fechada antes do download) saem depois disto
+EXPORT_MAX_AGE_SECONDS = 3600
+
 # --- FUNÇÕES AUXILIARES ---
 
 def make_donut_chart(df, coluna_valor, coluna_label, tipo='azul'):
@@ -31,37 +47,87 @@ def make_donut_chart(df, coluna_valor, coluna_label, tipo='azul'):
     
     return pie + text
 
+
+def make_bar_chart(df_cat):
+    """Barras horizontais do get_spending_by_category, maior gasto no topo."""
+    return alt.Chart(df_cat).mark_bar(color='#14AAFF').encode(
+        x=alt.X('valor', title='Total (R$)'),
+        y=alt.Y('categoria', sort='-x', title=''),
+        tooltip=['categoria', alt.Tooltip('valor', format=",.2f")]
+    ).interactive()
+
+
+def make_line_chart(df_tempo):
+    """Linha do get_spending_by_date, com eixo temporal pela data da nota."""
+    return alt.Chart(df_tempo).mark_line(point=True, color='#14AAFF').encode(
+        x=alt.X('data_compra:T', title='Data da Nota', axis=alt.Axis(format="%d/%m")), # :T força entender como tempo
+        y=alt.Y('valor', title='Valor (R$)'),
+        tooltip=[alt.Tooltip('data_compra', format='%d/%m/%Y', title="Data"), alt.Tooltip('valor', format=",.2f")]
+    ).interactive()
+
+
+def _preparar_exportacao(manager, formato, filtros):
+    """
+    Gera o arquivo de exportação em disco, em blocos direto do banco (export.py),
+    e guarda o caminho no session_state. O arquivo anterior da sessão é apagado,
+    assim como os de sessões que fecharam sem baixar (mais velhos que
+    EXPORT_MAX_AGE_SECONDS).
+    """
+    anterior = st.session_state.pop("exportacao", None)
+    if anterior and os.path.exists(anterior["caminho"]):
+        os.remove(anterior["caminho"])
+    _apagar_exportacoes_antigas()
+
+    fd, caminho = tempfile.mkstemp(prefix="divcount_export_", suffix=f".{formato}")
+    with os.fdopen(fd, "wb") as arquivo:
+        linhas = export_items(manager, arquivo, formato, **filtros)
+    st.session_state["exportacao"] = {
+        "caminho": caminho, "formato": formato, "filtros": filtros, "linhas": linhas,
+    }
+
+def _apagar_exportacoes_antigas():
+    limite = time.time() - EXPORT_MAX_AGE_SECONDS
+    pasta = tempfile.gettempdir()
+    for nome in os.listdir(pasta):
+        if nome.startswith("divcount_export_"):
+            caminho = os.path.join(pasta, nome)
+            try:
+                if os.path.getmtime(caminho) < limite:
+                    os.remove(caminho)
+            except OSError:
+                pass
+
+
+def _servir_exportacao(caminho):
+    """
+    Callable para o download_button: o arquivo só é lido no clique (não a cada
+    rerun) e é apagado do disco logo depois de entregue.
+    """
+    def ler():
+        with open(caminho, "rb") as arquivo:
+            dados = arquivo.read()
+        os.remove(caminho)
+        return dados
+    return ler
+
 # --- FUNÇÃO DASHBOARD RENDER ---
 
+@traced(tipo="ui")
 def render_dashboard(manager):
-    df_compras, df_reembolsos = manager.get_financial_data()
+    # Filtros, agregações e listas vêm prontos do banco: nada aqui lê o histórico inteiro
+    opcoes = manager.get_filter_options()
     
-    if df_compras.empty:
+    if opcoes["min_data"] is None:
         st.info("📭 Nenhuma compra registrada. Comece processando uma nota na aba 'Processar Nota'.")
         return
 
     # --- INÍCIO: CÁLCULOS GLOBAIS (BALANÇO) ---
-    # Conversão de data para uso em filtros e gráficos (IMPORTANTE)
-    df_compras['data_compra'] = pd.to_datetime(df_compras['data_compra'], format='%d/%m/%Y', errors='coerce')
+    # Totais acumulados de cada participante vêm prontos do resumo_mensal
+    # (mantido a cada gravação/exclusão): consumo, pago na loja, Pix e saldo
+    resumo = manager.get_balance_summary()
 
-    # 1. Consumo Total
-    k_consumo_total = df_compras["kristian_parte"].sum()
-    g_consumo_total = df_compras["giulia_parte"].sum()
-    
-    # 2. Pagamento na Loja
-    k_pagou_loja_total = df_compras[df_compras["pagador"] == "Kristian"]["valor"].sum()
-    g_pagou_loja_total = df_compras[df_compras["pagador"] == "Giulia"]["valor"].sum()
-    
-    # 3. Pix (Reembolsos)
-    k_recebeu_pix = df_reembolsos[df_reembolsos["recebedor"] == "Kristian"]["valor"].sum() if not df_reembolsos.empty else 0.0
-    g_recebeu_pix = df_reembolsos[df_reembolsos["recebedor"] == "Giulia"]["valor"].sum() if not df_reembolsos.empty else 0.0
-    k_enviou_pix = df_reembolsos[df_reembolsos["pagador"] == "Kristian"]["valor"].sum() if not df_reembolsos.empty else 0.0
-    g_enviou_pix = df_reembolsos[df_reembolsos["pagador"] == "Giulia"]["valor"].sum() if not df_reembolsos.empty else 0.0
-
-    # 4. Cálculo do Saldo
-    k_total_desembolso = k_pagou_loja_total + k_enviou_pix
-    g_total_desembolso = g_pagou_loja_total + g_enviou_pix
-    saldo_k = (k_total_desembolso) - k_recebeu_pix - k_consumo_total
+    # Saldo > 0: o Kristian tem a receber da Giulia
+    saldo_k = resumo["Kristian"]["saldo"]
     
     # -----------------------------------------------
     # BLOCO 1: BALANÇO E QUITAÇÃO (TOPO)
@@ -101,32 +167,22 @@ def render_dashboard(manager):
     # -----------------------------------------------
     st.markdown("### 🔍 Detalhamento Financeiro (Total)")
     
-    col_k_pagou, col_g_pagou, col_k_consumiu, col_g_consumiu = st.columns(4)
-    
-    col_k_pagou.metric(
-        "Kristian Desembolsou (Loja + Pix)", 
-        f"R$ {k_total_desembolso:.2f}",
-        delta=f"Pix Enviado: R$ {k_enviou_pix:.2f} / Recebido: R$ {k_recebeu_pix:.2f}", 
-        delta_color="off"
-    )
-    col_g_pagou.metric(
-        "Giulia Desembolsou (Loja + Pix)", 
-        f"R$ {g_total_desembolso:.2f}",
-        delta=f"Pix Enviado: R$ {g_enviou_pix:.2f} / Recebido: R$ {g_recebeu_pix:.2f}", 
-        delta_color="off"
-    )
-    col_k_consumiu.metric(
-        "Kristian Consumiu (Gasto Real)", 
-        f"R$ {k_consumo_total:.2f}",
-        delta=f"Pago na Loja: R$ {k_pagou_loja_total:.2f}",
-        delta_color="off"
-    )
-    col_g_consumiu.metric(
-        "Giulia Consumiu (Gasto Real)", 
-        f"R$ {g_consumo_total:.2f}",
-        delta=f"Pago na Loja: R$ {g_pagou_loja_total:.2f}",
-        delta_color="off"
-    )
+    # Primeiro o desembolso de cada participante, depois o consumo de cada um
+    colunas = st.columns(2 * len(resumo))
+    for col, (pessoa, t) in zip(colunas, resumo.items()):
+        col.metric(
+            f"{pessoa} Desembolsou (Loja + Pix)", 
+            f"R$ {t['pago_loja'] + t['pix_enviado']:.2f}",
+            delta=f"Pix Enviado: R$ {t['pix_enviado']:.2f} / Recebido: R$ {t['pix_recebido']:.2f}", 
+            delta_color="off"
+        )
+    for col, (pessoa, t) in zip(colunas[len(resumo):], resumo.items()):
+        col.metric(
+            f"{pessoa} Consumiu (Gasto Real)", 
+            f"R$ {t['consumo']:.2f}",
+            delta=f"Pago na Loja: R$ {t['pago_loja']:.2f}",
+            delta_color="off"
+        )
 
     st.markdown("---")
     
@@ -140,34 +196,30 @@ def render_dashboard(manager):
         f_col1, f_col2, f_col3 = st.columns(3)
         
         # Filtro Data
-        min_date = df_compras['data_compra'].min().date()
-        max_date = df_compras['data_compra'].max().date()
+        min_date = opcoes["min_data"]
+        max_date = opcoes["max_data"]
         
         data_inicio, data_fim = f_col1.date_input(
             "Período", 
             value=(min_date, max_date), 
             min_value=min_date, 
-            max_value=max_date
+            max_value=max_date,
+            key="dash_periodo",
         )
         
         # Filtro Categoria
-        categorias = ["Todas"] + sorted(df_compras['categoria'].unique().tolist())
-        cat_selecionada = f_col2.selectbox("Categoria", categorias)
+        categorias = ["Todas"] + opcoes["categorias"]
+        cat_selecionada = f_col2.selectbox("Categoria", categorias, key="dash_categoria")
         
         # Filtro Loja
-        lojas = ["Todas"] + sorted(df_compras['loja'].unique().tolist())
-        loja_selecionada = f_col3.selectbox("Loja", lojas)
-
-    # Aplica Filtros
-    df_filtered = df_compras.copy()
-    df_filtered = df_filtered[
-        (df_filtered['data_compra'].dt.date >= data_inicio) & 
-        (df_filtered['data_compra'].dt.date <= data_fim)
-    ]
-    if cat_selecionada != "Todas": df_filtered = df_filtered[df_filtered['categoria'] == cat_selecionada]
-    if loja_selecionada != "Todas": df_filtered = df_filtered[df_filtered['loja'] == loja_selecionada]
+        lojas = ["Todas"] + opcoes["lojas"]
+        loja_selecionada = f_col3.selectbox("Loja", lojas, key="dash_loja")
+
+    # Aplica Filtros (no banco, via WHERE)
+    filtros = dict(data_inicio=data_inicio, data_fim=data_fim, categoria=cat_selecionada, loja=loja_selecionada)
+    df_cat = manager.get_spending_by_category(**filtros)
     
-    total_filtrado = df_filtered['valor'].sum()
+    total_filtrado = df_cat['valor'].sum()
     st.markdown(f"#### Gastos no período filtrado: **R$ {total_filtrado:.2f}**")
     
     # --- GRÁFICOS (Removido "Top Itens") ---
@@ -176,16 +228,10 @@ def render_dashboard(manager):
     # ABA 1: CATEGORIA
     with tab_cat:
         col_g1, col_g2 = st.columns(2)
-        df_cat = df_filtered.groupby("categoria")["valor"].sum().reset_index()
         
         with col_g1:
             if not df_cat.empty:
-                chart = alt.Chart(df_cat).mark_bar(color='#14AAFF').encode(
-                    x=alt.X('valor', title='Total (R$)'),
-                    y=alt.Y('categoria', sort='-x', title=''),
-                    tooltip=['categoria', alt.Tooltip('valor', format=",.2f")]
-                ).interactive()
-                st.altair_chart(chart, use_container_width=True)
+                st.altair_chart(make_bar_chart(df_cat), use_container_width=True)
             else:
                 st.warning("Sem dados para os filtros selecionados.")
                 
@@ -195,17 +241,11 @@ def render_dashboard(manager):
 
     # ABA 2: EVOLUÇÃO (Corrigido para usar a data da nota)
         with tab_tempo:
-            if not df_filtered.empty:
-                # Agrupa e ORDENA por data para a linha não ficar bagunçada
-                df_tempo = df_filtered.groupby("data_compra")["valor"].sum().reset_index().sort_values("data_compra")
-                
+            # Já vem agrupado e ORDENADO por data para a linha não ficar bagunçada
+            df_tempo = manager.get_spending_by_date(**filtros)
+            if not df_tempo.empty:
                 # Gráfico de Linha com Eixo Temporal (:T)
-                line = alt.Chart(df_tempo).mark_line(point=True, color='#14AAFF').encode(
-                    x=alt.X('data_compra:T', title='Data da Nota', axis=alt.Axis(format="%d/%m")), # :T força entender como tempo
-                    y=alt.Y('valor', title='Valor (R$)'),
-                    tooltip=[alt.Tooltip('data_compra', format='%d/%m/%Y', title="Data"), alt.Tooltip('valor', format=",.2f")]
-                ).interactive()
-                st.altair_chart(line, use_container_width=True)
+                st.altair_chart(make_line_chart(df_tempo), use_container_width=True)
             else:
                 st.warning("Sem dados.")
     
@@ -215,26 +255,35 @@ def render_dashboard(manager):
     with st.container():
         st.markdown("### 📥 Exportar Dados")
         
-        if not df_filtered.empty:
-            df_export = df_filtered[['data_compra', 'loja', 'pagador', 'item_nome', 'categoria', 'valor', 'kristian_parte', 'giulia_parte']]
-            csv = df_export.to_csv(index=False, date_format='%d/%m/%Y').encode('utf-8')
-            
-            st.download_button(
-                label="📥 Baixar Dados Filtrados (CSV)",
-                data=csv,
-                file_name='dados_filtrados_contas.csv',
-                mime='text/csv'
+        # O arquivo só é gerado quando pedido (não a cada rerun), em streaming para o disco
+        c_fmt, c_prep, c_down = st.columns([1, 1, 1.5])
+        formato = c_fmt.radio("Formato", ["csv", "parquet"], format_func=str.upper, horizontal=True)
+        if c_prep.button("📦 Preparar arquivo", use_container_width=True):
+            try:
+                _preparar_exportacao(manager, formato, filtros)
+            except RuntimeError as e:
+                st.error(str(e))
+
+        pronto = st.session_state.get("exportacao")
+        if pronto and not os.path.exists(pronto["caminho"]):
+            # Já baixado: o arquivo é entregue uma vez só
+            st.session_state.pop("exportacao")
+            pronto = None
+        if pronto and pronto["formato"] == formato and pronto["filtros"] == filtros:
+            c_down.download_button(
+                label=f"📥 Baixar Dados Filtrados ({formato.upper()}, {pronto['linhas']} itens)",
+                data=_servir_exportacao(pronto["caminho"]),
+                file_name=f'dados_filtrados_contas.{formato}',
+                mime='text/csv' if formato == "csv" else 'application/vnd.apache.parquet',
             )
 
-        with st.expander("🔎 Ver Tabela Completa (Itens Filtrados)"):
+        # Toggle e não expander: o corpo do expander roda mesmo fechado, e a
+        # tabela completa (consulta + Styler) só deve custar quando for aberta
+        if st.toggle("🔎 Ver Tabela Completa (Itens Filtrados)", key="dash_tabela"):
+            df_filtered = manager.get_filtered_items(**filtros)
             if not df_filtered.empty:
                 st.dataframe(
-                    df_filtered.drop(columns=['nota_id']).style.format({
-                        "valor": "R$ {:.2f}",
-                        "kristian_parte": "R$ {:.2f}",
-                        "giulia_parte": "R$ {:.2f}",
-                        "data_compra": lambda t: t.strftime('%d/%m/%Y')
-                    }), 
+                    df_filtered.style.format(FORMATO_TABELA), 
                     use_container_width=True, 
                     hide_index=True
                 )
@@ -1,7 +1,61 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime
 
+from tracing import traced
+
+# Tamanho das páginas do histórico (keyset no banco, nunca a tabela inteira)
+DIAS_POR_PAGINA = 20
+NOTAS_POR_PAGINA = 50
+REEMBOLSOS_POR_PAGINA = 20
+
+
+def _paginacao(chave, filtros):
+    """
+    Pilha de cursores da paginação guardada no session_state.
+    Se os filtros mudarem, volta para a primeira página.
+    """
+    estado = st.session_state.setdefault(chave, {"filtros": None, "cursores": [None]})
+    if estado["filtros"] != filtros:
+        estado["filtros"] = filtros
+        estado["cursores"] = [None]
+    return estado
+
+
+def _caixa_de_selecao(coluna, prefixo, item_id, marcados):
+    # Desenha a caixa de seleção e, se marcada, guarda o id em `marcados`: a exclusão
+    # em lote só vê o que foi desenhado neste rerun (não caixas de um dia fechado
+    # ou de outra página que ficaram marcadas no session_state)
+    if coluna.checkbox("Selecionar", key=f"{prefixo}{item_id}", label_visibility="collapsed"):
+        marcados.append(item_id)
+
+
+@traced(tipo="ui")
+def _render_notas_do_dia(db_manager, dia, loja_sel, marcadas):
+    # Notas de um dia, em páginas; "Carregar mais" busca a página seguinte
+    chave_paginas = f"paginas_dia_{dia}_{loja_sel}"
+    n_paginas = st.session_state.get(chave_paginas, 1)
+
+    cursor = None
+    for _ in range(n_paginas):
+        notas, cursor = db_manager.get_invoices_page(dia, dia, loja_sel, after=cursor, limit=NOTAS_POR_PAGINA)
+        for nota in notas:
+            c0, c1, c2 = st.columns([0.4, 4, 1])
+            _caixa_de_selecao(c0, "sel_n_", nota["id"], marcadas)
+            c1.markdown(
+                f"**{nota['loja']}** | {nota['pagador']} | **R$ {nota['total_nota']:.2f}**"
+            )
+            if c2.button("🗑️ Excluir", key=f"del_n_{nota['id']}"):
+                db_manager.delete_invoice(nota["id"])
+                st.rerun()
+        if cursor is None:
+            break
+
+    if cursor is not None and st.button("Carregar mais notas deste dia", key=f"mais_{chave_paginas}"):
+        st.session_state[chave_paginas] = n_paginas + 1
+        st.rerun()
+
+
+@traced(tipo="ui")
 def render_history_manager(db_manager):
     st.markdown("### 🗂️ Histórico Completo")
 
@@ -11,79 +65,107 @@ def render_history_manager(db_manager):
     # ABA 1: NOTAS FISCAIS
     # -------------------------------
     with tab_notas:
-        notas = db_manager.get_all_invoices()
+        # Período e lojas vêm do banco (MIN/MAX/DISTINCT), sem carregar as notas
+        opcoes = db_manager.get_filter_options()
 
-        if not notas:
+        if opcoes["min_data"] is None:
             st.info("Nenhuma nota registrada.")
         else:
-            df_notas = pd.DataFrame(notas)
-
-            # Converte data_compra para datetime (formato dd/mm/YYYY vindo do app)
-            df_notas["data_compra_dt"] = pd.to_datetime(
-                df_notas["data_compra"],
-                format="%d/%m/%Y",
-                errors="coerce",
-            )
-
             # Filtros
             st.markdown("#### 🔎 Filtros")
             col_f1, col_f2 = st.columns(2)
 
-            min_date = df_notas["data_compra_dt"].min().date()
-            max_date = df_notas["data_compra_dt"].max().date()
+            min_date = opcoes["min_data"]
+            max_date = opcoes["max_data"]
 
             data_inicio, data_fim = col_f1.date_input(
                 "Período",
                 value=(min_date, max_date),
                 min_value=min_date,
                 max_value=max_date,
+                key="hist_periodo",
             )
 
-            lojas = ["Todas"] + sorted(df_notas["loja"].unique().tolist())
-            loja_sel = col_f2.selectbox("Loja", lojas)
+            lojas = ["Todas"] + opcoes["lojas"]
+            loja_sel = col_f2.selectbox("Loja", lojas, key="hist_loja")
 
-            # Aplica filtros
-            df_filtrado = df_notas.copy()
-            df_filtrado = df_filtrado[
-                (df_filtrado["data_compra_dt"].dt.date >= data_inicio)
-                & (df_filtrado["data_compra_dt"].dt.date <= data_fim)
-            ]
-
-            if loja_sel != "Todas":
-                df_filtrado = df_filtrado[df_filtrado["loja"] == loja_sel]
+            # Aplica filtros (no banco) e busca só a página atual de dias
+            pagina = _paginacao("hist_dias", (data_inicio, data_fim, loja_sel))
+            dias, proximo = db_manager.get_invoice_days(
+                data_inicio, data_fim, loja_sel,
+                before=pagina["cursores"][-1], limit=DIAS_POR_PAGINA,
+            )
 
-            if df_filtrado.empty:
+            if not dias:
                 st.info("Nenhuma nota encontrada para os filtros selecionados.")
             else:
-                # Agrupa por data (string original) para manter visual amigável
-                for data_str in df_filtrado["data_compra"].unique():
-                    notas_dia = df_filtrado[df_filtrado["data_compra"] == data_str]
-                    with st.expander(f"📅 {data_str} ({len(notas_dia)} notas)"):
-                        for _, row in notas_dia.iterrows():
-                            c1, c2 = st.columns([4, 1])
-                            c1.markdown(
-                                f"**{row['loja']}** | {row['pagador']} | **R$ {row['total_nota']:.2f}**"
-                            )
-                            if c2.button("🗑️ Excluir", key=f"del_n_{row['id']}"):
-                                db_manager.delete_invoice(row["id"])
-                                st.rerun()
+                # Agrupa por data (dd/mm/YYYY) para manter visual amigável.
+                # As notas de um dia só são buscadas quando o dia é aberto.
+                selecionadas = []
+                for dia in dias:
+                    data_str = dia["data_compra"].strftime("%d/%m/%Y")
+                    aberto = st.toggle(
+                        f"📅 {data_str} ({dia['n_notas']} notas) | R$ {dia['total']:.2f}",
+                        key=f"dia_{dia['data_compra']}",
+                    )
+                    if aberto:
+                        with st.container(border=True):
+                            _render_notas_do_dia(db_manager, dia["data_compra"], loja_sel, selecionadas)
+
+                # Exclusão em lote: um DELETE e um rerun para todas as marcadas na tela
+                if selecionadas and st.button(
+                    f"🗑️ Excluir {len(selecionadas)} nota(s) selecionada(s)", type="primary"
+                ):
+                    apagadas = db_manager.delete_invoices(selecionadas)
+                    st.toast(f"{apagadas} nota(s) excluída(s)", icon="🗑️")
+                    st.rerun()
+
+                c_ant, c_pag, c_prox = st.columns([1, 2, 1])
+                if len(pagina["cursores"]) > 1 and c_ant.button("⬅️ Mais recentes"):
+                    pagina["cursores"].pop()
+                    st.rerun()
+                c_pag.caption(f"Página {len(pagina['cursores'])}")
+                if proximo is not None and c_prox.button("Mais antigas ➡️"):
+                    pagina["cursores"].append(proximo)
+                    st.rerun()
 
     # -------------------------------
     # ABA 2: REEMBOLSOS
     # -------------------------------
     with tab_reembolsos:
-        reembolsos = db_manager.get_all_reimbursements()
+        n_paginas = st.session_state.get("hist_reembolsos_paginas", 1)
+
+        cursor = None
+        reembolsos = []
+        for _ in range(n_paginas):
+            pagina, cursor = db_manager.get_reimbursements_page(after=cursor, limit=REEMBOLSOS_POR_PAGINA)
+            reembolsos.extend(pagina)
+            if cursor is None:
+                break
 
         if not reembolsos:
             st.info("Nenhum reembolso registrado.")
         else:
+            selecionados = []
             for r in reembolsos:
                 with st.container(border=True):
-                    c1, c2 = st.columns([4, 1])
+                    c0, c1, c2 = st.columns([0.4, 4, 1])
+                    _caixa_de_selecao(c0, "sel_r_", r["id"], selecionados)
                     c1.markdown(
                         f"💸 **{r['pagador']}** ➝ **{r['recebedor']}**: R$ {r['valor']:.2f}"
                     )
-                    c1.caption(f"Data: {r['data_pagamento']}")
+                    c1.caption(f"Data: {r['data_pagamento'].strftime('%d/%m/%Y')}")
                     if c2.button("🗑️ Excluir", key=f"del_r_{r['id']}"):
                         db_manager.delete_reimbursement(r["id"])
                         st.rerun()
+
+            if selecionados and st.button(
+                f"🗑️ Excluir {len(selecionados)} reembolso(s) selecionado(s)", type="primary"
+            ):
+                apagados = db_manager.delete_reimbursements(selecionados)
+                st.toast(f"{apagados} reembolso(s) excluído(s)", icon="🗑️")
+                st.rerun()
+
+            if cursor is not None and st.button("Carregar mais reembolsos"):
+                st.session_state["hist_reembolsos_paginas"] = n_paginas + 1
+                st.rerun()
@@ -0,0 +1,101 @@
+import streamlit as st
+import pandas as pd
+from datetime import datetime
+
+from tracing import TraceBuffer
+
+# Reruns guardados por sessão (os mais antigos saem)
+MAX_RERUNS = 20
+
+
+def get_trace_buffer():
+    # Um buffer por sessão do navegador: cada aba aberta vê só os próprios reruns
+    if "trace_buffer" not in st.session_state:
+        st.session_state["trace_buffer"] = TraceBuffer(max_reruns=MAX_RERUNS)
+    return st.session_state["trace_buffer"]
+
+
+def render_perf_panel(buffer):
+    """
+    Painel de desempenho: duração dos últimos reruns, spans mais lentos e o
+    log de consultas de um rerun, com exportação de tudo em JSON.
+    Desenhado depois das abas, com o rerun atual já fechado.
+    """
+    reruns = buffer.reruns()
+    if not reruns:
+        return
+
+    st.markdown("---")
+    st.markdown("### 🐞 Desempenho")
+
+    resumo = pd.DataFrame([
+        {
+            "rerun": r.numero,
+            "início": r.inicio.strftime("%H:%M:%S"),
+            "duração (ms)": round(r.duracao_ms, 1),
+            "consultas": sum(1 for s in r.spans if s["tipo"] == "query"),
+            "spans": len(r.spans) + r.descartados,
+        }
+        for r in reversed(reruns)
+    ])
+    st.dataframe(resumo, use_container_width=True, hide_index=True)
+
+    c_sel, c_json, c_limpar = st.columns([2, 1, 1])
+    numeros = [r.numero for r in reversed(reruns)]
+    numero = c_sel.selectbox("Rerun", numeros, index=0, key="perf_rerun")
+    c_json.download_button(
+        "📥 Exportar JSON",
+        data=buffer.to_json(),
+        file_name=f"divcount_trace_{datetime.now():%Y%m%d_%H%M%S}.json",
+        mime="application/json",
+        use_container_width=True,
+    )
+    if c_limpar.button("🧹 Limpar", use_container_width=True):
+        buffer.clear()
+        st.rerun()
+
+    rerun = next(r for r in reruns if r.numero == numero)
+    spans = rerun.to_dict()["spans"]
+
+    tab_lentos, tab_arvore, tab_consultas = st.tabs(["🐢 Mais lentos", "🌳 Linha do tempo", "🗄️ Consultas"])
+
+    with tab_lentos:
+        lentos = buffer.slowest(20)
+        if lentos:
+            st.dataframe(
+                pd.DataFrame(lentos)[["rerun", "tipo", "nome", "duracao_ms"]],
+                use_container_width=True, hide_index=True,
+            )
+
+    with tab_arvore:
+        # Spans em ordem de início, recuados pelo aninhamento
+        linhas = [
+            {
+                "início (ms)": s["inicio_ms"],
+                "span": "│ " * s["nivel"] + s["nome"],
+                "tipo": s["tipo"],
+                "duração (ms)": s["duracao_ms"],
+                "detalhes": ", ".join(
+                    f"{k}={v}" for k, v in s.items()
+                    if k not in ("nome", "tipo", "nivel", "inicio_ms", "duracao_ms", "sql")
+                ),
+            }
+            for s in spans
+        ]
+        if linhas:
+            st.dataframe(pd.DataFrame(linhas), use_container_width=True, hide_index=True)
+        if rerun.descartados:
+            st.caption(f"{rerun.descartados} spans além do limite não foram guardados.")
+
+    with tab_consultas:
+        consultas = [
+            {"início (ms)": s["inicio_ms"], "duração (ms)": s["duracao_ms"],
+             "linhas": s.get("linhas"), "sql": s.get("sql", "")}
+            for s in spans if s["tipo"] == "query"
+        ]
+        if consultas:
+            total = sum(c["duração (ms)"] for c in consultas)
+            st.caption(f"{len(consultas)} consultas, {total:.1f} ms no banco")
+            st.dataframe(pd.DataFrame(consultas), use_container_width=True, hide_index=True)
+        else:
+            st.caption("Nenhuma consulta neste rerun (tudo veio dos caches).")
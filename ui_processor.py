@@ -3,18 +3,111 @@ import pandas as pd
 import os
 from datetime import datetime
 
-from parser import InvoiceParser
+from parse_cache import ParseCache
+from preparse_worker import PreParseWorker, PENDING, PARSED, FAILED
+from save_queue import SaveQueue, RETRYING, DUPLICATE
+from upload_spool import UploadSpooler
 from core import ExpenseManager
+from tracing import span, traced
 
 # Pasta onde as notas ficam esperando
 BUFFER_DIR = "notas_pendentes"
 if not os.path.exists(BUFFER_DIR):
     os.makedirs(BUFFER_DIR)
 
+# Cache das notas já lidas (fica ao lado da fila)
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(BUFFER_DIR)), "notas_cache")
 
+# Diário da gravação em segundo plano (também ao lado da fila)
+JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(BUFFER_DIR)), "gravacoes_pendentes.db")
+
+
+@st.cache_resource
+def get_parse_cache():
+    # Uma instância por processo: sobrevive aos reruns e é compartilhada entre sessões
+    return ParseCache(CACHE_DIR)
+
+
+@st.cache_resource
+def get_preparse_worker():
+    # Lê em segundo plano tudo o que chega na fila; vive enquanto o app estiver de pé
+    return PreParseWorker(BUFFER_DIR, get_parse_cache()).start()
+
+
+@st.cache_resource
+def get_upload_spooler():
+    # Grava os uploads na fila pelo hash do conteúdo (um por processo)
+    return UploadSpooler(BUFFER_DIR)
+
+
+@st.cache_resource
+def get_save_queue(_db_manager):
+    # Um diário e uma thread de envio por processo (o _ tira o backend do hash do cache).
+    # Sobe mesmo com o modo desligado, para esvaziar o que ficou de uma execução anterior
+    return SaveQueue(JOURNAL_PATH, _db_manager).start()
+
+
+# Estado a mais na fila, marcado pela tela (o worker não consulta o banco):
+# cupom já salvo ou com a mesma chave de outro arquivo da fila
+REPEATED = "repetida"
+
+ICONES_ESTADO = {PENDING: "⏳", PARSED: "✅", FAILED: "⚠️", REPEATED: "♻️"}
+
+# Quanto o rerun espera o worker antes de ler a nota ele mesmo (pool travado,
+# processo do pool que morreu sem responder)
+WORKER_WAIT_SECONDS = 20.0
+
+
+def _render_save_queue(fila):
+    # Estado das gravações que ainda não chegaram ao banco
+    pendentes = fila.pending()
+    if not pendentes:
+        return
+    com_erro = [p for p in pendentes if p["estado"] == RETRYING]
+    duplicadas = [p for p in pendentes if p["estado"] == DUPLICATE]
+    gravando = len(pendentes) - len(duplicadas)
+    st.caption(" · ".join(
+        ([f"⏳ {gravando} nota(s) gravando em segundo plano"] if gravando else [])
+        + ([f"⚠️ {len(com_erro)} com erro (tentando de novo)"] if com_erro else [])
+        + ([f"♻️ {len(duplicadas)} duplicada(s), não gravada(s)"] if duplicadas else [])
+    ))
+    if com_erro:
+        with st.expander("⚠️ Gravações com erro", expanded=False):
+            for p in com_erro:
+                c_txt, c_btn = st.columns([5, 1])
+                c_txt.markdown(
+                    f"**{p['resumo']}** · {p['tentativas']} tentativa(s) · próxima em {p['proxima_em']:.0f}s  \n"
+                    f"`{p['erro']}`"
+                )
+                if c_btn.button("🗑️ Descartar", key=f"descartar_{p['chave']}"):
+                    fila.discard(p["chave"])
+                    st.rerun()
+            if st.button("🔁 Tentar agora", key="gravacoes_tentar"):
+                fila.retry_now()
+                st.rerun()
+    if duplicadas:
+        # Cupom que já estava no banco quando a fila chegou nele: nada foi gravado
+        with st.expander("♻️ Notas duplicadas (não gravadas)", expanded=True):
+            for p in duplicadas:
+                c_txt, c_btn = st.columns([5, 1])
+                c_txt.markdown(f"**{p['resumo']}** · {p['erro']}")
+                if c_btn.button("🗑️ Descartar", key=f"descartar_{p['chave']}"):
+                    fila.discard(p["chave"])
+                    st.rerun()
+
+
+@traced(tipo="ui")
 def render_processor(db_manager):
     st.markdown("### 📥 Central de Uploads")
 
+    fila_gravacao = get_save_queue(db_manager)
+    segundo_plano = st.toggle(
+        "⚡ Salvar em segundo plano",
+        key="write_behind",
+        help="A nota vai para um diário local e é gravada no banco por uma thread; a fila já segue para a próxima.",
+    )
+    _render_save_queue(fila_gravacao)
+
     # --- PARTE A: UPLOAD PARA A FILA ---
     with st.expander("📤 Adicionar novas notas à fila", expanded=False):
         uploaded_files = st.file_uploader(
@@ -23,41 +116,119 @@ def render_processor(db_manager):
             accept_multiple_files=True,
             key="upload_pdfs",
         )
-        if uploaded_files:
-            for f in uploaded_files:
-                save_path = os.path.join(BUFFER_DIR, f.name)
-                with open(save_path, "wb") as buffer:
-                    buffer.write(f.getbuffer())
-            st.success(f"{len(uploaded_files)} notas enviadas para a fila!")
+        # O file_uploader devolve os mesmos arquivos a cada rerun: cada upload
+        # (file_id) é gravado uma vez só; os próximos reruns nem olham os bytes.
+        # Aqui é só E/S: a chave de acesso sai do parse do worker, e as
+        # duplicadas aparecem marcadas na fila (REPEATED)
+        enviados = st.session_state.setdefault("uploads_enviados", {}) # file_id -> nome na fila
+        novos = [f for f in (uploaded_files or []) if f.file_id not in enviados]
+        if novos:
+            spooler = get_upload_spooler()
+            enviadas = 0
+            for f in novos:
+                nome, gravado = spooler.spool(f.getbuffer(), f.name)
+                enviados[f.file_id] = nome
+                if gravado:
+                    enviadas += 1
+                else:
+                    st.info(f"{f.name}: já estava na fila.")
+            if enviadas:
+                st.success(f"{enviadas} notas enviadas para a fila!")
             # NÃO usar st.rerun aqui para evitar loop; a lista de pendentes é lida logo abaixo
 
     # --- PARTE B: SELECIONAR DA FILA ---
-    pendentes = [f for f in os.listdir(BUFFER_DIR) if f.lower().endswith(".pdf")]
+    spooler = get_upload_spooler()
+    pendentes = sorted(
+        (f for f in os.listdir(BUFFER_DIR) if f.lower().endswith(".pdf")),
+        key=lambda f: (spooler.original_name(f).lower(), f),
+    )
 
     if not pendentes:
         st.info("🎉 Fila vazia! Nenhuma nota pendente.")
         return
 
+    worker = get_preparse_worker()
+    estados = {f: worker.state(f)[0] for f in pendentes}
+
+    # Duplicadas pelas chaves que o worker já leu: uma consulta no índice para a fila inteira
+    chaves = {f: worker.access_key(f) for f in pendentes if estados[f] == PARSED}
+    ja_salvas = db_manager.find_invoices_by_access_keys(list(chaves.values()))
+    primeira_com_chave = {} # chave -> primeiro arquivo da fila com ela
+    for f in pendentes:
+        chave = chaves.get(f)
+        if not chave:
+            continue
+        if chave in ja_salvas or chave in primeira_com_chave:
+            estados[f] = REPEATED
+        else:
+            primeira_com_chave[chave] = f
+
+    n_lidas = sum(1 for e in estados.values() if e == PARSED)
+    n_falhas = sum(1 for e in estados.values() if e == FAILED)
+    n_repetidas = sum(1 for e in estados.values() if e == REPEATED)
+
     st.markdown(f"#### 📋 Fila: {len(pendentes)} notas aguardando")
-    arquivo_selecionado = st.selectbox("Nota atual:", pendentes, index=0)
+    st.caption(
+        f"✅ {n_lidas} lidas · ⏳ {len(pendentes) - n_lidas - n_falhas - n_repetidas} pendentes · "
+        f"⚠️ {n_falhas} com falha · ♻️ {n_repetidas} duplicadas"
+    )
+    arquivo_selecionado = st.selectbox(
+        "Nota atual:",
+        pendentes,
+        index=0,
+        format_func=lambda f: f"{ICONES_ESTADO[estados[f]]} {spooler.original_name(f)}",
+    )
     current_file_path = os.path.join(BUFFER_DIR, arquivo_selecionado)
 
     # --- PARTE C: PROCESSAMENTO ---
-    parser = InvoiceParser(current_file_path)
+    parse_cache = get_parse_cache()
     core_manager = ExpenseManager()
 
+    # Se o worker já está lendo esta nota, espera ele em vez de ler de novo aqui;
+    # passado o limite, segue e lê aqui mesmo (parse_cache.parse logo abaixo)
+    if estados[arquivo_selecionado] == PENDING:
+        with st.spinner("Lendo nota..."):
+            worker.wait(arquivo_selecionado, timeout=WORKER_WAIT_SECONDS)
+
     try:
-        data = parser.parse()
+        # Só abre o PDF se este conteúdo ainda não foi lido pelo parser atual
+        data = parse_cache.parse(current_file_path)
     except Exception as e:
         st.error(f"Erro ao ler PDF: {e}")
         if st.button("🗑️ Deletar arquivo corrompido"):
             try:
-                os.remove(current_file_path)
+                parse_cache.invalidate(current_file_path)
+                spooler.remove(arquivo_selecionado)
             except Exception as del_e:
                 st.error(f"Erro ao deletar arquivo corrompido: {del_e}")
             st.rerun()
         return
 
+    # Cupom já salvo (inclusive depois que entrou na fila, ou por outra aba) ou
+    # repetido na fila: nada de categorizar de novo
+    chave_acesso = data.get("chave_acesso")
+    if arquivo_selecionado not in chaves:
+        # Lida agora, fora do worker: a chave ainda não passou pela consulta da fila
+        ja_salvas.update(db_manager.find_invoices_by_access_keys([chave_acesso]))
+    ja_salva = ja_salvas.get(chave_acesso)
+    original = primeira_com_chave.get(chave_acesso)
+    if ja_salva or (original and original != arquivo_selecionado):
+        if ja_salva:
+            st.warning(
+                f"Esta nota já foi salva em {ja_salva['data_compra']:%d/%m/%Y} "
+                f"({ja_salva['loja']} · R$ {float(ja_salva['total_nota']):.2f})."
+            )
+        else:
+            st.warning(f"Mesmo cupom de {spooler.original_name(original)}, que já está na fila.")
+        if st.button("🗑️ Remover da fila", key="remover_duplicada"):
+            try:
+                parse_cache.invalidate(current_file_path)
+                spooler.remove(arquivo_selecionado)
+            except Exception as e:
+                st.error(f"Erro ao deletar arquivo: {e}")
+            st.rerun()
+        return
+
     st.markdown("---")
 
     # Metadados (Data, Loja, Pagador)
@@ -95,18 +266,17 @@ def render_processor(db_manager):
         st.warning("Nenhum item identificado na nota.")
         return
 
-    # Função que usa memória + fallback (ExpenseManager)
-    def sugerir_categoria(nome_item: str) -> str:
-        if not nome_item:
-            return "Geral"
-        learned = db_manager.get_learned_category(nome_item)
-        if learned:
-            return learned
-        return core_manager.categorize_item(nome_item)
-
-    df_itens["Categoria"] = df_itens["item"].apply(
-        lambda nome: sugerir_categoria(str(nome))
-    )
+    # Memória (uma consulta para a nota inteira) + fallback (ExpenseManager)
+    with span("categorizacao", "categorizacao", itens=len(df_itens)) as s:
+        nomes_itens = [str(nome) for nome in df_itens["item"]]
+        aprendidas = db_manager.get_learned_categories([n for n in nomes_itens if n])
+
+        palpites = core_manager.categorize_many(nomes_itens)
+
+        df_itens["Categoria"] = [
+            aprendidas.get(nome) or palpite for nome, palpite in zip(nomes_itens, palpites)
+        ]
+        s["aprendidas"] = len(aprendidas)
 
     # --- FORM de edição + salvamento ---
     with st.form("form_editar_nota"):
@@ -167,20 +337,24 @@ def render_processor(db_manager):
 
             total_nota += float(valor_item)
 
-            # Regra simples: 50/50
-            valor_k = round(float(valor_item) / 2.0, 2)
-            valor_g = round(float(valor_item) - valor_k, 2)
-
             itens_processados.append(
                 {
                     "Item": nome_item,
                     "Valor (R$)": float(valor_item),
                     "Categoria": categoria_escolhida,
-                    "R$ Kristian": valor_k,
-                    "R$ Giulia": valor_g,
                 }
             )
 
+        # Divisão da nota inteira de uma vez (regras da config; padrão: partes iguais)
+        partes = core_manager.split_note(
+            [item["Valor (R$)"] for item in itens_processados],
+            [item["Categoria"] for item in itens_processados],
+        )
+        for item, cents in zip(itens_processados, partes):
+            item["Partes"] = cents
+            item["R$ Kristian"] = cents.get("Kristian", 0) / 100
+            item["R$ Giulia"] = cents.get("Giulia", 0) / 100
+
         st.markdown("---")
         col_res1, col_res2, col_res3 = st.columns(3)
         col_res1.metric("Total da Nota", f"R$ {total_nota:.2f}")
@@ -191,25 +365,42 @@ def render_processor(db_manager):
 
     # --- Pós-submit ---
     if salvar:
-        sucesso = db_manager.save_invoice(
-            data_formatada_str,
-            data.get("loja", "Loja não identificada"),
-            float(total_nota),
-            pagador_final,
-            data.get("forma_pagamento", "Indefinido"),
-            itens_processados,
-        )
+        loja = data.get("loja", "Loja não identificada")
+        if segundo_plano:
+            # Só o diário local aqui; banco e aprendizado ficam com a thread da fila
+            fila_gravacao.enqueue(
+                {
+                    "data_compra": nova_data,
+                    "loja": loja,
+                    "total_nota": float(total_nota),
+                    "pagador": pagador_final,
+                    "forma_pagamento": data.get("forma_pagamento", "Indefinido"),
+                    "itens": itens_processados,
+                    "chave_acesso": chave_acesso,
+                },
+                resumo=f"{data_formatada_str} · {loja} · R$ {total_nota:.2f}",
+            )
+            sucesso = True
+        else:
+            sucesso = db_manager.save_invoice(
+                data_formatada_str,
+                loja,
+                float(total_nota),
+                pagador_final,
+                data.get("forma_pagamento", "Indefinido"),
+                itens_processados,
+                chave_acesso=chave_acesso,
+            )
 
         if sucesso:
-            # Aprendizado: salva categorias escolhidas na memória
-            for item in itens_processados:
-                db_manager.learn_item(item["Item"], item["Categoria"])
-
-            st.toast("Nota salva com sucesso!", icon="✅")
+            # O aprendizado das categorias vai junto com a nota, na mesma transação
+            # (já feita pelo save_invoice ou feita depois pela fila de gravação)
+            st.toast("Nota na fila de gravação!" if segundo_plano else "Nota salva com sucesso!", icon="✅")
 
             # Remove o PDF da fila após salvar
             try:
-                os.remove(current_file_path)
+                parse_cache.invalidate(current_file_path)
+                spooler.remove(arquivo_selecionado)
             except Exception as e:
                 st.error(f"Erro ao deletar arquivo: {e}")
             st.rerun()
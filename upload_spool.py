@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Tuple
+
+
+class UploadSpooler:
+    """
+    Grava os uploads na fila de notas (notas_pendentes) pelo conteúdo.
+    - Nome do PDF na fila: hash SHA-256 dos bytes + ".pdf"; dois arquivos
+      com o mesmo nome original não se sobrescrevem mais, e o mesmo
+      conteúdo enviado de novo não é regravado.
+    - Escrita atômica: os bytes vão para um temporário na própria pasta e
+      só então são renomeados para o nome final (o worker de pré-leitura
+      nunca vê um PDF pela metade).
+    - O nome original fica num JSON ao lado ("<hash>.json"), para a tela.
+    """
+
+    def __init__(self, spool_dir: str, chunk_size: int = 1024 * 1024, stale_seconds: float = 3600.0) -> None:
+        self.spool_dir = spool_dir
+        self.chunk_size = chunk_size
+        # nome na fila -> nome original (o JSON é lido uma vez por processo)
+        self._names: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._drop_stale_temp(stale_seconds)
+
+    # -------------------------
+    # Gravação
+    # -------------------------
+    def spool(self, data, original_name: str) -> Tuple[str, bool]:
+        """
+        Coloca os bytes (bytes ou memoryview, ex.: UploadedFile.getbuffer())
+        na fila. Devolve (nome na fila, True se foi gravado agora ou False
+        se esse conteúdo já estava lá).
+        """
+        view = memoryview(data)
+        digest = hashlib.sha256()
+        for inicio in range(0, len(view), self.chunk_size):
+            digest.update(view[inicio:inicio + self.chunk_size])
+        file_hash = digest.hexdigest()
+        nome = f"{file_hash}.pdf"
+
+        if os.path.exists(os.path.join(self.spool_dir, nome)):
+            return nome, False
+
+        # Metadados antes do PDF: quando o PDF aparece, o nome original já está lá
+        self._write_atomic(
+            f"{file_hash}.json",
+            [json.dumps(
+                {"nome_original": original_name, "enviado_em": datetime.now().isoformat(timespec="seconds")},
+                ensure_ascii=False,
+            ).encode("utf-8")],
+        )
+        self._write_atomic(nome, (view[i:i + self.chunk_size] for i in range(0, len(view), self.chunk_size)))
+        with self._lock:
+            self._names[nome] = original_name
+        return nome, True
+
+    def _write_atomic(self, nome: str, blocos) -> None:
+        # Temporário na mesma pasta (mesmo sistema de arquivos) + os.replace
+        fd, tmp_path = tempfile.mkstemp(dir=self.spool_dir, prefix=".envio-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for bloco in blocos:
+                    f.write(bloco)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, os.path.join(self.spool_dir, nome))
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    # -------------------------
+    # Fila
+    # -------------------------
+    def original_name(self, nome: str) -> str:
+        """Nome com que o arquivo foi enviado (PDFs antigos, sem JSON, ficam com o próprio nome)."""
+        with self._lock:
+            if nome in self._names:
+                return self._names[nome]
+        original = nome
+        try:
+            with open(self._meta_path(nome), "r", encoding="utf-8") as f:
+                original = json.load(f).get("nome_original") or nome
+        except (OSError, ValueError):
+            pass
+        with self._lock:
+            self._names[nome] = original
+        return original
+
+    def remove(self, nome: str) -> None:
+        """Tira o PDF da fila (o erro de remoção sobe) e os metadados dele."""
+        os.remove(os.path.join(self.spool_dir, nome))
+        try:
+            os.remove(self._meta_path(nome))
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self._names.pop(nome, None)
+
+    def _meta_path(self, nome: str) -> str:
+        return os.path.join(self.spool_dir, os.path.splitext(nome)[0] + ".json")
+
+    def _drop_stale_temp(self, stale_seconds: float) -> None:
+        # Temporários de um envio interrompido (processo caiu no meio da escrita)
+        limite = time.time() - stale_seconds
+        for name in os.listdir(self.spool_dir):
+            if name.startswith(".envio-") and name.endswith(".tmp"):
+                path = os.path.join(self.spool_dir, name)
+                try:
+                    if os.path.getmtime(path) < limite:
+                        os.remove(path)
+                except OSError:
+                    pass